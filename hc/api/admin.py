@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.core.paginator import Paginator
 from django.db import connection
-from hc.api.models import Channel, Check, Notification, Ping
+from django.db.models import Q
+from hc.api.models import (METHOD_CODES, SCHEME_CODES, Channel, Check,
+                           Notification, Ping)
 
 
 class OwnershipListFilter(admin.SimpleListFilter):
@@ -19,6 +21,24 @@ class OwnershipListFilter(admin.SimpleListFilter):
         return queryset
 
 
+class NoisyListFilter(admin.SimpleListFilter):
+    title = "Ping rate"
+    parameter_name = 'noisy'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('coalesced', "Coalesced"),
+            ('throttled', "Throttled"),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'coalesced':
+            return queryset.filter(n_coalesced__gt=0)
+        if self.value() == 'throttled':
+            return queryset.filter(n_throttled__gt=0)
+        return queryset
+
+
 @admin.register(Check)
 class ChecksAdmin(admin.ModelAdmin):
 
@@ -29,9 +49,10 @@ class ChecksAdmin(admin.ModelAdmin):
 
     search_fields = ["name", "user__email", "code"]
     list_display = ("id", "name_tags", "created", "code", "status", "email",
-                    "last_ping", "n_pings")
+                    "last_ping", "n_pings", "n_coalesced", "n_throttled")
     list_select_related = ("user", )
-    list_filter = ("status", OwnershipListFilter, "last_ping")
+    list_filter = ("status", OwnershipListFilter, NoisyListFilter,
+                   "last_ping")
     actions = ["send_alert"]
 
     def email(self, obj):
@@ -61,11 +82,16 @@ class SchemeListFilter(admin.SimpleListFilter):
             ('http', "HTTP"),
             ('https', "HTTPS"),
             ('email', "Email"),
+            ('udp', "UDP"),
+            ('tcp', "TCP"),
         )
 
     def queryset(self, request, queryset):
         if self.value():
-            queryset = queryset.filter(scheme=self.value())
+            q = Q(scheme=self.value())
+            if self.value() in SCHEME_CODES:
+                q |= Q(scheme_code=SCHEME_CODES[self.value()])
+            queryset = queryset.filter(q)
         return queryset
 
 
@@ -79,7 +105,10 @@ class MethodListFilter(admin.SimpleListFilter):
 
     def queryset(self, request, queryset):
         if self.value():
-            queryset = queryset.filter(method=self.value())
+            q = Q(method=self.value())
+            if self.value() in METHOD_CODES:
+                q |= Q(method_code=METHOD_CODES[self.value()])
+            queryset = queryset.filter(q)
         return queryset
 
 
@@ -124,9 +153,9 @@ class LargeTablePaginator(Paginator):
 @admin.register(Ping)
 class PingsAdmin(admin.ModelAdmin):
     search_fields = ("owner__name", "owner__code", "owner__user__email")
-    list_select_related = ("owner", "owner__user")
-    list_display = ("id", "created", "check_name", "email", "scheme", "method",
-                    "ua")
+    list_select_related = ("owner", "owner__user", "user_agent")
+    list_display = ("id", "created", "check_name", "email", "scheme_name",
+                    "method_name", "ua_value")
     list_filter = ("created", SchemeListFilter, MethodListFilter)
     paginator = LargeTablePaginator
 
@@ -136,6 +165,21 @@ class PingsAdmin(admin.ModelAdmin):
     def email(self, obj):
         return obj.owner.user.email if obj.owner.user else None
 
+    def scheme_name(self, obj):
+        return obj.get_scheme()
+
+    scheme_name.short_description = "Scheme"
+
+    def method_name(self, obj):
+        return obj.get_method()
+
+    method_name.short_description = "Method"
+
+    def ua_value(self, obj):
+        return obj.get_ua()
+
+    ua_value.short_description = "UA"
+
 
 @admin.register(Channel)
 class ChannelsAdmin(admin.ModelAdmin):
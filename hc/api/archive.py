@@ -0,0 +1,315 @@
+""" Compressed columnar archive of pruned pings.
+
+With PING_ARCHIVE_DIR set, the pruning commands append the pings they are
+about to delete to the archive first. Every check gets a directory named
+after its code, and every batch of archived pings becomes one segment file
+in it, named after the first and last ping number it holds:
+
+    <PING_ARCHIVE_DIR>/<check code>/<first n>-<last n>.seg
+
+A prune batch often holds just a few pings per check, so at the end of a
+prune run `compact` merges each check's small segments into one.
+
+A segment starts with a small JSON header giving the row count and the
+position of each column. Ping numbers and timestamps (microseconds since
+the epoch) are stored as packed little-endian int64 arrays, the text fields
+as JSON lists. Each column is compressed with zlib on its own, so readers
+only decompress the columns they ask for.
+
+`read` memory-maps the segments overlapping the requested range and
+returns NumPy arrays when NumPy is installed, `array.array` otherwise.
+
+"""
+
+import array
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from datetime import datetime, timedelta as td
+
+from django.conf import settings
+from django.utils import timezone
+from hc.api.models import PING_METHODS, PING_SCHEMES, Ping
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b"HCPA"
+NUMERIC = ("n", "created")
+TEXT = ("scheme", "method", "remote_addr", "ua")
+COLUMNS = NUMERIC + TEXT
+
+# Segments spanning fewer ping numbers than this get merged by `compact`
+COMPACT_BELOW = 10000
+
+# Values to read from api_ping for archiving
+FIELDS = ("id", "owner__code", "n", "created", "scheme", "scheme_code",
+          "method", "method_code", "remote_addr", "ua", "user_agent__value")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+SCHEME_NAMES = dict(PING_SCHEMES)
+METHOD_NAMES = dict(PING_METHODS)
+
+
+def to_micros(dt):
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def from_micros(value):
+    return EPOCH + td(microseconds=int(value))
+
+
+def check_dir(code):
+    return os.path.join(settings.PING_ARCHIVE_DIR, str(code))
+
+
+def pack(values):
+    a = array.array("q", values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+
+def unpack(data):
+    if numpy is not None:
+        return numpy.frombuffer(data, dtype="<i8")
+
+    a = array.array("q")
+    a.frombytes(data)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+
+def write_segment(path, rows):
+    """ Write `rows`, a list of dicts sorted by "n", to a new segment. """
+
+    blobs = [zlib.compress(pack([row[name] for row in rows]))
+             for name in NUMERIC]
+    blobs += [zlib.compress(json.dumps([row[name] for row in rows]).encode())
+              for name in TEXT]
+
+    header = {"rows": len(rows), "columns": {}}
+    offset = 0
+    for name, blob in zip(COLUMNS, blobs):
+        header["columns"][name] = [offset, len(blob)]
+        offset += len(blob)
+
+    header = json.dumps(header).encode()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+
+
+def archive_pings(values):
+    """ Append pings to the archive. `values` are dicts with the FIELDS
+    keys, as returned by `Ping.objects.values(*FIELDS)`. Return the codes
+    of the checks which got a segment. """
+
+    by_check = {}
+    for v in values:
+        by_check.setdefault(v["owner__code"], []).append({
+            "n": v["n"],
+            "created": to_micros(v["created"]),
+            "scheme": SCHEME_NAMES.get(v["scheme_code"], v["scheme"]),
+            "method": METHOD_NAMES.get(v["method_code"], v["method"]),
+            "remote_addr": v["remote_addr"],
+            "ua": v["user_agent__value"] or v["ua"]
+        })
+
+    for code, rows in by_check.items():
+        rows.sort(key=lambda row: row["n"])
+        path = check_dir(code)
+        os.makedirs(path, exist_ok=True)
+        # Archiving the same pings again, after an interrupted prune,
+        # replaces the earlier segment
+        name = "%010d-%010d.seg" % (rows[0]["n"], rows[-1]["n"])
+        write_segment(os.path.join(path, name), rows)
+
+    return set(by_check)
+
+
+class Segment(object):
+
+    def __init__(self, path):
+        self.path = path
+        name = os.path.basename(path)[:-len(".seg")]
+        self.first, self.last = [int(part) for part in name.split("-")]
+
+    def read(self, columns, lo, hi):
+        """ Return the given columns for rows with lo <= n < hi. """
+
+        with open(self.path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                assert mm[:4] == MAGIC, "Not a ping archive: %s" % self.path
+                size = struct.unpack("<I", mm[4:8])[0]
+                header = json.loads(mm[8:8 + size].decode())
+                base = 8 + size
+
+                def column(name):
+                    offset, length = header["columns"][name]
+                    start = base + offset
+                    data = zlib.decompress(mm[start:start + length])
+                    if name in NUMERIC:
+                        return unpack(data)
+                    return json.loads(data.decode())
+
+                n = column("n")
+                start = bisect.bisect_left(n, lo)
+                stop = bisect.bisect_left(n, hi)
+                return {name: (n if name == "n" else column(name))[start:stop]
+                        for name in columns}
+            finally:
+                mm.close()
+
+
+def segments(code):
+    """ Return the segments of a check, by first ping number. """
+
+    if not settings.PING_ARCHIVE_DIR:
+        return []
+
+    path = check_dir(code)
+    if not os.path.isdir(path):
+        return []
+
+    found = [Segment(os.path.join(path, name))
+             for name in os.listdir(path) if name.endswith(".seg")]
+    return sorted(found, key=lambda s: s.first)
+
+
+def compact(code):
+    """ Merge the small segments of check `code` into one segment. Return
+    the number of segments merged. """
+
+    small = [segment for segment in segments(code)
+             if segment.last - segment.first < COMPACT_BELOW]
+    if len(small) < 2:
+        return 0
+
+    rows = {}
+    for segment in small:
+        columns = segment.read(COLUMNS, 0, 2 ** 62)
+        for i in range(len(columns["n"])):
+            row = {name: columns[name][i] for name in COLUMNS}
+            row["n"], row["created"] = int(row["n"]), int(row["created"])
+            rows[row["n"]] = row
+
+    rows = [rows[n] for n in sorted(rows)]
+    name = "%010d-%010d.seg" % (rows[0]["n"], rows[-1]["n"])
+    path = os.path.join(check_dir(code), name)
+    # Readers skip the repeated pings until the parts are gone
+    write_segment(path, rows)
+    for segment in small:
+        if segment.path != path:
+            try:
+                os.remove(segment.path)
+            except FileNotFoundError:
+                # Another prune run compacting the same check
+                pass
+
+    return len(small)
+
+
+def concat(parts, numeric):
+    if numeric and numpy is not None:
+        if not parts:
+            return numpy.zeros(0, dtype="<i8")
+        return numpy.concatenate(parts)
+
+    out = array.array("q") if numeric else []
+    for part in parts:
+        out.extend(part)
+    return out
+
+
+def take(values, indexes, numeric):
+    if numeric and numpy is not None:
+        return values[indexes]
+    if numeric:
+        return array.array("q", (values[i] for i in indexes))
+    return [values[i] for i in indexes]
+
+
+def read(code, lo=0, hi=2 ** 62, columns=COLUMNS):
+    """ Load archived pings of check `code` with lo <= n < hi.
+
+    Return a dict of columns, in ping number order. "n" and "created" are
+    int64 arrays, the others lists of strings.
+
+    """
+
+    columns = tuple(columns)
+    wanted = columns if "n" in columns else ("n", ) + columns
+    parts = {name: [] for name in wanted}
+    last, overlap = None, False
+    for segment in segments(code):
+        if segment.last < lo or segment.first >= hi:
+            continue
+
+        if last is not None and segment.first <= last:
+            overlap = True
+        last = max(last or 0, segment.last)
+
+        for name, values in segment.read(wanted, lo, hi).items():
+            parts[name].append(values)
+
+    result = {name: concat(parts[name], name in NUMERIC) for name in wanted}
+
+    if overlap:
+        # Segments written by parallel or repeated prunes can interleave
+        # and repeat pings: sort by n and keep one row per n
+        n = result["n"]
+        indexes, seen = [], set()
+        for i in sorted(range(len(n)), key=n.__getitem__):
+            if n[i] not in seen:
+                seen.add(n[i])
+                indexes.append(i)
+        result = {name: take(values, indexes, name in NUMERIC)
+                  for name, values in result.items()}
+
+    return {name: result[name] for name in columns}
+
+
+def has_pings(code, hi):
+    """ Is anything archived for check `code` below ping number `hi`? """
+
+    return any(segment.first < hi for segment in segments(code))
+
+
+def load_pings(code, hi, limit):
+    """ Return up to `limit` archived pings of check `code` with n < hi,
+    newest first, as unsaved Ping objects. """
+
+    # Only read the newest segments which can hold `limit` pings
+    lo, room = 0, 0
+    for segment in sorted(segments(code), key=lambda s: -s.last):
+        if segment.first < hi and room < limit:
+            room += min(segment.last, hi - 1) - segment.first + 1
+            lo = segment.first
+
+    columns = read(code, lo=lo, hi=hi)
+    pings = []
+    for i in range(len(columns["n"]) - 1, -1, -1):
+        if len(pings) == limit:
+            break
+
+        pings.append(Ping(n=int(columns["n"][i]),
+                          created=from_micros(columns["created"][i]),
+                          scheme=columns["scheme"][i],
+                          method=columns["method"][i],
+                          remote_addr=columns["remote_addr"][i],
+                          ua=columns["ua"][i]))
+
+    return pings
@@ -0,0 +1,162 @@
+import asyncio
+import io
+import re
+import sys
+
+from django.db import close_old_connections
+from django.http import HttpRequest
+from hc.api import views
+
+# Requests served straight from the event loop: (path, method, view).
+# The view gets called without Django's middleware and URL resolver.
+ROUTES = [
+    (re.compile(r"^/ping/([\w-]+)/?$"), None, views.ping),
+    (re.compile(r"^/api/v1/checks/$"), "GET", views.checks),
+    (re.compile(r"^/badge/([\w-]+)/([\w-]{8})/([\w-]+).svg$"), "GET",
+     views.badge),
+]
+
+
+def make_environ(scope, body):
+    """ Translate an ASGI HTTP scope into a WSGI environ. """
+
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/%s" % scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+
+        if name in environ:
+            environ[name] += "," + value
+        else:
+            environ[name] = value
+
+    return environ
+
+
+def make_request(environ, body):
+    request = HttpRequest()
+    request.method = environ["REQUEST_METHOD"]
+    request.path = request.path_info = environ["PATH_INFO"]
+    request.META = environ
+    request._body = body
+    return request
+
+
+def call_view(view, request, args):
+    # Same connection housekeeping as Django's request_started and
+    # request_finished signal handlers
+    close_old_connections()
+    try:
+        response = view(request, *args)
+        return response.status_code, list(response.items()), response.content
+    finally:
+        close_old_connections()
+
+
+def call_wsgi(application, environ):
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(" ")[0]), headers]
+
+    result = application(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+    return started[0], started[1], body
+
+
+class AsgiApplication(object):
+    """ ASGI application for ping traffic.
+
+    Pings and the read-only API are dispatched from the event loop, and
+    their database work runs on `executor`, a bounded thread pool. Open
+    connections waiting on the network don't hold a thread. Other
+    requests are passed to `wsgi_application`, also on `executor`.
+
+    """
+
+    def __init__(self, wsgi_application, executor):
+        self.wsgi_application = wsgi_application
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.http(scope, receive, send)
+        else:
+            raise NotImplementedError("Unsupported scope: %s" % scope["type"])
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def http(self, scope, receive, send):
+        body = await read_body(receive)
+        environ = make_environ(scope, body)
+        loop = asyncio.get_event_loop()
+
+        for path, method, view in ROUTES:
+            match = path.match(scope["path"])
+            if match and method in (None, scope["method"]):
+                request = make_request(environ, body)
+                job = (call_view, view, request, match.groups())
+                break
+        else:
+            job = (call_wsgi, self.wsgi_application, environ)
+
+        status, headers, content = await loop.run_in_executor(
+            self.executor, *job)
+
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(k.encode("latin1"), v.encode("latin1"))
+                        for k, v in headers]
+        })
+        await send({"type": "http.response.body", "body": content})
+
+
+async def read_body(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+    return body
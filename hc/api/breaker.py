@@ -0,0 +1,124 @@
+""" Circuit breakers for notification endpoints.
+
+When a webhook host goes dark, every alert for it would wait out the 5
+second timeout, three times. `circuits` counts consecutive failed requests
+per key: the host for webhooks, the channel for the notification providers
+(see HttpTransport.breaker_key), whose hosts are shared by all of their
+accounts. After CIRCUIT_BREAKER_THRESHOLD failures the key's breaker
+opens, and requests fail at once with the "Circuit open" error, which is
+recorded like any other. Every CIRCUIT_BREAKER_COOLDOWN seconds a single
+request is let through as a probe (the breaker is "half-open" meanwhile).
+A successful request closes the breaker, a failed probe keeps it open for
+another cooldown.
+
+Timeouts, connection errors and 5xx responses count as failures. Other
+error statuses mean the host is up, and count as successes.
+
+The breakers are per process, shared by all sendalerts threads and by the
+async delivery engine. Their states are reported in hc.api.metrics.
+
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from hc.api import metrics
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+CIRCUIT_OPEN = "Circuit open"
+
+
+def failed(error):
+    """ Does this transport error mean the endpoint is unreachable? """
+
+    if error in ("Connection timed out", "Connection failed"):
+        return True
+    return (error or "").startswith("Received status code 5")
+
+
+class Breaker(object):
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        # When it last opened, or let a probe through
+        self.since = 0
+
+
+class Circuits(object):
+    """ Breakers by key. Only keys with recent failures have one. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.breakers = {}
+
+    def allow(self, key):
+        """ Return True if a request to `key` may go ahead. """
+
+        if settings.CIRCUIT_BREAKER_THRESHOLD is None:
+            return True
+
+        cooldown = settings.CIRCUIT_BREAKER_COOLDOWN
+        with self.lock:
+            breaker = self.breakers.get(key)
+            if breaker is None or breaker.state == CLOSED:
+                return True
+
+            now = time.time()
+            if now >= breaker.since + cooldown:
+                # Probe, others keep failing fast until it reports back
+                breaker.state, breaker.since = HALF_OPEN, now
+                self.report()
+                return True
+
+        metrics.CIRCUIT_REJECTIONS.inc()
+        return False
+
+    def record(self, key, error):
+        """ Record the outcome of a request to `key`. """
+
+        threshold = settings.CIRCUIT_BREAKER_THRESHOLD
+        if threshold is None:
+            return
+
+        with self.lock:
+            breaker = self.breakers.get(key)
+            if not failed(error):
+                if breaker is not None:
+                    del self.breakers[key]
+                    self.report()
+                return
+
+            if breaker is None:
+                breaker = self.breakers[key] = Breaker()
+
+            breaker.failures += 1
+            if breaker.state == HALF_OPEN or breaker.failures >= threshold:
+                if breaker.state == CLOSED:
+                    metrics.CIRCUIT_TRIPS.inc()
+                breaker.state, breaker.since = OPEN, time.time()
+                self.report()
+
+    def state(self, key):
+        with self.lock:
+            breaker = self.breakers.get(key)
+            return CLOSED if breaker is None else breaker.state
+
+    def report(self):
+        counts = {OPEN: 0, HALF_OPEN: 0}
+        for breaker in self.breakers.values():
+            if breaker.state in counts:
+                counts[breaker.state] += 1
+
+        for state, count in counts.items():
+            metrics.CIRCUITS.set(count, state=state)
+
+    def clear(self):
+        with self.lock:
+            self.breakers.clear()
+            self.report()
+
+
+circuits = Circuits()
@@ -0,0 +1,85 @@
+""" In-process cache of check lookups by ping code.
+
+The ping path looks checks up by their `code` UUID on every request. This
+cache maps code to a few columns of the check, so a cached ping can update
+its row by primary key. Entries are dropped when a Check is saved or
+deleted in this process, and expire after CHECK_CACHE_TTL seconds to bound
+staleness from writes made by other processes.
+
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+CachedCheck = namedtuple("CachedCheck",
+                         "id user_id status timeout grace last_ping")
+
+
+class CheckCache(object):
+    """ Bounded LRU cache with a per-entry time to live. """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, code):
+        code = str(code)
+        with self.lock:
+            item = self.entries.get(code)
+            if item is None or item[0] < time.time():
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(code)
+            self.hits += 1
+            return item[1]
+
+    def put(self, code, entry):
+        if self.size == 0:
+            return
+
+        code = str(code)
+        with self.lock:
+            self.entries[code] = (time.time() + self.ttl, entry)
+            self.entries.move_to_end(code)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, code):
+        with self.lock:
+            self.entries.pop(str(code), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits, self.misses = 0, 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.entries)
+            }
+
+    def warm(self):
+        """ Load the most recently pinged checks. """
+
+        from hc.api.models import Check
+
+        q = Check.objects.filter(last_ping__isnull=False)
+        q = q.order_by("-last_ping")[:self.size]
+        fields = ("code", ) + CachedCheck._fields
+        # Oldest first, so the most recent checks are the last to be evicted
+        for row in reversed(list(q.values_list(*fields))):
+            self.put(row[0], CachedCheck(*row[1:]))
+
+
+check_cache = CheckCache(settings.CHECK_CACHE_SIZE, settings.CHECK_CACHE_TTL)
@@ -0,0 +1,200 @@
+""" Per-check ping coalescing and rate limiting.
+
+A client stuck in a loop can ping the same check many times a second. With
+PING_COALESCE_WINDOW set, only the first ping for a check in each window is
+recorded as usual. The rest are counted in memory, and a background thread
+adds them to the check's `n_pings` and `n_coalesced` with one aggregate
+UPDATE per check and window. Coalesced pings don't get `Ping` rows and
+don't change the check's status.
+
+With PING_RATE_LIMIT set, pings beyond that many per second for a check
+are rejected and counted in the check's `n_throttled`.
+
+Only codes which matched a check get tracked, so pings for unknown codes
+always get looked up and rejected as such, and never take up memory.
+
+Counts which fail to get written stay in memory for the next flush, and
+whatever is left gets written out at exit.
+
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import DateTimeField, F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+RECORD, COALESCED, THROTTLED = "record", "coalesced", "throttled"
+
+# Entries idle for this many seconds are dropped
+IDLE_TIMEOUT = 60
+
+
+class Entry(object):
+    __slots__ = ("recorded", "second", "n_second", "pending", "pending_last",
+                 "throttled", "seen")
+
+    def __init__(self):
+        self.recorded = 0.0
+        self.second = 0
+        self.n_second = 0
+        self.pending = 0
+        self.pending_last = None
+        self.throttled = 0
+        self.seen = 0.0
+
+
+class PingCoalescer(object):
+    """ Tracks recent pings by check code.
+
+    `window` is in seconds, 0 disables coalescing. `rate_limit` is the
+    maximum number of pings per check and second, 0 disables the limit.
+
+    """
+
+    def __init__(self, window, rate_limit):
+        self.window = window
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.entries = {}
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="ping-coalescer")
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            time.sleep(max(self.window, 1))
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not flush coalesced pings")
+                # Reconnect on the next attempt
+                connection.close()
+
+    def hit(self, code):
+        """ Count a ping for `code`. Return RECORD if the caller should
+        record it, COALESCED or THROTTLED if it has been taken care of.
+        After recording a ping for a code not tracked yet, the caller
+        should call `add`. """
+
+        code, now = str(code), time.time()
+        with self.lock:
+            entry = self.entries.get(code)
+            if entry is None:
+                return RECORD
+
+            entry.seen = now
+            if self.rate_limit:
+                if int(now) != entry.second:
+                    entry.second, entry.n_second = int(now), 0
+                if entry.n_second >= self.rate_limit:
+                    entry.throttled += 1
+                    return THROTTLED
+                entry.n_second += 1
+
+            if now - entry.recorded < self.window:
+                entry.pending += 1
+                entry.pending_last = timezone.now()
+                return COALESCED
+
+            entry.recorded = now
+            return RECORD
+
+    def add(self, code):
+        """ Start tracking a code whose ping just got recorded, counting
+        that ping. Does nothing for codes already tracked. """
+
+        code, now = str(code), time.time()
+        with self.lock:
+            if code not in self.entries:
+                entry = self.entries[code] = Entry()
+                entry.seen, entry.recorded = now, now
+                entry.second, entry.n_second = int(now), 1
+
+    def forget(self, code):
+        """ Drop the entry for a code which no longer matches a check,
+        so that its next ping doesn't get coalesced. """
+
+        with self.lock:
+            self.entries.pop(str(code), None)
+
+    def flush(self):
+        """ Write out the counted pings. Return the number of checks
+        updated. """
+
+        from hc.api.models import Check
+
+        with self.flush_lock:
+            now = time.time()
+            updates = []
+            with self.lock:
+                for code, entry in list(self.entries.items()):
+                    if entry.pending or entry.throttled:
+                        updates.append((code, entry.pending,
+                                        entry.pending_last, entry.throttled))
+                        entry.pending, entry.throttled = 0, 0
+                    elif now - entry.seen > IDLE_TIMEOUT:
+                        del self.entries[code]
+
+            for i, update in enumerate(updates):
+                code, pending, pending_last, throttled = update
+                fields = {"n_throttled": F("n_throttled") + throttled}
+                if pending:
+                    fields["n_pings"] = F("n_pings") + pending
+                    fields["n_coalesced"] = F("n_coalesced") + pending
+                    last = Value(pending_last, output_field=DateTimeField())
+                    fields["last_ping"] = Greatest("last_ping", last)
+
+                try:
+                    Check.objects.filter(code=code).update(**fields)
+                except Exception:
+                    self.restore(updates[i:])
+                    raise
+
+            return len(updates)
+
+    def restore(self, updates):
+        """ Add counts which could not be written back to their entries,
+        for the next flush. """
+
+        with self.lock:
+            for code, pending, pending_last, throttled in updates:
+                entry = self.entries.get(code)
+                if entry is None:
+                    entry = self.entries[code] = Entry()
+
+                entry.pending += pending
+                entry.throttled += throttled
+                if pending and (entry.pending_last is None or
+                                entry.pending_last < pending_last):
+                    entry.pending_last = pending_last
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer():
+    """ Return this process's PingCoalescer, starting it on first use. """
+
+    global _coalescer
+
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = PingCoalescer(settings.PING_COALESCE_WINDOW / 1000.0,
+                                       settings.PING_RATE_LIMIT)
+            _coalescer.start()
+
+    return _coalescer
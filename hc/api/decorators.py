@@ -76,6 +76,11 @@ def validate_json(schema):
                         return make_error("%s is too small" % key)
                     if "maximum" in spec and value > spec["maximum"]:
                         return make_error("%s is too large" % key)
+                elif spec["type"] == "array":
+                    if not isinstance(value, list):
+                        return make_error("%s is not an array" % key)
+                    if "maxItems" in spec and len(value) > spec["maxItems"]:
+                        return make_error("%s has too many items" % key)
 
             return f(request, *args, **kwds)
         return wrapper
@@ -0,0 +1,240 @@
+""" Concurrent alert delivery on an asyncio event loop.
+
+`Check.send_alert` notifies a check's channels one after another, and
+sendalerts runs it for at most 10 checks at a time. During a big outage
+that leaves most alerts waiting on a few slow webhooks. `DeliveryEngine`
+instead builds the requests of all `HttpTransport` channels of all due
+checks up front (see `HttpTransport.prepare`), and sends them all at once
+from one event loop, with at most `per_host` requests in flight to each
+host. Every alert gets `deadline` seconds for all of its attempts. Other
+transports (email, SMS) keep their blocking clients and run in `executor`.
+
+Errors are recorded as `Notification` rows, same as `Channel.notify`.
+
+"""
+
+import asyncio
+import ssl
+from urllib.parse import urljoin, urlsplit
+
+from django.db import connection
+from hc.api import metrics
+from hc.api.breaker import CIRCUIT_OPEN, circuits
+from hc.api.transports import HttpTransport
+
+# Attempts per alert, same as Channel.notify
+ATTEMPTS = 3
+
+# Seconds per attempt, same as HttpTransport.request
+TIMEOUT = 5
+
+# Redirects to follow, same as requests
+REDIRECTS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 30
+
+_ssl_context = None
+
+
+def ssl_context():
+    global _ssl_context
+
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+async def fetch(prepared):
+    """ Send a requests.PreparedRequest, return the response's status
+    code and Location header. Doesn't read the body. """
+
+    url = urlsplit(prepared.url)
+    https = url.scheme == "https"
+    port = url.port or (443 if https else 80)
+    path = url.path or "/"
+    if url.query:
+        path += "?" + url.query
+
+    reader, writer = await asyncio.open_connection(
+        url.hostname, port, ssl=ssl_context() if https else None)
+
+    try:
+        body = prepared.body or b""
+        if isinstance(body, str):
+            body = body.encode()
+
+        headers = dict(prepared.headers)
+        headers["Host"] = url.hostname if url.port is None else \
+            "%s:%d" % (url.hostname, url.port)
+        headers["Connection"] = "close"
+        headers["Content-Length"] = str(len(body))
+
+        lines = ["%s %s HTTP/1.1" % (prepared.method, path)]
+        lines += ["%s: %s" % item for item in headers.items()]
+        head = "\r\n".join(lines) + "\r\n\r\n"
+        writer.write(head.encode("latin-1") + body)
+
+        status_line = await reader.readline()
+        location = None
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "location":
+                location = value.strip()
+
+        return int(status_line.split()[1]), location
+    finally:
+        writer.close()
+
+
+def redirected(prepared, status, location):
+    """ Return the request to send next after a redirect, rebuilt the way
+    requests rebuilds it. """
+
+    url = urljoin(prepared.url, location)
+    result = prepared.copy()
+    result.prepare_url(url, None)
+
+    if status in (302, 303) and prepared.method != "HEAD" or \
+            status == 301 and prepared.method == "POST":
+        result.method = "GET"
+        result.body = None
+        result.headers.pop("Content-Type", None)
+        result.headers.pop("Content-Length", None)
+
+    if urlsplit(url).hostname != urlsplit(prepared.url).hostname:
+        result.headers.pop("Authorization", None)
+
+    return result
+
+
+async def follow(prepared):
+    """ Send a request and follow its redirects, return the final status
+    code. """
+
+    for i in range(MAX_REDIRECTS + 1):
+        status, location = await fetch(prepared)
+        if status not in REDIRECTS or not location:
+            return status
+
+        prepared = redirected(prepared, status, location)
+
+    raise ValueError("Too many redirects")
+
+
+async def attempt(prepared, timeout):
+    """ Send a request once, return the error message like
+    HttpTransport.request does, or "" on success. """
+
+    try:
+        status = await asyncio.wait_for(follow(prepared), timeout)
+    except asyncio.TimeoutError:
+        return "Connection timed out"
+    except (OSError, ValueError, IndexError):
+        return "Connection failed"
+
+    if status not in (200, 201, 204):
+        return "Received status code %d" % status
+
+    return ""
+
+
+def notify_blocking(channel, check):
+    """ Notify through a non-HTTP channel in an executor thread. """
+
+    try:
+        return channel.notify(check)
+    finally:
+        connection.close()
+
+
+class DeliveryEngine(object):
+
+    def __init__(self, executor, per_host=10, deadline=30):
+        self.executor = executor
+        self.per_host = per_host
+        self.deadline = deadline
+        self.loop = asyncio.new_event_loop()
+        self.limits = {}
+
+    def limit(self, prepared):
+        url = urlsplit(prepared.url)
+        key = (url.hostname, url.port)
+        if key not in self.limits:
+            self.limits[key] = asyncio.Semaphore(self.per_host)
+        return self.limits[key]
+
+    async def post(self, prepared, deadline, kind, key):
+        start = self.loop.time()
+        error = "Delivery deadline exceeded"
+        for i in range(ATTEMPTS):
+            async with self.limit(prepared):
+                remaining = deadline - self.loop.time()
+                if remaining <= 0:
+                    break
+
+                if not circuits.allow(key):
+                    error = CIRCUIT_OPEN
+                    break
+
+                error = await attempt(prepared, min(TIMEOUT, remaining))
+                circuits.record(key, error)
+                if not error:
+                    break
+
+        metrics.DELIVERY.observe(self.loop.time() - start, transport=kind)
+        return error
+
+    async def deliver(self, pairs):
+        deadline = self.loop.time() + self.deadline
+
+        tasks, http = [], []
+        for check, channel in pairs:
+            transport = channel.transport
+            if isinstance(transport, HttpTransport):
+                prepared = transport.prepare(check)
+                if isinstance(prepared, str) or prepared is None:
+                    # notify() gave up before making a request
+                    tasks.append(self.done(prepared or ""))
+                else:
+                    key = transport.breaker_key(prepared.url)
+                    tasks.append(self.post(prepared, deadline, channel.kind,
+                                           key))
+                http.append(True)
+            else:
+                tasks.append(self.loop.run_in_executor(
+                    self.executor, notify_blocking, channel, check))
+                http.append(False)
+
+        errors = await asyncio.gather(*tasks)
+        return list(zip(pairs, errors, http))
+
+    async def done(self, result):
+        return result
+
+    def send(self, checks):
+        """ Send alerts for all channels of all `checks`. Return the
+        failed ones as (channel, error) pairs, like Check.send_alert. """
+
+        pairs = [(check, channel)
+                 for check in checks for channel in check.channel_set.all()]
+        return self.send_pairs(pairs)
+
+    def send_pairs(self, pairs):
+        """ Send alerts for the given (check, channel) pairs. Return the
+        failed ones as (channel, error) pairs. """
+
+        failed = []
+        results = self.loop.run_until_complete(self.deliver(pairs))
+        for (check, channel), error, http in results:
+            error = error or ""
+            if http and error != "no-op":
+                channel.save_notification(check, error)
+            if error not in ("", "no-op"):
+                failed.append((channel, error))
+                if http:
+                    # Channel.notify counts the others
+                    metrics.DELIVERY_ERRORS.inc(transport=channel.kind)
+
+        return failed
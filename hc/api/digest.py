@@ -0,0 +1,124 @@
+""" Alert digests for mass outages.
+
+When a network partition takes down hundreds of one user's checks at
+once, alerting about each of them separately floods the user's channels,
+our SMTP relay and the providers. `Digester` watches how many checks of
+each user go down. Once more than `threshold` have gone down within
+`window` seconds, it holds back the rest of that user's down checks of the
+tick, and `send_digest` notifies each of their channels once about all of
+them. Email channels sending to the same address get one message between
+them.
+
+Webhooks, PagerDuty and VictorOps address every check separately (URL
+placeholders, incident keys). `send_digest` hands these back, and
+sendalerts sends them like any other alert. Either way, every check gets
+its own `Notification` row on every channel.
+
+The counts are kept per process, so with several sendalerts processes
+each one applies the threshold to the checks it handles.
+
+"""
+
+from collections import deque
+
+from hc.api.models import Channel
+
+
+class Digester(object):
+
+    def __init__(self, threshold, window):
+        self.threshold = threshold
+        self.window = window
+        # User id -> times at which its checks went down
+        self.recent = {}
+
+    def split(self, checks, now):
+        """ Return (digests, rest). `digests` is a list of lists of down
+        checks, one list per user, to be sent with `send_digest`. `rest`
+        are the checks to alert about one at a time. """
+
+        # Forget what happened before the window
+        cutoff = now - self.window
+        for user_id in list(self.recent):
+            times = self.recent[user_id]
+            while times and times[0] <= cutoff:
+                times.popleft()
+            if not times:
+                del self.recent[user_id]
+
+        by_user, rest = {}, []
+        for check in checks:
+            if check.status == "down":
+                by_user.setdefault(check.user_id, []).append(check)
+            else:
+                rest.append(check)
+
+        digests = []
+        for user_id, group in by_user.items():
+            times = self.recent.setdefault(user_id, deque())
+            times.extend([now] * len(group))
+            if len(times) > self.threshold and len(group) > 1:
+                digests.append(group)
+            else:
+                rest.extend(group)
+
+        return digests, rest
+
+
+def send_digest(checks):
+    """ Notify the channels of `checks` about all of them at once, where
+    the transport allows.
+
+    Return (errors, rest). `errors` are the failed channels as (channel,
+    error) pairs, like Check.send_alert. `rest` are (check, channel) pairs
+    for channels which can't take digests, still to be notified.
+
+    """
+
+    by_id = {check.id: check for check in checks}
+    q = Channel.checks.through.objects.filter(check_id__in=list(by_id))
+    q = q.select_related("channel", "channel__user").order_by("id")
+
+    # Channels receiving the same message -> their checks
+    groups = {}
+    for link in q:
+        channel = link.channel
+        key = channel.id
+        if channel.kind == "email" and channel.email_verified:
+            # Unverified ones get their own "Email not verified" errors
+            key = channel.value.lower()
+
+        channels = groups.setdefault(key, {})
+        channels.setdefault(channel, []).append(by_id[link.check_id])
+
+    errors, rest = [], []
+    for channels in groups.values():
+        first = next(iter(channels))
+        if not first.transport.digests:
+            rest.extend((check, first) for check in channels[first])
+            continue
+
+        everything, seen = [], set()
+        for channel_checks in channels.values():
+            for check in channel_checks:
+                if check.id not in seen:
+                    seen.add(check.id)
+                    everything.append(check)
+
+        if len(everything) == 1:
+            error = first.notify(everything[0])
+        else:
+            error = first.deliver(
+                channels[first],
+                lambda: first.transport.notify_digest(everything))
+
+        # The other channels with the same address
+        for channel, channel_checks in channels.items():
+            if channel is not first and error != "no-op":
+                for check in channel_checks:
+                    channel.save_notification(check, error)
+
+        if error not in ("", "no-op"):
+            errors.append((first, error))
+
+    return errors, rest
@@ -0,0 +1,72 @@
+""" Leader election between processes, through database locks.
+
+Several hosts can run the same management command, with duties which
+must only happen once (e.g. `sendreports --loop`) done by whichever
+process holds the lock. On PostgreSQL this is a session-level advisory
+lock, on MySQL a named lock, each held on a dedicated connection so that
+closing the regular connection doesn't give it up. If the leader's
+connection dies, the database releases the lock and another process takes
+over on its next attempt. SQLite can't be shared between hosts, so there
+every process is the leader.
+
+"""
+
+import zlib
+
+from django.db import connection
+
+
+class Leadership(object):
+
+    def __init__(self, name):
+        self.name = name
+        # Advisory lock keys are integers
+        self.key = zlib.crc32(name.encode())
+        self.conn = None
+        self.is_leader = False
+
+    def connect(self):
+        if self.conn is None:
+            params = connection.get_connection_params()
+            self.conn = connection.get_new_connection(params)
+            # Don't sit idle in a transaction while holding the lock
+            if connection.vendor == "postgresql":
+                self.conn.autocommit = True
+            else:
+                self.conn.autocommit(True)
+
+        return self.conn
+
+    def try_acquire(self):
+        """ Return True if this process is, or just became, the leader. """
+
+        if connection.vendor == "postgresql":
+            sql, params = "SELECT pg_try_advisory_lock(%s)", [self.key]
+        elif connection.vendor == "mysql":
+            sql, params = "SELECT GET_LOCK(%s, 0)", [self.name]
+        else:
+            return True
+
+        # Both locks are reentrant, once we hold one we only need to
+        # know the connection is still there
+        if self.is_leader:
+            sql, params = "SELECT 1", []
+
+        try:
+            cursor = self.connect().cursor()
+            cursor.execute(sql, params)
+            self.is_leader = bool(cursor.fetchone()[0])
+        except Exception:
+            # Lost the connection, and with it any lock we had
+            self.close()
+
+        return self.is_leader
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+        self.is_leader = False
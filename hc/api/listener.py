@@ -0,0 +1,101 @@
+""" UDP and TCP ping listeners.
+
+Both take check codes as plain text: a UDP datagram or a TCP connection
+carries one or more UUIDs, separated by newlines. Pings are queued in a
+`PingBatcher` and recorded in batches, so the event loop never waits on
+the database.
+
+Over TCP, each line gets a reply: "OK" if the line is a valid UUID and
+the ping has been queued, "ERR" otherwise. UDP senders get no reply.
+
+"""
+
+import asyncio
+import uuid
+
+from hc.api.models import Ping
+
+# Longest line a TCP client may send. A UUID with dashes is 36 characters.
+MAX_LINE = 100
+
+
+def parse_code(line):
+    """ Return the UUID in `line`, or None if it doesn't contain one. """
+
+    try:
+        return uuid.UUID(line.strip().decode("ascii"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def make_ping(scheme, peername):
+    ping = Ping(scheme=scheme)
+    if peername:
+        ping.remote_addr = peername[0]
+    return ping
+
+
+class DatagramProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+
+    def datagram_received(self, data, addr):
+        for line in data.splitlines():
+            code = parse_code(line)
+            if code:
+                self.batcher.add(code, make_ping("udp", addr))
+
+
+class LineProtocol(asyncio.Protocol):
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+        self.transport = None
+        self.peername = None
+        self.buffer = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peername = transport.get_extra_info("peername")
+
+    def data_received(self, data):
+        self.buffer += data
+        while b"\n" in self.buffer:
+            line, self.buffer = self.buffer.split(b"\n", 1)
+            if line.strip():
+                self.handle_line(line)
+
+        if len(self.buffer) > MAX_LINE:
+            self.transport.write(b"ERR\n")
+            self.transport.close()
+
+    def handle_line(self, line):
+        code = parse_code(line)
+        if code is None:
+            self.transport.write(b"ERR\n")
+            return
+
+        self.batcher.add(code, make_ping("tcp", self.peername))
+        self.transport.write(b"OK\n")
+
+
+def listen(loop, batcher, host, udp_port=None, tcp_port=None,
+           reuse_port=False):
+    """ Start the UDP and TCP listeners on `loop`. Ports set to None are
+    not listened on. Return the transport and server objects. """
+
+    endpoints = []
+    if udp_port is not None:
+        coro = loop.create_datagram_endpoint(
+            lambda: DatagramProtocol(batcher), local_addr=(host, udp_port),
+            reuse_port=reuse_port)
+        transport, protocol = loop.run_until_complete(coro)
+        endpoints.append(transport)
+
+    if tcp_port is not None:
+        coro = loop.create_server(lambda: LineProtocol(batcher), host,
+                                  tcp_port, reuse_port=reuse_port)
+        endpoints.append(loop.run_until_complete(coro))
+
+    return endpoints
@@ -0,0 +1,214 @@
+import http.client
+import json
+import subprocess
+import threading
+import time
+from datetime import timedelta as td
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from hc.api import views
+from hc.api.cache import check_cache
+from hc.api.fastpath import PingFastPath
+from hc.api.models import Check
+from waitress.server import create_server
+from whitenoise.django import DjangoWhiteNoise
+
+
+def serve(application, threads):
+    """ Start waitress in a background thread, return its port. """
+
+    server = create_server(application, host="127.0.0.1", port=0,
+                           threads=threads)
+    t = threading.Thread(target=server.run)
+    t.daemon = True
+    t.start()
+    return server.effective_port
+
+
+def percentile(values, p):
+    """ Nearest-rank percentile of a sorted list, 0 for an empty one. """
+
+    if not values:
+        return 0.0
+
+    index = min(len(values) - 1, int(len(values) * p / 100.0))
+    return values[index]
+
+
+def hammer(port, paths, n_requests, concurrency):
+    """ Send n_requests GET requests over `concurrency` keep-alive
+    connections, cycling through `paths`. Return a dict with the request
+    rate and latency percentiles in milliseconds. """
+
+    latencies = []
+    lock = threading.Lock()
+
+    def client(offset, n):
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        mine = []
+        for i in range(n):
+            path = paths[(offset + i * concurrency) % len(paths)]
+            start = time.perf_counter()
+            conn.request("GET", path)
+            r = conn.getresponse()
+            r.read()
+            mine.append(time.perf_counter() - start)
+            assert r.status == 200, r.status
+        conn.close()
+
+        with lock:
+            latencies.extend(mine)
+
+    share = n_requests // concurrency
+    clients = [threading.Thread(target=client, args=(i, share))
+               for i in range(concurrency)]
+
+    start = time.perf_counter()
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3)
+    }
+
+
+def queries_per_request(codes, n=100):
+    """ Call the ping view in-process and count the queries it runs. """
+
+    factory = RequestFactory()
+    with CaptureQueriesContext(connection) as ctx:
+        for i in range(n):
+            code = codes[i % len(codes)]
+            request = factory.get("/ping/%s/" % code)
+            assert views.ping(request, str(code)).status_code == 200
+
+    return round(len(ctx.captured_queries) / n, 2)
+
+
+def git_commit():
+    try:
+        out = subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                      cwd=settings.BASE_DIR,
+                                      stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return out.decode().strip()
+
+
+class Command(BaseCommand):
+    help = """Measure /ping/ throughput and latency under waitress.
+
+    Seeds temporary checks in the configured database, then runs the same
+    load against the regular Django application and against the hc.wsgi
+    fast path. Reports requests per second, latency percentiles and
+    database queries per ping.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--checks',
+            type=int,
+            default=100,
+            help='Number of checks to seed and ping',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=2000,
+            help='Number of requests to send to each application',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help='Number of concurrent client connections',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=4,
+            help='Number of waitress worker threads',
+        )
+        parser.add_argument(
+            '--json',
+            metavar='PATH',
+            help='Also write the results as JSON to PATH, "-" for stdout',
+        )
+
+    def handle(self, *args, **options):
+        application = DjangoWhiteNoise(get_wsgi_application())
+        applications = [
+            ("django", application),
+            ("fastpath", PingFastPath(application))
+        ]
+
+        # With the grace time as long as the timeout, no ping is early, so
+        # the pings don't queue "fast" alerts, which real pings rarely do
+        checks = [Check(name="benchping", timeout=td(minutes=1),
+                        grace=td(minutes=1))
+                  for i in range(options["checks"])]
+        Check.objects.bulk_create(checks)
+        # The codes are set before saving, bulk_create doesn't return ids
+        # on every database
+        codes = [check.code for check in checks]
+        ids = []
+        for i in range(0, len(codes), 500):
+            q = Check.objects.filter(code__in=codes[i:i + 500])
+            ids.extend(q.values_list("id", flat=True))
+        paths = ["/ping/%s" % code for code in codes]
+
+        results = {
+            "commit": git_commit(),
+            "database": connection.vendor,
+            "checks": len(paths),
+            "concurrency": options["concurrency"],
+            "threads": options["threads"],
+            "applications": {}
+        }
+
+        try:
+            results["queries_per_request"] = queries_per_request(codes)
+            for label, app in applications:
+                port = serve(app, options["threads"])
+                result = hammer(port, paths, options["requests"],
+                                options["concurrency"])
+                results["applications"][label] = result
+
+                tmpl = ("%(label)-10s %(rps)8.1f req/s  p50 %(p50_ms).2f ms"
+                        "  p95 %(p95_ms).2f ms  p99 %(p99_ms).2f ms")
+                self.stdout.write(tmpl % dict(result, label=label))
+        finally:
+            # Only the seeded checks
+            for i in range(0, len(ids), 500):
+                Check.objects.filter(id__in=ids[i:i + 500]).delete()
+
+        self.stdout.write("queries per request: %.2f" %
+                          results["queries_per_request"])
+
+        results["check_cache"] = check_cache.stats()
+        tmpl = "check cache: %(hits)d hits, %(misses)d misses"
+        self.stdout.write(tmpl % results["check_cache"])
+
+        if options["json"] == "-":
+            self.stdout.write(json.dumps(results, indent=2))
+        elif options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(results, f, indent=2)
+
+        return "Done!"
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from hc.api.models import METHOD_CODES, SCHEME_CODES, Ping
+from hc.api.pings import user_agent_id
+
+
+class Command(BaseCommand):
+    help = """Convert existing pings to the compact row format.
+
+    Works through the api_ping table in ranges of primary keys. Each range
+    is converted with one UPDATE per distinct (scheme, method, user agent)
+    combination in it, so the command can run while pings keep arriving.
+    It can be interrupted and resumed with --start-id.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk',
+            type=int,
+            default=10000,
+            help='Number of primary key values to process at a time',
+        )
+        parser.add_argument(
+            '--start-id',
+            type=int,
+            default=0,
+            help='Resume from this ping id',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help='Seconds to pause between chunks, to limit the load',
+        )
+
+    def compact_range(self, lo, hi):
+        q = Ping.objects.filter(id__gte=lo, id__lt=hi)
+        combinations = q.values_list("scheme", "method", "ua").distinct()
+
+        n_compacted = 0
+        for scheme, method, ua in list(combinations):
+            fields = {}
+            if scheme in SCHEME_CODES:
+                fields["scheme_code"] = SCHEME_CODES[scheme]
+                fields["scheme"] = ""
+            if method in METHOD_CODES:
+                fields["method_code"] = METHOD_CODES[method]
+                fields["method"] = ""
+            if ua:
+                fields["user_agent_id"] = user_agent_id(ua)
+                fields["ua"] = ""
+
+            if fields:
+                rows = q.filter(scheme=scheme, method=method, ua=ua)
+                n_compacted += rows.update(**fields)
+
+        return n_compacted
+
+    def handle(self, *args, **options):
+        max_id = Ping.objects.aggregate(Max("id"))["id__max"] or 0
+
+        total = 0
+        for lo in range(options["start_id"], max_id + 1, options["chunk"]):
+            hi = lo + options["chunk"]
+            total += self.compact_range(lo, hi)
+            self.stdout.write("Compacted %d pings, next id %d" % (total, hi))
+            time.sleep(options["sleep"])
+
+        return "Done! Compacted %d pings" % total
@@ -1,8 +1,40 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.db import connection
 
 
+# For sendalerts --scheduler. Only when a check's next deadline may have
+# moved earlier: the scheduler looks up later deadlines by itself when the
+# earlier one comes due. NOTIFY serializes committing transactions, so
+# skip it for plain pings of checks which are up.
+PG_NOTIFY_CHECK = """
+            IF TG_OP = 'UPDATE' THEN
+                IF NEW.status IS DISTINCT FROM OLD.status
+                        OR NEW.status = 'down'
+                        OR NEW.alert_after < OLD.alert_after THEN
+                    PERFORM pg_notify('api_check', NEW.id::text);
+                END IF;
+            END IF;
+"""
+
+PG_NOTIFY_FLIP = """
+    CREATE OR REPLACE FUNCTION notify_flip()
+    RETURNS trigger AS $notify_flip$
+        BEGIN
+            PERFORM pg_notify('api_flip', '');
+            RETURN NULL;
+        END;
+    $notify_flip$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER notify_flip
+    AFTER INSERT ON api_flip
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_flip();
+"""
+
+
 def _pg(cursor):
+    notify = settings.ALERT_SCHEDULER_NOTIFY
+
     cursor.execute("""
     CREATE OR REPLACE FUNCTION update_alert_after()
     RETURNS trigger AS $update_alert_after$
@@ -10,6 +42,7 @@ def _pg(cursor):
             IF NEW.last_ping IS NOT NULL THEN
                 NEW.alert_after := NEW.last_ping + NEW.timeout + NEW.grace;
             END IF;
+            %s
             RETURN NEW;
         END;
     $update_alert_after$ LANGUAGE plpgsql;
@@ -19,7 +52,11 @@ def _pg(cursor):
     CREATE TRIGGER update_alert_after
     BEFORE INSERT OR UPDATE OF last_ping, timeout, grace  ON api_check
     FOR EACH ROW EXECUTE PROCEDURE update_alert_after();
-    """)
+
+    DROP TRIGGER IF EXISTS notify_flip ON api_flip;
+    %s
+    """ % (PG_NOTIFY_CHECK if notify else "",
+           PG_NOTIFY_FLIP if notify else ""))
 
 
 def _mysql(cursor):
@@ -0,0 +1,204 @@
+import re
+from datetime import datetime, timedelta as td
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from hc.api.pings import is_partitioned
+
+INTERVALS = {"daily": td(days=1), "weekly": td(days=7)}
+
+BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+def period_start(dt, interval):
+    """ Return the start of the partition period containing `dt`. Weekly
+    periods start on Mondays. All partition bounds are in UTC. """
+
+    dt = dt.astimezone(timezone.utc)
+    start = datetime(dt.year, dt.month, dt.day, tzinfo=timezone.utc)
+    if interval == "weekly":
+        start -= td(days=start.weekday())
+    return start
+
+
+def partition_name(start):
+    return "api_ping_p%s" % start.strftime("%Y%m%d")
+
+
+def upper_bound(expr):
+    """ Parse the upper bound from pg_get_expr(relpartbound). Return None
+    for the default partition and for MAXVALUE bounds. """
+
+    match = BOUND_RE.search(expr)
+    if match is None:
+        return None
+
+    value = match.group(1)
+    # PostgreSQL prints timestamptz like "2026-10-19 00:00:00+00"
+    if re.search(r"[+-]\d\d$", value):
+        value += "00"
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S%z")
+
+
+def list_partitions(cursor):
+    """ Return (name, upper bound) for each partition of api_ping. """
+
+    cursor.execute("""
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_class p ON p.oid = i.inhparent
+    WHERE p.relname = 'api_ping'
+    """)
+
+    return [(name, upper_bound(expr)) for name, expr in cursor.fetchall()]
+
+
+def prepare(cursor, boundary):
+    """ The slow part of the conversion, done without blocking writes:
+    build the indexes and constraint the partitioned table will need on
+    the existing rows. Can't run inside a transaction. """
+
+    cursor.execute("""
+    CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS api_ping_id_created
+    ON api_ping (id, created)
+    """)
+    cursor.execute("""
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS api_ping_owner_id_id
+    ON api_ping (owner_id, id)
+    """)
+    cursor.execute("""
+    ALTER TABLE api_ping DROP CONSTRAINT IF EXISTS api_ping_legacy_bound;
+    ALTER TABLE api_ping ADD CONSTRAINT api_ping_legacy_bound
+    CHECK (created IS NOT NULL AND created < %s) NOT VALID
+    """, [boundary])
+    cursor.execute("""
+    ALTER TABLE api_ping VALIDATE CONSTRAINT api_ping_legacy_bound
+    """)
+
+
+def convert(cursor, boundary):
+    """ Swap in a partitioned api_ping, with the existing table attached
+    as its first partition. Only takes brief locks, thanks to `prepare`. """
+
+    cursor.execute("""
+    ALTER TABLE api_ping RENAME TO api_ping_legacy;
+
+    CREATE TABLE api_ping (LIKE api_ping_legacy INCLUDING DEFAULTS)
+    PARTITION BY RANGE (created);
+
+    ALTER SEQUENCE api_ping_id_seq OWNED BY api_ping.id;
+
+    CREATE UNIQUE INDEX api_ping_id_created_p ON api_ping (id, created);
+    CREATE INDEX api_ping_owner_id_id_p ON api_ping (owner_id, id);
+
+    ALTER TABLE api_ping ADD CONSTRAINT api_ping_owner_id_fk
+    FOREIGN KEY (owner_id) REFERENCES api_check (id)
+    DEFERRABLE INITIALLY DEFERRED;
+
+    CREATE TABLE api_ping_default PARTITION OF api_ping DEFAULT;
+    """)
+
+    cursor.execute("""
+    ALTER TABLE api_ping ATTACH PARTITION api_ping_legacy
+    FOR VALUES FROM (MINVALUE) TO (%s)
+    """, [boundary])
+
+
+def create_partition(cursor, start, end):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS {name} PARTITION OF api_ping
+    FOR VALUES FROM (%s) TO (%s)
+    """.format(name=partition_name(start)), [start, end])
+
+
+def drop_partition(cursor, name):
+    cursor.execute("ALTER TABLE api_ping DETACH PARTITION {name}".format(
+        name=name))
+    cursor.execute("DROP TABLE {name}".format(name=name))
+
+
+class Command(BaseCommand):
+    help = """Manage time partitions of the api_ping table (PostgreSQL 11+).
+
+    Run once with --convert to turn api_ping into a table partitioned by
+    `created`, with the existing rows as its first partition. Can't be
+    used with PING_STORAGE = "ring". After that,
+    run regularly (e.g. daily from cron) to create upcoming partitions
+    and, with --retain-days, to drop partitions with only older pings.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Convert api_ping into a partitioned table',
+        )
+        parser.add_argument(
+            '--ahead',
+            type=int,
+            default=4,
+            help='Number of future partitions to keep created',
+        )
+        parser.add_argument(
+            '--retain-days',
+            type=int,
+            help='Drop partitions whose pings are all older than this',
+        )
+
+    def handle(self, *args, **options):
+        if settings.PING_STORAGE == "ring":
+            # PostgreSQL only allows unique indexes on a partitioned table
+            # if they include the partition key
+            raise CommandError("Partitioning doesn't work with "
+                               "PING_STORAGE = \"ring\"")
+
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning requires PostgreSQL")
+
+        interval = settings.PING_PARTITION_INTERVAL
+        period = INTERVALS[interval]
+        now = timezone.now()
+        first = period_start(now, interval) + period
+
+        with connection.cursor() as cursor:
+            partitioned = is_partitioned(cursor)
+            if options["convert"]:
+                if partitioned:
+                    raise CommandError("api_ping is already partitioned")
+
+                self.stdout.write("Building indexes on existing pings...")
+                prepare(cursor, first)
+                with transaction.atomic():
+                    convert(cursor, first)
+                self.stdout.write("Converted api_ping, existing pings are "
+                                  "in api_ping_legacy")
+            elif not partitioned:
+                raise CommandError("api_ping is not partitioned, "
+                                   "run with --convert first")
+
+            # Partitions are contiguous, anything before the highest upper
+            # bound is already covered
+            bounds = [bound for name, bound in list_partitions(cursor)]
+            covered = max([b for b in bounds if b is not None] or [first])
+
+            start = period_start(now, interval)
+            end = start + period * (options["ahead"] + 1)
+            while start < end:
+                if start >= covered:
+                    create_partition(cursor, start, start + period)
+                start += period
+
+            n_dropped = 0
+            if options["retain_days"] is not None:
+                cutoff = now - td(days=options["retain_days"])
+                for name, bound in list_partitions(cursor):
+                    if bound is not None and bound <= cutoff:
+                        drop_partition(cursor, name)
+                        self.stdout.write("Dropped %s" % name)
+                        n_dropped += 1
+
+        return "Done! Dropped %d partition(s)" % n_dropped
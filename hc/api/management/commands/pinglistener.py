@@ -0,0 +1,91 @@
+import asyncio
+import os
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from hc.api.listener import listen
+from hc.api.pings import PingBatcher
+
+
+class Command(BaseCommand):
+    help = """Receive pings over UDP and TCP.
+
+    A datagram or a line sent to the TCP port contains a check's UUID.
+    With --workers greater than one, the command forks worker processes
+    which share the ports using SO_REUSEPORT.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host',
+            default='127.0.0.1',
+            help='Address to listen on',
+        )
+        parser.add_argument(
+            '--udp-port',
+            type=int,
+            default=8099,
+            help='UDP port, 0 to disable UDP',
+        )
+        parser.add_argument(
+            '--tcp-port',
+            type=int,
+            default=8099,
+            help='TCP port, 0 to disable TCP',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of worker processes',
+        )
+
+    def serve(self, options):
+        batcher = PingBatcher(settings.PING_BUFFER_SIZE,
+                              settings.PING_BUFFER_INTERVAL / 1000.0,
+                              settings.PING_BUFFER_LIMIT)
+        batcher.start()
+
+        loop = asyncio.new_event_loop()
+        listen(loop, batcher, options["host"],
+               udp_port=options["udp_port"] or None,
+               tcp_port=options["tcp_port"] or None,
+               reuse_port=options["workers"] > 1)
+
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.close()
+            batcher.flush()
+
+    def handle(self, *args, **options):
+        # Forked workers must not share the parent's database connection
+        connections.close_all()
+
+        children = []
+        for i in range(options["workers"] - 1):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    self.serve(options)
+                finally:
+                    os._exit(0)
+
+            children.append(pid)
+
+        self.stdout.write("Listening on %s, %d worker(s)" %
+                          (options["host"], options["workers"]))
+        try:
+            self.serve(options)
+        finally:
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+
+        return "Done!"
@@ -0,0 +1,104 @@
+import time
+from datetime import timedelta as td
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from hc.api.models import Channel, Flip, Notification
+
+
+class Command(BaseCommand):
+    help = """Prune old notifications.
+
+    Deletes notifications older than --days, but keeps the newest --keep
+    notifications of every channel regardless of age. Works one channel
+    at a time and deletes in batches of --batch rows, using the
+    (channel, created) index.
+
+    Also deletes the status changes ("flips") which sendalerts processed
+    more than --days ago.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.NOTIFICATION_RETENTION_DAYS,
+            help='Delete notifications older than this many days',
+        )
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=settings.NOTIFICATION_KEEP,
+            help='Number of newest notifications to keep for each channel',
+        )
+        parser.add_argument(
+            '--batch',
+            type=int,
+            default=1000,
+            help='Number of rows to delete at a time',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help='Seconds to pause between batches, to limit the load',
+        )
+
+    def prune_channel(self, channel_id, cutoff, keep, batch, sleep):
+        q = Notification.objects.filter(channel_id=channel_id)
+
+        if keep:
+            newest = q.order_by("-created").values_list("created", flat=True)
+            kept = list(newest[keep - 1:keep])
+            if not kept:
+                # Fewer than `keep` notifications, nothing to do
+                return 0
+            cutoff = min(cutoff, kept[0])
+
+        old = q.filter(created__lt=cutoff).values_list("id", flat=True)
+
+        n_pruned = 0
+        while True:
+            ids = list(old[:batch])
+            if not ids:
+                return n_pruned
+
+            n, _ = Notification.objects.filter(id__in=ids).delete()
+            n_pruned += n
+            time.sleep(sleep)
+
+    def prune_flips(self, cutoff, batch, sleep):
+        q = Flip.objects.filter(processed__lt=cutoff)
+        old = q.values_list("id", flat=True)
+
+        n_pruned = 0
+        while True:
+            ids = list(old[:batch])
+            if not ids:
+                return n_pruned
+
+            n, _ = Flip.objects.filter(id__in=ids).delete()
+            n_pruned += n
+            time.sleep(sleep)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - td(days=options["days"])
+
+        total = 0
+        channel_ids = Channel.objects.order_by("id")
+        channel_ids = channel_ids.values_list("id", flat=True)
+        for channel_id in channel_ids:
+            n = self.prune_channel(channel_id, cutoff, options["keep"],
+                                   options["batch"], options["sleep"])
+            if n:
+                self.stdout.write("Pruned %d notifications for channel %d" %
+                                  (n, channel_id))
+            total += n
+
+        n = self.prune_flips(cutoff, options["batch"], options["sleep"])
+        if n:
+            self.stdout.write("Pruned %d processed flips" % n)
+
+        return "Done! Pruned %d notifications" % total
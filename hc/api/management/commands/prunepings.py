@@ -1,22 +1,58 @@
-from django.db.models import F
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
 from hc.accounts.models import Profile
-from hc.api.models import Ping
+from hc.api.prune import Pruner
 
 
 class Command(BaseCommand):
-    help = 'Prune pings based on limits in user profiles'
+    help = """Prune pings based on limits in user profiles.
+
+    Deletes in batches of --chunk primary key values, optionally throttled
+    to --max-rate deleted rows per second. With --checkpoint, progress is
+    saved after every batch and an interrupted run resumes from there.
+    On PostgreSQL and MySQL, --workers splits the table between several
+    connections.
+
+    """
+
+    default_chunk = 100000
+    default_max_rate = 0
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk',
+            type=int,
+            default=self.default_chunk,
+            help='Number of primary key values to process at a time',
+        )
+        parser.add_argument(
+            '--max-rate',
+            type=float,
+            default=self.default_max_rate,
+            help='Maximum rows to delete per second, 0 for no limit',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            metavar='PATH',
+            help='Save progress to PATH and resume from it',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of ranges to prune in parallel',
+        )
 
     def handle(self, *args, **options):
         # Create any missing user profiles
         for user in User.objects.filter(profile=None):
             Profile.objects.get_or_create(user_id=user.id)
 
-        q = Ping.objects
-        q = q.annotate(limit=F("owner__user__profile__ping_log_limit"))
-        q = q.filter(n__lt=F("owner__n_pings") - F("limit"))
-        q = q.filter(n__gt=0)
-        n_pruned, _ = q.delete()
+        pruner = Pruner(chunk=options["chunk"],
+                        max_rate=options["max_rate"],
+                        checkpoint=options["checkpoint"],
+                        workers=options["workers"],
+                        log=self.stdout.write)
 
+        n_pruned = pruner.run()
         return "Done! Pruned %d pings" % n_pruned
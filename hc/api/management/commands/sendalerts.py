@@ -2,52 +2,358 @@ import logging
 import time
 
 from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db import connection
+from django.db import connection, transaction
 from django.utils import timezone
-from hc.api.models import Check
+from hc.api import metrics, outbox
+from hc.api.cache import check_cache
+from hc.api.delivery import DeliveryEngine
+from hc.api.digest import Digester, send_digest
+from hc.api.models import Check, Flip
+from hc.api.scheduler import AlertScheduler
+from hc.api.transitions import apply_transitions
 
 executor = ThreadPoolExecutor(max_workers=10)
 logger = logging.getLogger(__name__)
 
 
+def record_alert(status, since):
+    """ Count an alert, and how long after `since` it went out. """
+
+    metrics.ALERTS.inc(status=status)
+    if since is not None:
+        lag = (timezone.now() - since).total_seconds()
+        metrics.ALERT_LAG.observe(max(lag, 0), status=status)
+
+
 class Command(BaseCommand):
     help = 'Sends UP/DOWN email alerts'
+    # Set by --async-delivery
+    engine = None
+    # Set by settings.ALERT_DIGEST_THRESHOLD
+    digester = None
+    # Set by --outbox
+    outbox = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scheduler',
+            action='store_true',
+            help='Sleep until the next alert deadline instead of polling '
+                 'every second',
+        )
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=1.0,
+            help='With --scheduler, seconds between polls for changed '
+                 'checks, unused with PostgreSQL notifications',
+        )
+        parser.add_argument(
+            '--max-poll',
+            type=float,
+            default=10.0,
+            help='With --scheduler, the longest --poll backs off to while '
+                 'nothing changes',
+        )
+        parser.add_argument(
+            '--resync',
+            type=int,
+            default=60,
+            help='With --scheduler, seconds between full reloads of the '
+                 'alert deadlines',
+        )
+        parser.add_argument(
+            '--async-delivery',
+            action='store_true',
+            help='Send all due HTTP notifications concurrently from an '
+                 'event loop',
+        )
+        parser.add_argument(
+            '--per-host',
+            type=int,
+            default=10,
+            help='With --async-delivery, maximum concurrent requests to '
+                 'one host',
+        )
+        parser.add_argument(
+            '--deadline',
+            type=float,
+            default=30,
+            help='With --async-delivery, seconds to deliver each alert, '
+                 'including retries',
+        )
+        parser.add_argument(
+            '--outbox',
+            action='store_true',
+            help='Queue notifications in the database and retry failed '
+                 'ones with backoff',
+        )
+        parser.add_argument(
+            '--metrics-port',
+            type=int,
+            default=None,
+            help='Serve alert lag and delivery metrics on '
+                 'http://127.0.0.1:PORT/metrics',
+        )
+
+    def process(self, checks, flips, claimed=False):
+        """ Send alerts for the given checks and flips. With `claimed`,
+        the checks already have their new status saved. """
+
+        metrics.BATCH_SIZE.observe(len(checks) + len(flips))
+
+        futures, digests = [], []
+        # The outbox queues every alert on its own
+        if self.digester is not None and not self.outbox:
+            if not claimed:
+                checks = [check for check in checks if self.claim(check)]
+                claimed = True
+
+            groups, checks = self.digester.split(checks, time.time())
+            digests = [executor.submit(self.send_digest, group)
+                       for group in groups]
+
+        if self.outbox:
+            self.enqueue(checks, flips, claimed)
+        elif self.engine is not None:
+            self.deliver(checks, flips, claimed)
+        else:
+            handle = self.send_one if claimed else self.handle_one
+            futures += [executor.submit(handle, check) for check in checks]
+            futures += [executor.submit(self.handle_flip, flip)
+                        for flip in flips]
+
+        waiting = [f for f in futures + digests
+                   if not f.running() and not f.done()]
+        metrics.QUEUE_DEPTH.observe(len(waiting))
+
+        # Channels which can't take digests get their alerts one by one
+        pairs = []
+        for future in digests:
+            pairs.extend(future.result())
+        if pairs:
+            futures += self.send_pairs(pairs)
+
+        for future in futures:
+            future.result()
+
+    def send_pairs(self, pairs):
+        """ Send alerts for (check, channel) pairs of claimed checks, the
+        same way as other alerts. Return futures to wait for. """
+
+        if self.engine is not None:
+            for ch, error in self.engine.send_pairs(pairs):
+                self.stdout.write("ERROR: %s %s %s\n" %
+                                  (ch.kind, ch.value, error))
+            return []
+
+        return [executor.submit(self.send_pair, check, channel)
+                for check, channel in pairs]
+
+    def deliver(self, checks, flips, claimed=False):
+        """ Claim the checks and flips, then send all of their alerts at
+        once through the delivery engine. """
+
+        if not claimed:
+            checks = [check for check in checks if self.claim(check)]
+
+        claimed = list(checks)
+        for flip in flips:
+            if self.claim_flip(flip):
+                flip.owner.status = flip.new_status
+                claimed.append(flip.owner)
+
+        tmpl = "\nSending alert, status=%s, code=%s\n"
+        for check in claimed:
+            self.stdout.write(tmpl % (check.status, check.code))
+
+        for ch, error in self.engine.send(claimed):
+            self.stdout.write("ERROR: %s %s %s\n" % (ch.kind, ch.value, error))
+
+    def enqueue(self, checks, flips, claimed=False):
+        """ Claim the checks and flips, and queue their alerts in the
+        outbox. Each claim commits together with its queued alerts. """
+
+        tmpl = "\nQueueing alert, status=%s, code=%s\n"
+        for check in checks:
+            with transaction.atomic():
+                if not claimed and not self.claim(check):
+                    continue
+
+                # Each nag gets a new nag_after, each recovery a new ping
+                event = check.nag_after if check.status == "down" \
+                    else check.last_ping
+                outbox.enqueue(check, event)
+
+            self.stdout.write(tmpl % (check.status, check.code))
+
+        for flip in flips:
+            with transaction.atomic():
+                if not self.claim_flip(flip):
+                    continue
+
+                flip.owner.status = flip.new_status
+                outbox.enqueue(flip.owner, "flip-%d" % flip.id)
+
+            self.stdout.write(tmpl % (flip.new_status, flip.owner.code))
+
+    def drain(self):
+        """ Make one attempt at each due notification in the outbox.
+
+        Return True if there were any.
+
+        """
+
+        entries = outbox.due(timezone.now())
+        futures = [executor.submit(self.send_entry, e) for e in entries]
+        for future in futures:
+            future.result()
+
+        return bool(entries)
+
+    def send_entry(self, entry):
+        error = outbox.send(entry)
+        if error not in ("", "no-op"):
+            ch = entry.channel
+            tmpl = "ERROR: %s %s %s, attempt %d\n"
+            self.stdout.write(tmpl % (ch.kind, ch.value, error,
+                                      entry.attempts))
+
+        connection.close()
 
     def handle_many(self):
-        """ Send alerts for many checks simultaneously. """
-        query = Check.objects.filter(user__isnull=False).select_related("user")
+        """ Send alerts for many checks simultaneously.
+
+        The going down, going up and nagging transitions are applied to
+        all due checks at once, see hc.api.transitions. Then the changed
+        checks are loaded and their alerts sent.
+
+        """
+
+        with metrics.TICK_QUERY.time():
+            if self.outbox:
+                # The new statuses and their queued alerts commit together,
+                # after a crash in between the checks wouldn't be due again
+                with transaction.atomic():
+                    down, up, nag, checks, flips = self.select_due()
+                    self.enqueue(checks, [], claimed=True)
+            else:
+                down, up, nag, checks, flips = self.select_due()
+
+        down, up = set(down), set(up)
+        for check in checks:
+            check_cache.invalidate(check.code)
+            if check.id in down:
+                record_alert("down", check.alert_after)
+            elif check.id in up:
+                record_alert("up", check.last_ping)
+            else:
+                # The previous nag time is already overwritten
+                record_alert("down", None)
+
+        if not checks and not flips:
+            return False
+
+        if self.outbox:
+            metrics.BATCH_SIZE.observe(len(checks) + len(flips))
+            self.enqueue([], flips)
+        else:
+            self.process(checks, flips, claimed=True)
+        return True
+
+    def select_due(self):
+        """ Apply the due transitions. Return the ids of checks which went
+        down, went up and need a nag, the changed checks, and the pending
+        flips. """
+
+        down, up, nag = apply_transitions(timezone.now())
+        ids = down + up + nag
+
+        checks = []
+        # Stay below SQLite's limit on query parameters
+        for i in range(0, len(ids), 500):
+            q = Check.objects.filter(id__in=ids[i:i + 500])
+            checks.extend(q.select_related("user"))
 
+        # Status changes queued by the ping path
+        flips = Flip.objects.filter(processed=None)
+        flips = list(flips.select_related("owner").order_by("id")[:100])
+        return down, up, nag, checks, flips
+
+    def handle_scheduled(self, scheduler, timeout):
+        """ Wait up to `timeout` seconds for due checks and flips, and
+        send their alerts.
+
+        Return True if anything was processed.
+
+        """
+
+        checks, flips = scheduler.wait(timeout)
+        if not checks and not flips:
+            return False
+
+        self.process(checks, flips)
+        # Claiming has moved their deadlines
+        scheduler.load([check.id for check in checks])
+        return True
+
+    def claim(self, check):
+        """ Save the check's new status, on the condition that nobody has
+        changed it since we read it. If sendalerts crashes, it won't
+        process this check again.
+
+        Return False if another sendalerts process claimed it first, if
+        it got pinged after it was selected, or if it isn't due.
+
+        """
+
+        # The same transitions as hc.api.transitions, worked out from the
+        # stored state: get_status() would say "fast" right after a ping
         now = timezone.now()
-        going_down = query.filter(alert_after__lt=now, status="up")
-        going_up = query.filter(alert_after__gt=now, status="down")
-        need_nagging =query.filter(nag_after__lt=now, status="down", nag_status=True)
-        # Don't combine this in one query so Postgres can query using index:
-        checks = list(going_down.iterator()) + list(going_up.iterator()) + list(need_nagging.iterator())
+        status, nag_after = check.status, check.nag_after
+        if check.user_id is None or check.alert_after is None:
+            return False
+        elif check.status == "up" and check.alert_after < now:
+            status, since = "down", check.alert_after
+            nag_after = now + check.interval
+        elif check.status == "down" and check.alert_after > now:
+            status, since = "up", check.last_ping
+        elif check.status == "down" and check.nag_status and \
+                check.nag_after and check.nag_after < now:
+            since = check.nag_after
+            nag_after = now + check.interval
+        else:
+            return False
 
-        if not checks:
+        q = Check.objects.filter(id=check.id, status=check.status,
+                                 last_ping=check.last_ping,
+                                 nag_after=check.nag_after)
+        if q.update(status=status, nag_after=nag_after) == 0:
             return False
-        futures = [executor.submit(self.handle_one, check) for check in checks]
-        for future in futures:
-            future.result()
 
+        check_cache.invalidate(check.code)
+        record_alert(status, since)
+        check.status, check.nag_after = status, nag_after
         return True
 
     def handle_one(self, check):
         """ Send an alert for a single check.
 
         Return True if an appropriate check was selected and processed.
-        Return False if no checks need to be processed.
+        Return False if it couldn't be claimed.
 
         """
 
-        # Save the new status. If sendalerts crashes,
-        # it won't process this check again.
-        check.status = check.get_status()
-        check.save()
-        if check.status == "down":
-            check.nag_after = (timezone.now() + check.interval)
-        check.save()
+        if not self.claim(check):
+            connection.close()
+            return False
+
+        return self.send_one(check)
+
+    def send_one(self, check):
+        """ Send an alert for a check whose new status is saved. """
 
         tmpl = "\nSending alert, status=%s, code=%s\n"
         self.stdout.write(tmpl % (check.status, check.code))
@@ -58,12 +364,109 @@ class Command(BaseCommand):
         connection.close()
         return True
 
+    def send_pair(self, check, channel):
+        """ Send an alert for a check whose new status is saved, to one
+        of its channels. """
+
+        error = channel.notify(check)
+        if error not in ("", "no-op"):
+            tmpl = "ERROR: %s %s %s\n"
+            self.stdout.write(tmpl % (channel.kind, channel.value, error))
+
+        connection.close()
+
+    def send_digest(self, checks):
+        """ Send one alert per channel for several down checks of one
+        user, whose new status is saved. Return (check, channel) pairs
+        for channels which need an alert per check. """
+
+        tmpl = "\nSending digest, %d checks down, user=%s\n"
+        self.stdout.write(tmpl % (len(checks), checks[0].user.email))
+        errors, rest = send_digest(checks)
+        for ch, error in errors:
+            self.stdout.write("ERROR: %s %s %s\n" % (ch.kind, ch.value, error))
+
+        connection.close()
+        return rest
+
+    def handle_flip(self, flip):
+        """ Send alerts for a status change queued by the ping path.
+
+        Return False if another sendalerts process got to it first.
+
+        """
+
+        if not self.claim_flip(flip):
+            return False
+
+        tmpl = "\nSending alert, status=%s, code=%s\n"
+        self.stdout.write(tmpl % (flip.new_status, flip.owner.code))
+        errors = flip.send_alerts()
+        for ch, error in errors:
+            self.stdout.write("ERROR: %s %s %s\n" % (ch.kind, ch.value, error))
+
+        connection.close()
+        return True
+
+    def claim_flip(self, flip):
+        q = Flip.objects.filter(id=flip.id, processed=None)
+        if q.update(processed=timezone.now()) == 0:
+            return False
+
+        record_alert(flip.new_status, flip.created)
+        return True
+
     def handle(self, *args, **options):
         self.stdout.write("sendalerts is now running")
 
+        if settings.ALERT_DIGEST_THRESHOLD is not None:
+            self.digester = Digester(settings.ALERT_DIGEST_THRESHOLD,
+                                     settings.ALERT_DIGEST_WINDOW)
+
+        self.outbox = options["outbox"]
+        if options["async_delivery"]:
+            self.engine = DeliveryEngine(executor, options["per_host"],
+                                         options["deadline"])
+
+        if options["metrics_port"]:
+            metrics.serve(options["metrics_port"])
+            self.stdout.write("Serving metrics on port %d" %
+                              options["metrics_port"])
+
+        if options["scheduler"]:
+            scheduler = AlertScheduler(options["poll"], options["resync"],
+                                       options["max_poll"])
+            if scheduler.listen():
+                self.stdout.write("Listening for check changes")
+
+            last_mark = time.time()
+            while True:
+                timeout = 60
+                if self.outbox:
+                    # Wake up for the next retry
+                    next_due = outbox.next_due()
+                    if next_due is not None:
+                        timeout = (next_due - timezone.now()).total_seconds()
+                        timeout = min(max(timeout, 0), 60)
+
+                self.handle_scheduled(scheduler, timeout)
+                if self.outbox:
+                    self.drain()
+
+                if time.time() - last_mark >= 60:
+                    last_mark = time.time()
+                    formatted = timezone.now().isoformat()
+                    summary = metrics.summary()
+                    self.stdout.write("-- MARK %s %s --" %
+                                      (formatted, summary))
+
         ticks = 0
         while True:
-            if self.handle_many():
+            busy = self.handle_many()
+            if self.outbox:
+                busy = self.drain() or busy
+
+            if busy:
                 ticks = 1
             else:
                 ticks += 1
@@ -71,4 +474,5 @@ class Command(BaseCommand):
             time.sleep(1)
             if ticks % 60 == 0:
                 formatted = timezone.now().isoformat()
-                self.stdout.write("-- MARK %s --" % formatted)
+                summary = metrics.summary()
+                self.stdout.write("-- MARK %s %s --" % (formatted, summary))
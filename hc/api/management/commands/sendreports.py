@@ -5,6 +5,7 @@ from django.core.management.base import BaseCommand
 from django.db.models import Q
 from django.utils import timezone
 from hc.accounts.models import Profile
+from hc.api.leader import Leadership
 from hc.api.models import Check
 
 
@@ -51,8 +52,11 @@ class Command(BaseCommand):
             return "Sent %d reports" % self.handle_one_run()
 
         self.stdout.write("sendreports is now running")
+        # Several hosts can run this, only one of them sends the reports
+        leadership = Leadership("sendreports")
         while True:
-            self.handle_one_run()
+            if leadership.try_acquire():
+                self.handle_one_run()
 
             formatted = timezone.now().isoformat()
             self.stdout.write("-- MARK %s --" % formatted)
@@ -0,0 +1,64 @@
+import asyncio
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from hc.api.pings import PingBatcher
+from hc.api.smtpd import SMTPServer
+
+
+class Command(BaseCommand):
+    help = """Receive email pings over SMTP.
+
+    Accepts emails to <code>@PING_EMAIL_DOMAIN addresses and records them
+    as pings. Emails for unknown checks are rejected at RCPT TO.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host',
+            default='0.0.0.0',
+            help='Address to listen on',
+        )
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=25,
+            help='Port to listen on',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=4,
+            help='Number of threads for recipient lookups',
+        )
+
+    def handle(self, *args, **options):
+        batcher = PingBatcher(settings.PING_BUFFER_SIZE,
+                              settings.PING_BUFFER_INTERVAL / 1000.0,
+                              settings.PING_BUFFER_LIMIT)
+        batcher.start()
+
+        smtp = SMTPServer(batcher, ThreadPoolExecutor(options["threads"]))
+
+        loop = asyncio.get_event_loop()
+        coro = asyncio.start_server(smtp.handle, options["host"],
+                                    options["port"])
+        server = loop.run_until_complete(coro)
+
+        self.stdout.write("Listening on %s:%d" %
+                          (options["host"], options["port"]))
+
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            loop.close()
+            batcher.flush()
+
+        return "Done!"
@@ -0,0 +1,280 @@
+""" In-process counters and histograms for the alert loop.
+
+sendalerts records how late alerts go out, how long its queries take, how
+big its batches are, and how long each transport takes to deliver. The
+numbers live in this module, per process. `serve` exposes them over HTTP in
+the Prometheus text format, for a local scraper:
+
+    $ ./manage.py sendalerts --metrics-port 9101
+    $ curl http://127.0.0.1:9101/metrics
+
+`summary` condenses the numbers since its previous call into one line,
+which sendalerts appends to its "-- MARK --" lines.
+
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Upper bounds, in seconds, for latency histograms
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+           120, 300, 600, 1800, 3600)
+
+# Upper bounds for size histograms
+SIZES = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_lock = threading.Lock()
+_metrics = []
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+
+    pairs = ['%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+             for k, v in labels]
+    return "{%s}" % ",".join(pairs)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self):
+        with _lock:
+            return sum(self.values.values())
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield self.name, key, value
+
+
+class Gauge(object):
+
+    kind = "gauge"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        _metrics.append(self)
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = value
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield self.name, key, value
+
+
+class Histogram(object):
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=SECONDS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts, sum, count, max since summary]
+        self.values = {}
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            if key not in self.values:
+                self.values[key] = [[0] * (len(self.buckets) + 1), 0, 0, 0]
+            entry = self.values[key]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+            entry[3] = max(entry[3], value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, **labels)
+
+    def snapshot(self):
+        """ Return (per-bucket counts, sum, count, max) across all labels,
+        and reset the maxima. """
+
+        counts, total, n, top = [0] * (len(self.buckets) + 1), 0, 0, 0
+        with _lock:
+            for entry in self.values.values():
+                counts = [a + b for a, b in zip(counts, entry[0])]
+                total += entry[1]
+                n += entry[2]
+                top = max(top, entry[3])
+                entry[3] = 0
+
+        return counts, total, n, top
+
+    def samples(self):
+        for key, (counts, total, n, top) in sorted(self.values.items()):
+            cumulative = 0
+            bounds = self.buckets + (float("inf"), )
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = key + (("le", format_value(bound)), )
+                yield self.name + "_bucket", le, cumulative
+            yield self.name + "_sum", key, total
+            yield self.name + "_count", key, n
+
+
+def quantile(q, buckets, counts):
+    """ Estimate a quantile from histogram counts: the upper bound of the
+    bucket it falls in. """
+
+    n = sum(counts)
+    if n == 0:
+        return 0
+
+    seen = 0
+    for bound, count in zip(buckets + (float("inf"), ), counts):
+        seen += count
+        if seen >= q * n:
+            return bound
+
+
+def render():
+    """ Return all metrics in the Prometheus text format. """
+
+    lines = []
+    with _lock:
+        for metric in _metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.help))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append("%s%s %s" % (name, format_labels(labels),
+                                          format_value(value)))
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="127.0.0.1"):
+    """ Serve /metrics from a daemon thread. Return the server. """
+
+    server = HTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+ALERT_LAG = Histogram(
+    "hc_alert_lag_seconds",
+    "Time from a check's alert_after (or ping, when going up) to dispatching "
+    "its alert")
+
+ALERTS = Counter(
+    "hc_alerts_total",
+    "Alerts sent, by new status")
+
+TICK_QUERY = Histogram(
+    "hc_sendalerts_query_seconds",
+    "Time spent in the database per sendalerts tick")
+
+BATCH_SIZE = Histogram(
+    "hc_sendalerts_batch_size",
+    "Checks and flips handled per sendalerts tick",
+    buckets=SIZES)
+
+QUEUE_DEPTH = Histogram(
+    "hc_sendalerts_queue_depth",
+    "Tasks waiting in the executor after each sendalerts tick",
+    buckets=SIZES)
+
+DELIVERY = Histogram(
+    "hc_delivery_seconds",
+    "Time to deliver one notification, including retries, by transport")
+
+DELIVERY_ERRORS = Counter(
+    "hc_delivery_errors_total",
+    "Notifications which failed after all retries, by transport")
+
+CIRCUITS = Gauge(
+    "hc_circuit_breakers",
+    "Notification endpoints with an open or half-open circuit breaker")
+
+CIRCUIT_TRIPS = Counter(
+    "hc_circuit_trips_total",
+    "Times a circuit breaker opened")
+
+CIRCUIT_REJECTIONS = Counter(
+    "hc_circuit_rejections_total",
+    "Requests failed fast because of an open circuit breaker")
+
+
+# Totals at the previous summary
+_previous = {}
+
+
+def summary():
+    """ Return a one-line summary of the alert metrics since the previous
+    call. """
+
+    lag_counts, _, _, lag_max = ALERT_LAG.snapshot()
+    _, query_sum, ticks, _ = TICK_QUERY.snapshot()
+    current = {"lag": lag_counts, "query": query_sum, "ticks": ticks,
+               "alerts": ALERTS.total(), "errors": DELIVERY_ERRORS.total()}
+
+    previous = _previous.copy() or {"lag": [0] * len(lag_counts),
+                                    "query": 0, "ticks": 0,
+                                    "alerts": 0, "errors": 0}
+    _previous.update(current)
+
+    lag = [a - b for a, b in zip(current["lag"], previous["lag"])]
+    ticks = current["ticks"] - previous["ticks"]
+    query = current["query"] - previous["query"]
+
+    return "alerts=%d lag_p50=%ss lag_p99=%ss lag_max=%.1fs " \
+        "query_avg=%.3fs errors=%d" % (
+            current["alerts"] - previous["alerts"],
+            format_value(quantile(0.5, ALERT_LAG.buckets, lag)),
+            format_value(quantile(0.99, ALERT_LAG.buckets, lag)),
+            lag_max, query / ticks if ticks else 0,
+            current["errors"] - previous["errors"])
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 12:45
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0036_flip'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='check',
+            name='n_coalesced',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='check',
+            name='n_throttled',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 13:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0037_auto_20261018_1245'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=200, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='check',
+            name='store_client_info',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='ping',
+            name='method_code',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'GET'), (2, 'POST'), (3, 'HEAD'), (4, 'PUT'), (5, 'DELETE'), (6, 'PATCH'), (7, 'OPTIONS'), (8, 'email')], null=True),
+        ),
+        migrations.AddField(
+            model_name='ping',
+            name='scheme_code',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'http'), (2, 'https'), (3, 'email'), (4, 'udp'), (5, 'tcp')], null=True),
+        ),
+        migrations.AddField(
+            model_name='ping',
+            name='user_agent',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.UserAgent'),
+        ),
+    ]
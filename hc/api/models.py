@@ -10,7 +10,8 @@ from django.contrib.auth.models import User
 from django.db import models
 from django.urls import reverse
 from django.utils import timezone
-from hc.api import transports
+from hc.api import metrics, transports
+from hc.api.cache import check_cache
 from hc.lib import emails
 
 STATUSES = (
@@ -21,6 +22,29 @@ STATUSES = (
 	("fast", "Fast")
 )
 
+# Compact codes for Ping.scheme and Ping.method, see PING_COMPACT
+PING_SCHEMES = (
+	(1, "http"),
+	(2, "https"),
+	(3, "email"),
+	(4, "udp"),
+	(5, "tcp")
+)
+
+PING_METHODS = (
+	(1, "GET"),
+	(2, "POST"),
+	(3, "HEAD"),
+	(4, "PUT"),
+	(5, "DELETE"),
+	(6, "PATCH"),
+	(7, "OPTIONS"),
+	(8, "email")
+)
+
+SCHEME_CODES = {name: code for code, name in PING_SCHEMES}
+METHOD_CODES = {name: code for code, name in PING_METHODS}
+
 DEFAULT_TIMEOUT = td(days=1)
 DEFAULT_GRACE = td(hours=1)
 DEFAULT_NAG = td(hours=1)
@@ -56,12 +80,25 @@ class Check(models.Model):
     timeout = models.DurationField(default=DEFAULT_TIMEOUT)
     grace = models.DurationField(default=DEFAULT_GRACE)
     n_pings = models.IntegerField(default=0)
+    # Pings counted without a Ping row, and pings rejected, see coalesce.py
+    n_coalesced = models.IntegerField(default=0)
+    n_throttled = models.IntegerField(default=0)
     last_ping = models.DateTimeField(null=True, blank=True)
     alert_after = models.DateTimeField(null=True, blank=True, editable=False)
     status = models.CharField(max_length=6, choices=STATUSES, default="new")
     interval = models.DurationField(default=DEFAULT_NAG)
     nag_status = models.BooleanField(default=True)
     nag_after = models.DateTimeField(null=True)
+    # Keep the pinging client's IP address and user agent in the ping log
+    store_client_info = models.BooleanField(default=True)
+
+    def save(self, *args, **kwargs):
+        super(Check, self).save(*args, **kwargs)
+        check_cache.invalidate(self.code)
+
+    def delete(self, *args, **kwargs):
+        check_cache.invalidate(self.code)
+        return super(Check, self).delete(*args, **kwargs)
 
     def name_then_code(self):
         if self.name:
@@ -152,14 +189,50 @@ class Check(models.Model):
         return result
 
 
+class UserAgent(models.Model):
+	""" Distinct User-Agent values, referenced by compact Ping rows. """
+
+	value = models.CharField(max_length=200, unique=True)
+
+	def __str__(self):
+		return self.value
+
+
 class Ping(models.Model):
 	n = models.IntegerField(null=True)
+	# Ring storage mode upserts pings into per-check slots. The unique
+	# index on (owner, slot) is partial, see migration 0039.
+	slot = models.IntegerField(null=True)
 	owner = models.ForeignKey(Check)
-	created = models.DateTimeField(auto_now_add=True)
+	# Not auto_now_add: buffered pings are saved after they arrive
+	created = models.DateTimeField(default=timezone.now)
 	scheme = models.CharField(max_length=10, default="http")
 	remote_addr = models.GenericIPAddressField(blank=True, null=True)
 	method = models.CharField(max_length=10, blank=True)
 	ua = models.CharField(max_length=200, blank=True)
+	# Compact rows store these instead of scheme, method and ua. UserAgent
+	# rows are never deleted, so user_agent needs no index of its own.
+	scheme_code = models.PositiveSmallIntegerField(null=True,
+		choices=PING_SCHEMES)
+	method_code = models.PositiveSmallIntegerField(null=True,
+		choices=PING_METHODS)
+	user_agent = models.ForeignKey(UserAgent, null=True, blank=True,
+		db_index=False)
+
+	def get_scheme(self):
+		if self.scheme_code:
+			return self.get_scheme_code_display()
+		return self.scheme
+
+	def get_method(self):
+		if self.method_code:
+			return self.get_method_code_display()
+		return self.method
+
+	def get_ua(self):
+		if self.user_agent_id:
+			return self.user_agent.value
+		return self.ua
 
 
 class Channel(models.Model):
@@ -212,20 +285,34 @@ class Channel(models.Model):
             raise NotImplementedError("Unknown channel kind: %s" % self.kind)
 
     def notify(self, check):
+        return self.deliver([check], lambda: self.transport.notify(check))
+
+    def deliver(self, checks, send):
+        """ Call `send` until it succeeds, at most 3 times, and record the
+        outcome for each of `checks`. Return the error. """
+
         # Make 3 attempts--
-        for x in range(0, 3):
-            error = self.transport.notify(check) or ""
-            if error in ("", "no-op"):
-                break  # Success!
+        with metrics.DELIVERY.time(transport=self.kind):
+            for x in range(0, 3):
+                error = send() or ""
+                if error in ("", "no-op"):
+                    break  # Success!
+
+        if error not in ("", "no-op"):
+            metrics.DELIVERY_ERRORS.inc(transport=self.kind)
 
         if error != "no-op":
-            n = Notification(owner=check, channel=self)
-            n.check_status = check.status
-            n.error = error
-            n.save()
+            for check in checks:
+                self.save_notification(check, error)
 
         return error
 
+    def save_notification(self, check, error):
+        n = Notification(owner=check, channel=self)
+        n.check_status = check.status
+        n.error = error
+        n.save()
+
     def test(self):
         return self.transport().test()
 
@@ -282,9 +369,54 @@ class Channel(models.Model):
 class Notification(models.Model):
 	class Meta:
 		get_latest_by = "created"
+		# For latest_notification() and prunenotifications
+		index_together = (("channel", "created"), )
 
 	owner = models.ForeignKey(Check)
 	check_status = models.CharField(max_length=6)
 	channel = models.ForeignKey(Channel)
 	created = models.DateTimeField(auto_now_add=True)
 	error = models.CharField(max_length=200, blank=True)
+
+
+class Flip(models.Model):
+    """ A status change which needs alerts sent out.
+
+    The ping path creates these instead of sending alerts itself, so ping
+    latency doesn't depend on the notification channels. `sendalerts`
+    delivers them and sets `processed`.
+
+    """
+
+    owner = models.ForeignKey(Check)
+    created = models.DateTimeField(default=timezone.now)
+    processed = models.DateTimeField(null=True, blank=True, db_index=True)
+    new_status = models.CharField(max_length=6, choices=STATUSES)
+
+    def send_alerts(self):
+        """ Notify the owner's channels with the status from this flip. """
+
+        check = self.owner
+        check.status = self.new_status
+        return check.send_alert()
+
+
+class OutboxEntry(models.Model):
+    """ A notification waiting to be sent, see hc.api.outbox.
+
+    `key` identifies the alert, so queueing the same alert twice only
+    creates one entry. `next_attempt` is when the entry is next due, None
+    once it is sent or given up on. While a worker is sending it, it is
+    pushed into the future, so other workers leave it alone, and it comes
+    due again if the worker dies.
+
+    """
+
+    owner = models.ForeignKey(Check)
+    channel = models.ForeignKey(Channel)
+    check_status = models.CharField(max_length=6)
+    key = models.CharField(max_length=40, unique=True)
+    created = models.DateTimeField(default=timezone.now)
+    next_attempt = models.DateTimeField(default=timezone.now, null=True,
+                                        db_index=True)
+    attempts = models.IntegerField(default=0)
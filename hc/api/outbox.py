@@ -0,0 +1,155 @@
+""" Database-backed outbox for notifications.
+
+`Channel.notify` tries a channel three times in a row, in the thread that
+handles the alert, and drops the alert after that. With `sendalerts
+--outbox`, alerts are instead queued as `OutboxEntry` rows, one per check
+and channel, and sent by `send` one attempt at a time. A failed attempt
+is retried after a delay that doubles each time (OUTBOX_BACKOFF up to
+OUTBOX_MAX_BACKOFF seconds, randomized so retries to one endpoint don't
+bunch up). After OUTBOX_MAX_AGE seconds the alert is given up on. Every
+attempt is recorded as a `Notification`.
+
+Entries stay in the table for OUTBOX_MAX_AGE seconds after they are done,
+so queueing an alert again, e.g. after a crash, doesn't send it twice.
+Because entries are claimed with a conditional UPDATE, several sendalerts
+processes can drain the same outbox, and alerts queued before a restart
+are sent after it.
+
+"""
+
+import hashlib
+import random
+from datetime import timedelta as td
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Min
+from django.utils import timezone
+from hc.api import metrics
+from hc.api.models import Notification, OutboxEntry
+
+# Time a worker has for one attempt before the entry is due again
+LEASE = td(minutes=2)
+
+# Entries to claim at a time
+BATCH = 100
+
+
+def make_key(check, channel, event):
+    raw = "%s:%s:%s:%s" % (check.code, channel.code, check.status, event)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def enqueue(check, event):
+    """ Queue alerts about the current status of `check` to all of its
+    channels. `event` tells this alert apart from earlier alerts with the
+    same status, e.g. the time of the status change. """
+
+    entries = [OutboxEntry(owner=check, channel=channel,
+                           check_status=check.status,
+                           key=make_key(check, channel, event))
+               for channel in check.channel_set.all()]
+
+    keys = [entry.key for entry in entries]
+    q = OutboxEntry.objects.filter(key__in=keys)
+    existing = set(q.values_list("key", flat=True))
+    entries = [entry for entry in entries if entry.key not in existing]
+
+    try:
+        with transaction.atomic():
+            OutboxEntry.objects.bulk_create(entries)
+    except IntegrityError:
+        # Another process queued some of them in the meantime
+        for entry in entries:
+            try:
+                with transaction.atomic():
+                    entry.save()
+            except IntegrityError:
+                pass
+
+
+def backoff(attempts):
+    """ Return the delay after the given number of failed attempts. """
+
+    ceiling = min(settings.OUTBOX_BACKOFF * 2 ** (attempts - 1),
+                  settings.OUTBOX_MAX_BACKOFF)
+    return td(seconds=random.uniform(ceiling / 2, ceiling))
+
+
+def expire(now):
+    """ Give up on entries older than OUTBOX_MAX_AGE, and forget entries
+    which have been done for that long. """
+
+    cutoff = now - td(seconds=settings.OUTBOX_MAX_AGE)
+    stale = OutboxEntry.objects.filter(created__lt=cutoff)
+    stale.filter(next_attempt=None).delete()
+
+    notifications = []
+    for entry in stale.filter(next_attempt__lte=now):
+        q = OutboxEntry.objects.filter(id=entry.id,
+                                       next_attempt=entry.next_attempt)
+        if q.update(next_attempt=None):
+            error = "Gave up after %d attempts" % entry.attempts
+            notifications.append(Notification(owner_id=entry.owner_id,
+                                              channel_id=entry.channel_id,
+                                              check_status=entry.check_status,
+                                              error=error))
+
+    Notification.objects.bulk_create(notifications)
+
+
+def claim(now, limit=BATCH):
+    """ Claim up to `limit` due entries for this process. """
+
+    q = OutboxEntry.objects.filter(next_attempt__lte=now)
+    q = q.order_by("next_attempt").values_list("id", "next_attempt")
+
+    ids = []
+    for entry_id, next_attempt in q[:limit]:
+        # Fails if another process claimed it first
+        q = OutboxEntry.objects.filter(id=entry_id, next_attempt=next_attempt)
+        if q.update(next_attempt=now + LEASE):
+            ids.append(entry_id)
+
+    q = OutboxEntry.objects.filter(id__in=ids)
+    return list(q.select_related("owner", "owner__user", "channel"))
+
+
+def due(now):
+    """ Expire old entries, then claim and return due ones. """
+
+    expire(now)
+    return claim(now)
+
+
+def next_due():
+    """ Return when the next entry is due, None if there are none. """
+
+    q = OutboxEntry.objects.exclude(next_attempt=None)
+    return q.aggregate(Min("next_attempt"))["next_attempt__min"]
+
+
+def send(entry):
+    """ Make one attempt at sending a claimed entry and record the
+    outcome. Return the error, or "" on success. """
+
+    check, channel = entry.owner, entry.channel
+    check.status = entry.check_status
+
+    with metrics.DELIVERY.time(transport=channel.kind):
+        error = channel.transport.notify(check) or ""
+
+    if error != "no-op":
+        channel.save_notification(check, error)
+
+    entry.attempts += 1
+    entry.next_attempt = None
+    if error not in ("", "no-op"):
+        retry = timezone.now() + backoff(entry.attempts)
+        if retry < entry.created + td(seconds=settings.OUTBOX_MAX_AGE):
+            entry.next_attempt = retry
+        else:
+            metrics.DELIVERY_ERRORS.inc(transport=channel.kind)
+
+    entry.save(update_fields=("attempts", "next_attempt"))
+    return error
@@ -0,0 +1,760 @@
+""" Write path for incoming pings.
+
+A ping touches two tables: it bumps the counters on its `api_check` row and
+adds a row to `api_ping`. `update_check` does the first part with a single
+conditional UPDATE which also hands back the values the `Ping` insert needs,
+so a regular ping costs two statements. Alerts for early pings are only
+queued here, as `Flip` rows, and sent out by `sendalerts`.
+
+The `api_ping` insert itself can be deferred: with PING_WRITE_MODE set to
+"buffered" or "spool", `save_ping` queues rows in a `PingBuffer` which
+writes them out in batches.
+
+Pings which arrive outside of HTTP (see hc.api.listener) go through
+`record_many` instead, which records a whole batch of pings for many checks
+with a fixed number of statements. `PingBatcher` collects those batches.
+
+With PING_STORAGE set to "ring", all of these paths write through
+`insert_pings`, which upserts each ping into slot `n % ping_log_limit` of
+its check instead of adding a row, so a check never has more than
+`ping_log_limit` pings stored. Ring storage relies on a unique index on
+(owner_id, slot), which a partitioned api_ping (see the partitionpings
+command) can't have, so the two can't be used together.
+
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import timedelta as td
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from hc.api.cache import CachedCheck, check_cache
+from hc.api.coalesce import COALESCED, THROTTLED, get_coalescer
+from hc.api.models import (METHOD_CODES, SCHEME_CODES, Check, Flip, Ping,
+                           UserAgent)
+
+logger = logging.getLogger(__name__)
+
+# Is the ping arriving before the previous one's period minus grace is over?
+EARLY_SQL = {
+    "postgresql": "last_ping + timeout - grace > %s",
+    "mysql": "last_ping + INTERVAL (timeout - grace) MICROSECOND > %s",
+    "sqlite": "(julianday(last_ping) - julianday(%s)) * 86400000000.0"
+              " + timeout - grace > 0"
+}
+
+# "status" is assigned first: MySQL evaluates SET clauses left to right
+# and would otherwise see the new last_ping.
+UPDATE_SQL = """
+UPDATE api_check
+SET
+    status = CASE
+        WHEN status IN ('new', 'paused') THEN 'up'
+        WHEN {early} THEN 'fast'
+        WHEN status = 'fast' THEN 'up'
+        ELSE status
+    END,
+    n_pings = n_pings + 1,
+    last_ping = %s
+WHERE {where}"""
+
+COLUMNS = "id, n_pings, status, user_id, timeout, grace, store_client_info"
+
+RETURNING_SQL = " RETURNING " + COLUMNS
+
+SELECT_SQL = "SELECT " + COLUMNS + " FROM api_check WHERE {where}"
+
+
+class Throttled(Exception):
+    pass
+
+
+def update_check(code, now):
+    """ Record a ping against the check's row.
+
+    Return (id, n_pings, status, store_client_info) as they are after the
+    update, or None if there is no check with the given code.
+
+    PostgreSQL and SQLite do this in one UPDATE ... RETURNING statement.
+    MySQL has no RETURNING, so there the row is read back inside the same
+    transaction. If the code is in `check_cache`, the row is matched by
+    primary key instead of the code index.
+
+    """
+
+    cached = check_cache.get(code)
+    if cached:
+        where, key = "id = %s", cached.id
+    else:
+        field = Check._meta.get_field("code")
+        where, key = "code = %s", field.get_db_prep_value(code, connection)
+
+    field = Check._meta.get_field("last_ping")
+    params = [field.get_db_prep_value(now, connection)] * 2 + [key]
+    sql = UPDATE_SQL.format(early=EARLY_SQL[connection.vendor], where=where)
+
+    if connection.vendor == "mysql":
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            cursor.execute(SELECT_SQL.format(where=where), [key])
+            row = cursor.fetchone()
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute(sql + RETURNING_SQL, params)
+            rows = cursor.fetchall()
+            row = rows[0] if rows else None
+
+    if row is None:
+        check_cache.invalidate(code)
+        return None
+
+    check_id, n_pings, status, user_id, timeout, grace, store_info = row
+    if not connection.features.has_native_duration_field:
+        timeout, grace = td(microseconds=timeout), td(microseconds=grace)
+
+    entry = CachedCheck(check_id, user_id, status, timeout, grace, now)
+    check_cache.put(code, entry)
+
+    return check_id, n_pings, status, bool(store_info)
+
+
+def record(code, meta):
+    """ Handle a ping received over HTTP(S).
+
+    `meta` is a Django request's META or, equivalently, a WSGI environ.
+    Return False if there is no check with the given code. Raise
+    Throttled if the check is over PING_RATE_LIMIT.
+
+    """
+
+    if settings.PING_COALESCE_WINDOW or settings.PING_RATE_LIMIT:
+        verdict = get_coalescer().hit(code)
+        if verdict == THROTTLED:
+            raise Throttled()
+        if verdict == COALESCED:
+            return True
+
+    row = update_check(code, timezone.now())
+    if settings.PING_COALESCE_WINDOW or settings.PING_RATE_LIMIT:
+        if row is None:
+            get_coalescer().forget(code)
+        else:
+            get_coalescer().add(code)
+
+    if row is None:
+        return False
+
+    check_id, n_pings, status, store_client_info = row
+
+    ping = ping_from_meta(meta)
+    ping.owner_id = check_id
+    ping.n = n_pings
+    if not store_client_info:
+        forget_client(ping)
+    save_ping(ping)
+
+    if status == "fast":
+        alert_fast(check_id)
+
+    return True
+
+
+def record_many(items, user=None):
+    """ Record a batch of pings with set-based SQL.
+
+    `items` is a list of (code, ping) pairs, where `code` is a UUID and
+    `ping` an unsaved Ping with its `created` time set. Pings whose code
+    matches no check (or no check of `user`, if given) are skipped.
+
+    The checks are read and locked with one SELECT, updated with one
+    UPDATE, and the pings are written with one bulk INSERT. Checks which
+    end up "fast" get their alerts queued with one more INSERT.
+
+    Return a list with a result for each item, in order: the check's
+    (id, n_pings, status) as they are after the update, or None if the
+    code matched no check.
+
+    """
+
+    codes = set(code for code, ping in items)
+    # Before the transaction, so that no UserAgent id gets cached from
+    # a transaction which then rolls back
+    for code, ping in items:
+        compact(ping)
+    fields = ("id", "code", "n_pings", "last_ping", "status", "timeout",
+              "grace", "store_client_info")
+
+    with transaction.atomic():
+        q = Check.objects.select_for_update().filter(code__in=codes)
+        if user is not None:
+            q = q.filter(user=user)
+
+        checks = {}
+        for check in q.order_by("id").values(*fields):
+            checks[check["code"]] = check
+
+        if not checks:
+            return [None] * len(items)
+
+        # Pings older than the check's last_ping still count and get
+        # logged, but don't move last_ping or status back in time
+        batch = []
+        for code, ping in sorted(items, key=lambda item: item[1].created):
+            check = checks.get(code)
+            if check is None:
+                continue
+
+            check["n_pings"] += 1
+            ping.owner_id = check["id"]
+            ping.n = check["n_pings"]
+            if not check["store_client_info"]:
+                forget_client(ping)
+            batch.append(ping)
+
+            if check["last_ping"] is None or check["last_ping"] < ping.created:
+                check["status"] = next_status(check, ping.created)
+                check["last_ping"] = ping.created
+
+        def case(name):
+            field = Check._meta.get_field(name)
+            whens = [When(id=c["id"], then=Value(c[name], output_field=field))
+                     for c in checks.values()]
+            return Case(*whens, output_field=field)
+
+        ids = [check["id"] for check in checks.values()]
+        Check.objects.filter(id__in=ids).update(n_pings=case("n_pings"),
+                                                last_ping=case("last_ping"),
+                                                status=case("status"))
+        insert_pings(batch)
+
+        flips = [Flip(owner_id=c["id"], new_status="fast")
+                 for c in checks.values() if c["status"] == "fast"]
+        if flips:
+            Flip.objects.bulk_create(flips)
+
+    for code in checks:
+        check_cache.invalidate(code)
+
+    results = []
+    for code, ping in items:
+        c = checks.get(code)
+        if c is None:
+            results.append(None)
+        else:
+            results.append((c["id"], c["n_pings"], c["status"]))
+    return results
+
+
+def next_status(check, now):
+    """ Python version of the status transition in UPDATE_SQL.
+
+    `check` is a dict with the check's current status, last_ping, timeout
+    and grace.
+
+    """
+
+    if check["status"] in ("new", "paused"):
+        return "up"
+
+    last_ping = check["last_ping"]
+    if last_ping and last_ping + check["timeout"] - check["grace"] > now:
+        return "fast"
+
+    if check["status"] == "fast":
+        return "up"
+
+    return check["status"]
+
+
+def alert_fast(check_id):
+    """ The ping came in too early, queue the alert for sendalerts. """
+
+    Flip.objects.create(owner_id=check_id, new_status="fast")
+
+
+def ping_from_meta(meta):
+    """ Return an unsaved Ping filled in from request headers.
+
+    `meta` is a Django request's META or, equivalently, a WSGI environ.
+
+    """
+
+    ping = Ping()
+    remote_addr = meta.get("HTTP_X_FORWARDED_FOR", meta["REMOTE_ADDR"])
+    ping.remote_addr = remote_addr.split(",")[0]
+    ping.scheme = meta.get("HTTP_X_FORWARDED_PROTO", "http")
+    ping.method = meta["REQUEST_METHOD"]
+    # If User-Agent is longer than 200 characters, truncate it:
+    ping.ua = meta.get("HTTP_USER_AGENT", "")[:200]
+    return ping
+
+
+def forget_client(ping):
+    """ Drop the client's details, for checks with store_client_info off. """
+
+    ping.remote_addr = None
+    ping.ua = ""
+    ping.user_agent = None
+
+
+USER_AGENT_CACHE_SIZE = 10000
+_user_agent_ids = {}
+
+
+def user_agent_id(value):
+    """ Return the id of the UserAgent row for `value`, creating it if
+    needed. Lookups are cached per process. """
+
+    ua_id = _user_agent_ids.get(value)
+    if ua_id is None:
+        ua_id = UserAgent.objects.get_or_create(value=value)[0].id
+        if len(_user_agent_ids) >= USER_AGENT_CACHE_SIZE:
+            _user_agent_ids.clear()
+        _user_agent_ids[value] = ua_id
+
+    return ua_id
+
+
+def compact(ping):
+    """ With PING_COMPACT on, move the ping's scheme, method and user agent
+    to the compact columns. Values without a code stay where they are. """
+
+    if not settings.PING_COMPACT:
+        return ping
+
+    if ping.scheme in SCHEME_CODES:
+        ping.scheme_code = SCHEME_CODES[ping.scheme]
+        ping.scheme = ""
+
+    if ping.method in METHOD_CODES:
+        ping.method_code = METHOD_CODES[ping.method]
+        ping.method = ""
+
+    if ping.ua:
+        ping.user_agent_id = user_agent_id(ping.ua)
+        ping.ua = ""
+
+    return ping
+
+
+# The slot is worked out in SQL so that concurrent writers, and changes
+# to the account's ping_log_limit, don't need a lookup first
+UPSERT_SQL = """
+INSERT INTO api_ping (owner_id, slot, {columns})
+VALUES (%s, %s %% COALESCE((
+    SELECT p.ping_log_limit
+    FROM api_check c
+    JOIN accounts_profile p ON p.user_id = c.user_id
+    WHERE c.id = %s), %s), {placeholders})
+"""
+
+# The conflict target names the partial index from migration 0039
+UPSERT_CONFLICT_SQL = {
+    "postgresql": "ON CONFLICT (owner_id, slot) WHERE slot IS NOT NULL "
+                  "DO UPDATE SET {assignments}",
+    "sqlite": "ON CONFLICT (owner_id, slot) WHERE slot IS NOT NULL "
+              "DO UPDATE SET {assignments}",
+    "mysql": "ON DUPLICATE KEY UPDATE {assignments}"
+}
+
+UPSERT_ASSIGNMENT = {
+    "postgresql": "{column} = excluded.{column}",
+    "sqlite": "{column} = excluded.{column}",
+    "mysql": "{column} = VALUES({column})"
+}
+
+UPSERT_COLUMNS = ("n", "created", "scheme", "remote_addr", "method", "ua",
+                  "scheme_code", "method_code", "user_agent_id")
+
+
+def is_partitioned(cursor):
+    """ Has partitionpings turned api_ping into a partitioned table? """
+
+    if connection.vendor != "postgresql":
+        return False
+
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = 'api_ping'")
+    row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+# Whether api_ping can take ring storage upserts, looked up once
+_ring_supported = None
+
+
+def check_ring_storage():
+    """ Raise ImproperlyConfigured if api_ping is partitioned. """
+
+    global _ring_supported
+
+    if _ring_supported is None:
+        with connection.cursor() as cursor:
+            _ring_supported = not is_partitioned(cursor)
+
+    if not _ring_supported:
+        raise ImproperlyConfigured("PING_STORAGE = \"ring\" needs a unique "
+                                   "index which a partitioned api_ping "
+                                   "can't have")
+
+
+def upsert_pings(pings):
+    """ Write each ping over the oldest one in its check's ring. """
+
+    from hc.accounts.models import Profile
+
+    vendor = connection.vendor
+    assignment = UPSERT_ASSIGNMENT[vendor]
+    placeholders = ", ".join(["%s"] * len(UPSERT_COLUMNS))
+    sql = UPSERT_SQL.format(columns=", ".join(UPSERT_COLUMNS),
+                            placeholders=placeholders)
+    sql += UPSERT_CONFLICT_SQL[vendor].format(assignments=", ".join(
+        assignment.format(column=column) for column in UPSERT_COLUMNS))
+
+    # Checks without an owner get the default ring size
+    default_limit = Profile._meta.get_field("ping_log_limit").default
+    fields = [Ping._meta.get_field(column.replace("_id", ""))
+              for column in UPSERT_COLUMNS]
+
+    rows = []
+    # Later pings for the same slot must win
+    for ping in sorted(pings, key=lambda ping: ping.n):
+        values = [f.get_db_prep_save(getattr(ping, f.attname), connection)
+                  for f in fields]
+        rows.append([ping.owner_id, ping.n, ping.owner_id, default_limit] +
+                    values)
+
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def insert_pings(pings):
+    """ Store a batch of pings, per PING_STORAGE. """
+
+    if settings.PING_STORAGE == "ring":
+        check_ring_storage()
+        upsert_pings(pings)
+    else:
+        Ping.objects.bulk_create(pings)
+
+
+def save_ping(ping):
+    """ Write `ping` to the database now or queue it, per PING_WRITE_MODE. """
+
+    compact(ping)
+    if settings.PING_STORAGE == "ring":
+        check_ring_storage()
+
+    if settings.PING_WRITE_MODE == "sync":
+        if settings.PING_STORAGE == "ring":
+            upsert_pings([ping])
+        else:
+            ping.save()
+    else:
+        get_buffer().add(ping)
+
+
+def database_reachable():
+    """ Can the database still run queries? """
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        return True
+    except Exception:
+        return False
+
+
+def requeue(queue, items):
+    """ Put `items` back at the head of `queue.pending`. Past `queue.limit`
+    items, drop the oldest ones. """
+
+    with queue.lock:
+        queue.pending = items + queue.pending
+        excess = len(queue.pending) - (queue.limit or len(queue.pending))
+        if excess > 0:
+            logger.error("Queue full, dropped %d pings", excess)
+            del queue.pending[:excess]
+
+
+def write_batch(queue, write, batch):
+    """ Call `write` with `batch` and return the list of its results.
+
+    If that fails while the database is reachable, a row is more likely at
+    fault than the database: write the rows one at a time, and drop those
+    which fail, so that one bad row can't hold back the others. Otherwise
+    put the unwritten items back into `queue` and raise.
+
+    """
+
+    try:
+        return [write(batch)]
+    except Exception:
+        if len(batch) == 1 or not database_reachable():
+            requeue(queue, batch)
+            raise
+        logger.exception("Could not write %d pings, trying one at a time",
+                         len(batch))
+
+    results = []
+    for i, item in enumerate(batch):
+        try:
+            results.append(write([item]))
+        except Exception:
+            if not database_reachable():
+                requeue(queue, batch[i:])
+                raise
+            logger.exception("Dropped a ping which could not be written")
+
+    return results
+
+
+class PingBuffer(object):
+    """ In-process queue of unsaved pings, inserted with bulk_create.
+
+    A background thread flushes the queue when it reaches `size` rows and
+    at least every `interval` seconds. If `spool_path` is set, queued rows
+    are also appended to that file, and a buffer left over from a previous
+    process gets replayed by `start`. While the database is down, at most
+    `limit` rows are kept. The queue is flushed at exit and, if `start`
+    runs in the main thread, on SIGTERM.
+
+    """
+
+    def __init__(self, size, interval, spool_path=None, limit=None):
+        self.size = size
+        self.interval = interval
+        self.spool_path = spool_path
+        self.limit = limit
+
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = []
+        self.spool = None
+        # Spool files whose rows are in flight or waiting for a retry
+        self.spooled = []
+        self.thread = None
+        self.previous_handler = None
+
+    def start(self):
+        if self.spool_path:
+            self.replay()
+
+        self.thread = threading.Thread(target=self.run, name="ping-buffer")
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.flush)
+        if threading.current_thread() is threading.main_thread():
+            self.previous_handler = signal.signal(signal.SIGTERM,
+                                                  self.terminate)
+
+    def terminate(self, signum, frame):
+        """ SIGTERM handler: flush, then let the signal take its course.
+        atexit functions don't run when a signal kills the process. """
+
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not flush %d pings", len(self.pending))
+
+        previous = self.previous_handler
+        if callable(previous):
+            previous(signum, frame)
+        elif previous != signal.SIG_IGN:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not flush %d pings", len(self.pending))
+                # Reconnect on the next attempt
+                connection.close()
+
+    def add(self, ping):
+        with self.lock:
+            if self.spool_path:
+                if self.spool is None:
+                    self.spool = open(self.spool_path, "a")
+                self.spool.write(json.dumps(ping_to_dict(ping)) + "\n")
+                self.spool.flush()
+
+            self.pending.append(ping)
+            if len(self.pending) >= self.size:
+                self.wakeup.set()
+
+    def flush(self):
+        """ Insert all queued pings. Return the number of rows written. """
+
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+                if self.spool is not None:
+                    self.spool.close()
+                    self.spool = None
+                    # New pings go to a fresh file while this batch is written
+                    rotated = "%s.%d" % (self.spool_path, time.time() * 1000)
+                    os.rename(self.spool_path, rotated)
+                    self.spooled.append(rotated)
+
+            if not batch:
+                return 0
+
+            # Django picks the largest batch the backend allows
+            n = sum(write_batch(self, self.write, batch))
+
+            for path in self.spooled:
+                os.remove(path)
+            self.spooled = []
+
+            return n
+
+    def write(self, pings):
+        insert_pings(pings)
+        return len(pings)
+
+    def replay(self):
+        """ Queue the pings left over in spool files by a previous run. """
+
+        for path in sorted(glob.glob(self.spool_path + "*")):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        doc = json.loads(line)
+                    except ValueError:
+                        # Partial last line from a crash mid-write
+                        continue
+                    self.pending.append(ping_from_dict(doc))
+
+            self.spooled.append(path)
+
+        self.flush()
+
+
+class PingBatcher(object):
+    """ In-process queue of (code, ping) pairs, recorded with `record_many`.
+
+    Used by the socket listeners, which take in pings for many checks at
+    a high rate. A background thread records the queue when it reaches
+    `size` pings and at least every `interval` seconds. While the database
+    is down, at most `limit` pings are kept.
+
+    """
+
+    def __init__(self, size, interval, limit=None):
+        self.size = size
+        self.interval = interval
+        self.limit = limit
+
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = []
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="ping-batcher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not record %d pings",
+                                 len(self.pending))
+                # Reconnect on the next attempt
+                connection.close()
+
+    def add(self, code, ping):
+        with self.lock:
+            self.pending.append((code, ping))
+            if len(self.pending) >= self.size:
+                self.wakeup.set()
+
+    def flush(self):
+        """ Record all queued pings. Return a dict which maps the codes of
+        the recorded ones to the result of `record_many`. """
+
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+
+            if not batch:
+                return {}
+
+            def write(items):
+                recorded = zip(items, record_many(items))
+                return {code: found for (code, ping), found in recorded
+                        if found is not None}
+
+            result = {}
+            for recorded in write_batch(self, write, batch):
+                result.update(recorded)
+            return result
+
+
+def ping_to_dict(ping):
+    return {
+        "owner_id": ping.owner_id,
+        "n": ping.n,
+        "created": ping.created.isoformat(),
+        "scheme": ping.scheme,
+        "remote_addr": ping.remote_addr,
+        "method": ping.method,
+        "ua": ping.ua,
+        "scheme_code": ping.scheme_code,
+        "method_code": ping.method_code,
+        "user_agent_id": ping.user_agent_id
+    }
+
+
+def ping_from_dict(doc):
+    doc = dict(doc)
+    doc["created"] = parse_datetime(doc["created"])
+    return Ping(**doc)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """ Return this process's PingBuffer, starting it on first use. """
+
+    global _buffer
+
+    if settings.PING_STORAGE == "ring":
+        check_ring_storage()
+
+    with _buffer_lock:
+        if _buffer is None:
+            spool_path = None
+            if settings.PING_WRITE_MODE == "spool":
+                spool_path = settings.PING_SPOOL_PATH
+
+            _buffer = PingBuffer(settings.PING_BUFFER_SIZE,
+                                 settings.PING_BUFFER_INTERVAL / 1000.0,
+                                 spool_path, settings.PING_BUFFER_LIMIT)
+            _buffer.start()
+
+    return _buffer
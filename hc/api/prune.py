@@ -0,0 +1,183 @@
+""" Ping pruning in bounded batches.
+
+`Pruner` walks the `api_ping` table by primary key range and deletes the
+pings which are beyond their account's `ping_log_limit`, one DELETE per
+range of `chunk` ids. With ring storage, rows in slots beyond a lowered
+`ping_log_limit` are never overwritten again, and are deleted too. After
+each batch it sleeps as long as needed to stay under `max_rate` deleted
+rows per second, and records how far it got in a checkpoint file, so a
+later run can pick up where an interrupted one stopped. The id range can
+be split between several worker threads, each with its own database
+connection.
+
+With PING_ARCHIVE_DIR set, each batch is copied to the ping archive (see
+hc.api.archive) before it is deleted, and the segments of the archived
+checks are compacted at the end of the run.
+
+"""
+
+import json
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Max, Q
+from hc.api import archive
+from hc.api.models import Ping
+
+# Ids per DELETE when deleting archived pings, below SQLite's
+# limit on query parameters
+DELETE_BATCH = 500
+
+
+def prune_range(lo, hi, archived=None):
+    """ Delete the prunable pings with ids in [lo, hi). Return the number
+    of pings deleted. Add the codes of archived checks to `archived`. """
+
+    q = Ping.objects.filter(id__gte=lo, id__lt=hi, n__gt=0)
+    q = q.annotate(limit=F("owner__user__profile__ping_log_limit"))
+    q = q.filter(Q(n__lt=F("owner__n_pings") - F("limit")) |
+                 Q(slot__gte=F("limit")))
+    if not settings.PING_ARCHIVE_DIR:
+        n_pruned, _ = q.delete()
+        return n_pruned
+
+    # Only delete what made it to the archive, more pings can become
+    # prunable in the meantime
+    values = list(q.values(*archive.FIELDS))
+    codes = archive.archive_pings(values)
+    if archived is not None:
+        archived.update(codes)
+
+    n_pruned = 0
+    ids = [v["id"] for v in values]
+    for i in range(0, len(ids), DELETE_BATCH):
+        n, _ = Ping.objects.filter(id__in=ids[i:i + DELETE_BATCH]).delete()
+        n_pruned += n
+
+    return n_pruned
+
+
+def split(lo, hi, n):
+    """ Split [lo, hi) into up to `n` contiguous [lo, hi) ranges. """
+
+    step = max(1, -(-(hi - lo) // n))
+    return [[i, min(i + step, hi)] for i in range(lo, hi, step)]
+
+
+class Pruner(object):
+    """ Deletes prunable pings, `chunk` ids at a time.
+
+    `max_rate` is in deleted rows per second, 0 means no limit.
+    `checkpoint` is the path of a JSON file to keep progress in, None means
+    no checkpointing. `log` is called with a line of text after each batch.
+
+    """
+
+    def __init__(self, chunk, max_rate=0, checkpoint=None, workers=1,
+                 log=None):
+        self.chunk = chunk
+        self.max_rate = max_rate
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.log = log or (lambda line: None)
+        self.lock = threading.Lock()
+        self.ranges = []
+        self.n_pruned = 0
+        self.n_pruned_now = 0
+        self.started = None
+        # Checks with newly archived pings
+        self.archived = set()
+
+    def load(self):
+        """ Return the ranges left to do, from the checkpoint file or from
+        the current extent of the table. """
+
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as f:
+                doc = json.load(f)
+            self.n_pruned = doc["pruned"]
+            return [r for r in doc["ranges"] if r[0] < r[1]]
+
+        max_id = Ping.objects.aggregate(Max("id"))["id__max"]
+        if max_id is None:
+            return []
+
+        return split(0, max_id + 1, self.workers)
+
+    def save(self):
+        if not self.checkpoint:
+            return
+
+        tmp_path = self.checkpoint + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"ranges": self.ranges, "pruned": self.n_pruned}, f)
+        os.replace(tmp_path, self.checkpoint)
+
+    def rate(self):
+        elapsed = time.time() - self.started
+        return self.n_pruned_now / elapsed if elapsed > 0 else 0.0
+
+    def work(self, r):
+        """ Prune the range `r`, advancing r[0] as batches complete. """
+
+        # Each worker gets an equal share of the rate limit
+        max_rate = self.max_rate / float(self.workers)
+        while r[0] < r[1]:
+            start = time.time()
+            lo, hi = r[0], min(r[0] + self.chunk, r[1])
+            archived = set()
+            n = prune_range(lo, hi, archived)
+
+            with self.lock:
+                r[0] = hi
+                self.archived |= archived
+                self.n_pruned += n
+                self.n_pruned_now += n
+                self.save()
+                self.log("Pruned %d pings in ids %d-%d, %.1f rows/s" %
+                         (n, lo, hi, self.rate()))
+
+            if max_rate and n:
+                time.sleep(max(0, n / max_rate - (time.time() - start)))
+
+    def work_in_thread(self, r):
+        try:
+            self.work(r)
+        finally:
+            connection.close()
+
+    def run(self):
+        """ Prune all ranges. Return the total number of pings pruned,
+        including any pruned before the checkpoint. """
+
+        # SQLite takes a database-wide write lock, parallel
+        # workers would only wait on each other
+        if connection.vendor == "sqlite":
+            self.workers = 1
+
+        self.ranges = self.load()
+        self.started = time.time()
+
+        if len(self.ranges) == 1 or self.workers == 1:
+            for r in self.ranges:
+                self.work(r)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self.work_in_thread, r)
+                           for r in self.ranges]
+                for future in futures:
+                    future.result()
+
+        n_merged = sum(archive.compact(code) for code in self.archived)
+        if n_merged:
+            self.log("Merged %d archive segments of %d checks" %
+                     (n_merged, len(self.archived)))
+
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+        return self.n_pruned
@@ -0,0 +1,234 @@
+""" Deadline-driven scheduling for sendalerts.
+
+Instead of running the going_down, going_up and need_nagging queries every
+second, `AlertScheduler` keeps a min-heap of the next moment each check
+needs attention and sleeps until the earliest one. The heap learns about
+changed checks from PostgreSQL notifications (with ALERT_SCHEDULER_NOTIFY,
+see the ensuretriggers command) or otherwise from a poll for down checks
+which got pinged. Deadlines are verified against the database before a
+check is handed out, so a deadline which has since moved later only costs
+a lookup, and neither reports such changes.
+While the poll finds nothing, its interval doubles up to `max_poll`.
+The whole heap is rebuilt every `resync` seconds, which also bounds the
+delay for changes the change feed doesn't see.
+
+"""
+
+import heapq
+import select
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from hc.api.metrics import TICK_QUERY
+from hc.api.models import Check, Flip
+
+CHECK_CHANNEL = "api_check"
+FLIP_CHANNEL = "api_flip"
+
+# Checks to load per query
+ID_BATCH = 500
+
+FIELDS = ("id", "user_id", "status", "alert_after", "nag_status", "nag_after")
+
+
+def next_deadline(check, now):
+    """ Return when `check` next needs sendalerts' attention, None if only
+    a ping can make it need attention. Matches the going_down, going_up and
+    need_nagging queries in sendalerts. """
+
+    if check.user_id is None or check.alert_after is None:
+        return None
+
+    if check.status == "up":
+        return check.alert_after
+
+    if check.status == "down":
+        if check.alert_after > now:
+            # Pinged while down, going up now
+            return now
+        if check.nag_status and check.nag_after:
+            return check.nag_after
+
+    return None
+
+
+class AlertScheduler(object):
+    """ Tells sendalerts which checks are due and when.
+
+    `poll` is the fallback poll interval in seconds, which backs off to
+    `max_poll` while idle. On PostgreSQL it is only used after `listen`
+    fails.
+
+    """
+
+    def __init__(self, poll=1.0, resync=60, max_poll=10.0):
+        self.poll = poll
+        self.max_poll = max(poll, max_poll)
+        self.interval = poll
+        self.resync_interval = resync
+        self.heap = []
+        self.deadlines = {}
+        self.last_resync = None
+        self.listener = None
+        self.flips_pending = True
+
+    def push(self, check, now):
+        deadline = next_deadline(check, now)
+        if deadline is None:
+            self.deadlines.pop(check.id, None)
+            return
+
+        # Superseded heap entries are skipped when popped
+        self.deadlines[check.id] = deadline
+        heapq.heappush(self.heap, (deadline, check.id))
+
+    def load(self, ids):
+        """ Read the current deadlines of the given checks. """
+
+        ids, now = list(ids), timezone.now()
+        for i in range(0, len(ids), ID_BATCH):
+            q = Check.objects.filter(id__in=ids[i:i + ID_BATCH]).only(*FIELDS)
+            found = set()
+            for check in q.iterator():
+                self.push(check, now)
+                found.add(check.id)
+
+            # Deleted checks
+            for check_id in set(ids[i:i + ID_BATCH]) - found:
+                self.deadlines.pop(check_id, None)
+
+        if len(self.heap) > 2 * len(self.deadlines) + 1000:
+            self.heap = [(deadline, check_id)
+                         for check_id, deadline in self.deadlines.items()]
+            heapq.heapify(self.heap)
+
+    def resync(self):
+        """ Rebuild the heap from all checks which can need alerts. """
+
+        self.last_resync = time.time()
+        self.flips_pending = True
+
+        self.heap, self.deadlines, now = [], {}, timezone.now()
+        q = Check.objects.filter(user__isnull=False, status__in=("up", "down"))
+        for check in q.only(*FIELDS).iterator():
+            self.push(check, now)
+
+    def listen(self):
+        """ Subscribe to change notifications on a dedicated connection.
+        Return False if the database doesn't support them. """
+
+        if connection.vendor != "postgresql":
+            return False
+
+        if not settings.ALERT_SCHEDULER_NOTIFY:
+            # Nothing would send notifications, see ensuretriggers
+            return False
+
+        params = connection.get_connection_params()
+        self.listener = connection.get_new_connection(params)
+        self.listener.autocommit = True
+        with self.listener.cursor() as cursor:
+            cursor.execute("LISTEN %s" % CHECK_CHANNEL)
+            cursor.execute("LISTEN %s" % FLIP_CHANNEL)
+
+        return True
+
+    def changes(self, timeout):
+        """ Wait up to `timeout` seconds, return ids of changed checks. """
+
+        if self.listener is not None:
+            if select.select([self.listener], [], [], timeout)[0]:
+                self.listener.poll()
+
+            ids = set()
+            for notify in self.listener.notifies:
+                if notify.channel == FLIP_CHANNEL:
+                    self.flips_pending = True
+                else:
+                    ids.add(int(notify.payload))
+            del self.listener.notifies[:]
+            return ids
+
+        time.sleep(timeout)
+        self.flips_pending = True
+        # Pings of up checks only move their deadlines later. Pinged down
+        # checks are going up now. The rest waits for the next resync: the
+        # first ping of a new check, and edited timeouts.
+        q = Check.objects.filter(status="down", alert_after__gt=timezone.now())
+        ids = set(q.values_list("id", flat=True))
+        if ids:
+            self.interval = self.poll
+        else:
+            self.interval = min(self.interval * 2, self.max_poll)
+        return ids
+
+    def pop_due(self, now):
+        ids = set()
+        while self.heap and self.heap[0][0] <= now:
+            deadline, check_id = heapq.heappop(self.heap)
+            if self.deadlines.get(check_id) == deadline:
+                del self.deadlines[check_id]
+                ids.add(check_id)
+
+        return ids
+
+    def due_checks(self):
+        """ Return due checks, after verifying them against the database.
+        Checks whose deadlines have moved go back on the heap. """
+
+        ids, now = self.pop_due(timezone.now()), timezone.now()
+        if not ids:
+            return []
+
+        due = []
+        q = Check.objects.filter(id__in=ids).select_related("user")
+        for check in q:
+            deadline = next_deadline(check, now)
+            if deadline is not None and deadline <= now:
+                due.append(check)
+            else:
+                self.push(check, now)
+
+        return due
+
+    def due_flips(self):
+        if not self.flips_pending:
+            return []
+
+        self.flips_pending = False
+        flips = Flip.objects.filter(processed=None).select_related("owner")
+        flips = list(flips.order_by("id")[:100])
+        # There may be more
+        self.flips_pending = len(flips) == 100
+        return flips
+
+    def wait(self, timeout):
+        """ Block until checks or flips need handling, or for `timeout`
+        seconds. Return (checks, flips). """
+
+        give_up = time.time() + timeout
+        while True:
+            if self.last_resync is None or \
+                    time.time() - self.last_resync >= self.resync_interval:
+                self.resync()
+
+            with TICK_QUERY.time():
+                checks, flips = self.due_checks(), self.due_flips()
+
+            if checks or flips:
+                self.interval = self.poll
+            if checks or flips or time.time() >= give_up:
+                return checks, flips
+
+            sleep = give_up - time.time()
+            sleep = min(sleep, self.last_resync + self.resync_interval -
+                        time.time())
+            if self.listener is None:
+                sleep = min(sleep, self.interval)
+            if self.heap:
+                until = self.heap[0][0] - timezone.now()
+                sleep = min(sleep, until.total_seconds())
+
+            self.load(self.changes(max(0, sleep)))
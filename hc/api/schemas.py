@@ -8,3 +8,9 @@ check = {
         "channels": {"type": "string"}
     }
 }
+
+pings = {
+    "properties": {
+        "pings": {"type": "array", "maxItems": 1000}
+    }
+}
@@ -0,0 +1,159 @@
+""" A small SMTP server for email pings.
+
+Checks can be pinged by sending an email to `<code>@PING_EMAIL_DOMAIN`.
+This server implements just enough of SMTP to accept such emails: each
+RCPT TO address is checked before the client is allowed to send the
+message, so mail for unknown checks is refused without reading its body.
+The body itself is read and discarded.
+
+Accepted pings are queued in a `PingBatcher`. Recipient lookups run in
+`executor` so the event loop never waits on the database.
+
+"""
+
+import asyncio
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from hc.api.cache import check_cache
+from hc.api.models import Check, Ping
+
+# Seconds to wait for the client's next line
+TIMEOUT = 60
+
+
+def parse_recipient(arg):
+    """ Return the check code in a RCPT TO argument, or None. """
+
+    arg = arg.strip()
+    if arg.startswith("<"):
+        arg = arg[1:].split(">", 1)[0]
+    else:
+        arg = arg.split(" ", 1)[0]
+
+    local, _, domain = arg.rpartition("@")
+    if domain.lower() != settings.PING_EMAIL_DOMAIN.lower():
+        return None
+
+    try:
+        return uuid.UUID(local)
+    except ValueError:
+        return None
+
+
+def check_exists(code):
+    if check_cache.get(code):
+        return True
+
+    close_old_connections()
+    return Check.objects.filter(code=code).exists()
+
+
+class SMTPServer(object):
+
+    def __init__(self, batcher, executor, hostname=None):
+        self.batcher = batcher
+        self.executor = executor
+        self.hostname = hostname or settings.PING_EMAIL_DOMAIN
+
+    async def readline(self, reader):
+        """ Return the next line without its line ending, or None if the
+        client has gone away, is too slow or sent an overlong line. """
+
+        try:
+            line = await asyncio.wait_for(reader.readline(), TIMEOUT)
+        except (asyncio.TimeoutError, ValueError):
+            return None
+
+        if not line:
+            return None
+
+        return line.decode("latin-1").rstrip("\r\n")
+
+    async def read_data(self, reader):
+        """ Read and discard the message. Return False if the client
+        goes away before the terminating "." line. """
+
+        while True:
+            line = await self.readline(reader)
+            if line is None:
+                return False
+            if line == ".":
+                return True
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_event_loop()
+        peername = writer.get_extra_info("peername")
+        mail_from, recipients = None, []
+
+        def reply(code, text):
+            writer.write(("%d %s\r\n" % (code, text)).encode())
+
+        reply(220, "%s ESMTP" % self.hostname)
+        try:
+            while True:
+                line = await self.readline(reader)
+                if line is None:
+                    break
+
+                verb, _, arg = line.partition(" ")
+                verb = verb.upper()
+                if verb in ("HELO", "EHLO"):
+                    mail_from, recipients = None, []
+                    reply(250, self.hostname)
+                elif verb == "MAIL":
+                    if not arg.upper().startswith("FROM:"):
+                        reply(501, "Syntax: MAIL FROM:<address>")
+                        continue
+                    mail_from, recipients = arg[5:].strip(), []
+                    reply(250, "OK")
+                elif verb == "RCPT":
+                    if mail_from is None:
+                        reply(503, "Need MAIL command")
+                        continue
+                    if not arg.upper().startswith("TO:"):
+                        reply(501, "Syntax: RCPT TO:<address>")
+                        continue
+
+                    code = parse_recipient(arg[3:])
+                    if code and await loop.run_in_executor(
+                            self.executor, check_exists, code):
+                        recipients.append(code)
+                        reply(250, "OK")
+                    else:
+                        reply(550, "No such check")
+                elif verb == "DATA":
+                    if not recipients:
+                        reply(503, "Need RCPT command")
+                        continue
+
+                    reply(354, "End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    if not await self.read_data(reader):
+                        break
+
+                    for code in recipients:
+                        ping = Ping(scheme="email", method="email")
+                        ping.ua = ("Email from %s" % mail_from)[:200]
+                        if peername:
+                            ping.remote_addr = peername[0]
+                        self.batcher.add(code, ping)
+
+                    mail_from, recipients = None, []
+                    reply(250, "OK")
+                elif verb == "RSET":
+                    mail_from, recipients = None, []
+                    reply(250, "OK")
+                elif verb == "NOOP":
+                    reply(250, "OK")
+                elif verb == "QUIT":
+                    reply(221, "Bye")
+                    break
+                else:
+                    reply(502, "Command not implemented")
+
+                await writer.drain()
+        finally:
+            writer.close()
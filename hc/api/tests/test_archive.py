@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta as td
+from unittest.mock import patch
+
+from django.test.utils import override_settings
+from django.utils import timezone
+from hc.api import archive
+from hc.api.models import Check, Ping
+from hc.api.prune import Pruner
+from hc.test import BaseTestCase
+
+
+class ArchiveTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(ArchiveTestCase, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(PING_ARCHIVE_DIR=self.dir)
+        self.settings_override.enable()
+
+        self.profile.ping_log_limit = 3
+        self.profile.save()
+        self.check = Check.objects.create(user=self.alice, n_pings=10)
+        self.now = timezone.now()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.dir)
+        super(ArchiveTestCase, self).tearDown()
+
+    def values(self, n):
+        return {"id": n, "owner__code": self.check.code, "n": n,
+                "created": self.now + td(seconds=n), "scheme": "http",
+                "scheme_code": None, "method": "", "method_code": 2,
+                "remote_addr": "1.2.3.4", "ua": "", "user_agent__value": "foo"}
+
+    def test_it_round_trips(self):
+        archive.archive_pings([self.values(n) for n in (3, 1, 2)])
+
+        columns = archive.read(self.check.code)
+        self.assertEqual(list(columns["n"]), [1, 2, 3])
+        created = archive.from_micros(columns["created"][0])
+        self.assertEqual(created, self.now + td(seconds=1))
+        self.assertEqual(columns["scheme"], ["http"] * 3)
+        self.assertEqual(columns["method"], ["POST"] * 3)
+        self.assertEqual(columns["ua"], ["foo"] * 3)
+
+    def test_it_reads_ranges(self):
+        archive.archive_pings([self.values(n) for n in range(1, 6)])
+        archive.archive_pings([self.values(n) for n in range(6, 11)])
+
+        columns = archive.read(self.check.code, lo=4, hi=8, columns=["n"])
+        self.assertEqual(list(columns["n"]), [4, 5, 6, 7])
+        self.assertEqual(list(columns), ["n"])
+
+    def test_it_merges_overlapping_segments(self):
+        archive.archive_pings([self.values(n) for n in (1, 2, 5)])
+        archive.archive_pings([self.values(n) for n in (2, 3, 4)])
+
+        columns = archive.read(self.check.code, columns=["n", "remote_addr"])
+        self.assertEqual(list(columns["n"]), [1, 2, 3, 4, 5])
+        self.assertEqual(len(columns["remote_addr"]), 5)
+
+    def test_load_pings(self):
+        archive.archive_pings([self.values(n) for n in range(1, 6)])
+
+        pings = archive.load_pings(self.check.code, hi=5, limit=2)
+        self.assertEqual([p.n for p in pings], [4, 3])
+        self.assertEqual(pings[0].get_ua(), "foo")
+        self.assertTrue(archive.has_pings(self.check.code, 2))
+        self.assertFalse(archive.has_pings(self.check.code, 1))
+
+    def test_pruning_archives_first(self):
+        for n in range(1, 11):
+            Ping.objects.create(owner=self.check, n=n, scheme="https")
+
+        self.assertEqual(Pruner(chunk=1000).run(), 6)
+
+        columns = archive.read(self.check.code)
+        self.assertEqual(list(columns["n"]), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(columns["scheme"], ["https"] * 6)
+
+        path = os.path.join(self.dir, str(self.check.code))
+        self.assertEqual(os.listdir(path), ["0000000001-0000000006.seg"])
+
+    def test_pruning_merges_small_segments(self):
+        for n in range(1, 11):
+            Ping.objects.create(owner=self.check, n=n)
+
+        # One ping per batch
+        Pruner(chunk=1).run()
+
+        columns = archive.read(self.check.code)
+        self.assertEqual(list(columns["n"]), [1, 2, 3, 4, 5, 6])
+
+        path = os.path.join(self.dir, str(self.check.code))
+        self.assertEqual(os.listdir(path), ["0000000001-0000000006.seg"])
+
+    def test_compact_keeps_large_segments(self):
+        archive.archive_pings([self.values(n) for n in (1, 2)])
+        archive.archive_pings([self.values(n) for n in (3, 4)])
+        with patch("hc.api.archive.COMPACT_BELOW", 2):
+            archive.archive_pings([self.values(n) for n in (5, 6, 7)])
+            self.assertEqual(archive.compact(self.check.code), 2)
+
+        path = os.path.join(self.dir, str(self.check.code))
+        self.assertEqual(sorted(os.listdir(path)),
+                         ["0000000001-0000000004.seg",
+                          "0000000005-0000000007.seg"])
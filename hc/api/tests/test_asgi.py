@@ -0,0 +1,102 @@
+import asyncio
+import json
+from concurrent.futures import Executor, Future
+
+from hc.api.asgi import AsgiApplication
+from hc.api.models import Check, Ping
+from hc.test import BaseTestCase
+from unittest.mock import Mock, patch
+
+
+class InlineExecutor(Executor):
+    """ Runs jobs in the calling thread, so they see the test's
+    database transaction. """
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+@patch("hc.api.asgi.close_old_connections", Mock())
+class AsgiTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(AsgiTestCase, self).setUp()
+        self.check = Check.objects.create(user=self.alice)
+
+        def wsgi_application(environ, start_response):
+            start_response("404 Not Found", [("Content-Type", "text/plain")])
+            return [b"from wsgi"]
+
+        self.app = AsgiApplication(wsgi_application, InlineExecutor())
+
+    def request(self, path, method="GET", headers=()):
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": path,
+            "headers": [(k.encode(), v.encode()) for k, v in headers],
+            "client": ("127.0.0.1", 12345)
+        }
+        messages = [{"type": "http.request", "body": b""}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.app(scope, receive, send))
+        finally:
+            loop.close()
+
+        start, body = sent
+        return start["status"], dict(start["headers"]), body["body"]
+
+    def test_it_handles_ping(self):
+        status, headers, body = self.request(
+            "/ping/%s/" % self.check.code, headers=[("User-Agent", "curl")])
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b"OK")
+        self.assertEqual(headers[b"Access-Control-Allow-Origin"], b"*")
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.ua, "curl")
+        self.assertEqual(ping.remote_addr, "127.0.0.1")
+
+    def test_it_handles_post_ping(self):
+        status, headers, body = self.request(
+            "/ping/%s" % self.check.code, method="POST")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(Ping.objects.get().method, "POST")
+
+    def test_it_handles_bad_uuid(self):
+        status, headers, body = self.request("/ping/not-uuid/")
+        self.assertEqual(status, 400)
+
+    def test_it_lists_checks(self):
+        status, headers, body = self.request(
+            "/api/v1/checks/", headers=[("X-Api-Key", "abc")])
+
+        self.assertEqual(status, 200)
+        doc = json.loads(body.decode())
+        self.assertEqual(len(doc["checks"]), 1)
+
+    def test_it_checks_api_key(self):
+        status, headers, body = self.request("/api/v1/checks/")
+        self.assertEqual(status, 400)
+
+    def test_it_passes_writes_to_wsgi(self):
+        status, headers, body = self.request("/api/v1/checks/", "POST")
+        self.assertEqual(status, 404)
+        self.assertEqual(body, b"from wsgi")
+
+    def test_it_passes_other_paths_to_wsgi(self):
+        status, headers, body = self.request("/checks/")
+        self.assertEqual(body, b"from wsgi")
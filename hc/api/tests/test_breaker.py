@@ -0,0 +1,95 @@
+from unittest.mock import patch
+
+from django.test.utils import override_settings
+from hc.api import metrics
+from hc.api.breaker import CIRCUIT_OPEN, CLOSED, HALF_OPEN, OPEN, circuits
+from hc.api.models import Channel, Check, Notification
+from hc.test import BaseTestCase
+from requests.exceptions import Timeout
+
+
+@override_settings(CIRCUIT_BREAKER_THRESHOLD=5, CIRCUIT_BREAKER_COOLDOWN=60)
+class BreakerTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(BreakerTestCase, self).setUp()
+        self.check = Check.objects.create(user=self.alice, status="down")
+        self.channel = Channel.objects.create(user=self.alice,
+                                              kind="webhook",
+                                              value="http://Example.org/a")
+        self.channel.checks.add(self.check)
+
+    @patch("hc.api.transports.requests.request", side_effect=Timeout)
+    def test_it_opens(self, mock_request):
+        # 3 attempts each
+        self.channel.notify(self.check)
+        self.channel.notify(self.check)
+        self.assertEqual(mock_request.call_count, 5)
+        self.assertEqual(circuits.state("example.org"), OPEN)
+
+        errors = [n.error for n in Notification.objects.order_by("id")]
+        self.assertEqual(errors, ["Connection timed out", CIRCUIT_OPEN])
+
+        # Fails fast from now on
+        self.assertEqual(self.channel.notify(self.check), CIRCUIT_OPEN)
+        self.assertEqual(mock_request.call_count, 5)
+
+        text = metrics.render()
+        self.assertIn('hc_circuit_breakers{state="open"} 1', text)
+
+    def test_it_probes_after_cooldown(self):
+        for i in range(5):
+            circuits.record("example.org", "Connection failed")
+
+        with patch("hc.api.breaker.time.time") as mock_time:
+            mock_time.return_value = circuits.breakers["example.org"].since
+            self.assertFalse(circuits.allow("example.org"))
+
+            mock_time.return_value += 60
+            self.assertTrue(circuits.allow("example.org"))
+            self.assertEqual(circuits.state("example.org"), HALF_OPEN)
+            # One probe at a time
+            self.assertFalse(circuits.allow("example.org"))
+
+            # A failed probe opens it for another cooldown
+            circuits.record("example.org", "Connection failed")
+            self.assertEqual(circuits.state("example.org"), OPEN)
+            self.assertFalse(circuits.allow("example.org"))
+
+            mock_time.return_value += 60
+            self.assertTrue(circuits.allow("example.org"))
+            circuits.record("example.org", "")
+            self.assertEqual(circuits.state("example.org"), CLOSED)
+
+    def test_client_errors_dont_count(self):
+        for i in range(10):
+            circuits.record("example.org", "Received status code 404")
+
+        self.assertEqual(circuits.state("example.org"), CLOSED)
+
+        for i in range(5):
+            circuits.record("example.org", "Received status code 503")
+
+        self.assertEqual(circuits.state("example.org"), OPEN)
+
+    @override_settings(CIRCUIT_BREAKER_THRESHOLD=None)
+    def test_it_can_be_turned_off(self):
+        for i in range(10):
+            circuits.record("example.org", "Connection failed")
+
+        self.assertTrue(circuits.allow("example.org"))
+
+    @patch("hc.api.transports.requests.request", side_effect=Timeout)
+    def test_provider_channels_have_their_own(self, mock_request):
+        mine = Channel.objects.create(user=self.alice, kind="pd", value="a")
+        theirs = Channel.objects.create(user=self.bob, kind="pd", value="b")
+        mine.checks.add(self.check)
+        theirs.checks.add(self.check)
+
+        mine.notify(self.check)
+        mine.notify(self.check)
+        self.assertEqual(circuits.state("channel-%d" % mine.id), OPEN)
+        self.assertEqual(circuits.state("events.pagerduty.com"), CLOSED)
+
+        # Another account on the same host is unaffected
+        self.assertNotEqual(theirs.notify(self.check), CIRCUIT_OPEN)
@@ -0,0 +1,124 @@
+import json
+from datetime import timedelta as td
+
+from django.utils import timezone
+from hc.api.models import Check, Ping
+from hc.test import BaseTestCase
+
+
+class BulkPingTestCase(BaseTestCase):
+    URL = "/api/v1/pings/"
+
+    def setUp(self):
+        super(BulkPingTestCase, self).setUp()
+        self.check = Check.objects.create(user=self.alice)
+        self.other = Check.objects.create(user=self.alice)
+
+    def post(self, pings):
+        payload = json.dumps({"api_key": "abc", "pings": pings})
+        return self.client.post(self.URL, payload,
+                                content_type="application/json")
+
+    def test_it_works(self):
+        r = self.post([
+            {"code": str(self.check.code), "method": "GET", "ua": "cron"},
+            {"code": str(self.check.code)},
+            {"code": str(self.other.code)}
+        ])
+        self.assertEqual(r.status_code, 200)
+
+        # A result for each ping, in order
+        results = r.json()["results"]
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]["code"], str(self.check.code))
+        self.assertEqual(results[1]["n_pings"], 2)
+        self.assertEqual(results[2]["code"], str(self.other.code))
+        self.assertEqual(results[2]["status"], "up")
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.n_pings, 2)
+        self.assertEqual(self.check.status, "up")
+        self.assertIsNotNone(self.check.last_ping)
+
+        self.assertEqual(Ping.objects.filter(owner=self.check).count(), 2)
+        ping = Ping.objects.get(owner=self.other)
+        self.assertEqual(ping.n, 1)
+
+    def test_it_uses_set_based_queries(self):
+        pings = [{"code": str(self.check.code)} for i in range(10)]
+        pings += [{"code": str(self.other.code)} for i in range(10)]
+
+        # API key lookup, SELECT ... FOR UPDATE, UPDATE, INSERT, plus
+        # the savepoint and its release
+        with self.assertNumQueries(6):
+            self.post(pings)
+
+        self.assertEqual(Ping.objects.count(), 20)
+
+    def test_it_uses_timestamps(self):
+        earlier = timezone.now() - td(hours=2)
+        r = self.post([
+            {"code": str(self.check.code), "timestamp": earlier.isoformat()},
+            {"code": str(self.other.code), "timestamp": 1500000000}
+        ])
+        self.assertEqual(r.status_code, 200)
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.last_ping, earlier)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.last_ping.year, 2017)
+
+    def test_it_does_not_move_last_ping_back(self):
+        now = timezone.now()
+        self.check.last_ping = now
+        self.check.status = "up"
+        self.check.save()
+
+        self.post([{"code": str(self.check.code),
+                    "timestamp": (now - td(days=1)).isoformat()}])
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.last_ping, now)
+        self.assertEqual(self.check.n_pings, 1)
+        self.assertEqual(Ping.objects.count(), 1)
+
+    def test_it_reports_per_code_errors(self):
+        charlies = Check.objects.create(user=self.charlie)
+        r = self.post([
+            {"code": "not-uuid"},
+            {"code": str(charlies.code)},
+            {"code": str(self.check.code), "timestamp": "yesterday"},
+            {"code": "not-uuid"},
+            {"code": str(self.check.code)}
+        ])
+        self.assertEqual(r.status_code, 200)
+
+        results = r.json()["results"]
+        self.assertEqual(results[0]["error"], "invalid code")
+        self.assertEqual(results[1]["error"], "not found")
+        self.assertEqual(results[2]["error"], "invalid timestamp")
+        self.assertEqual(results[3]["error"], "invalid code")
+        self.assertEqual(results[4]["n_pings"], 1)
+        self.assertEqual(Ping.objects.count(), 1)
+
+    def test_it_validates_pings(self):
+        r = self.post("foo")
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.json()["error"], "pings is not an array")
+
+        r = self.post([{"ua": "no code"}])
+        self.assertEqual(r.status_code, 400)
+
+        r = self.client.post(self.URL, json.dumps({"api_key": "abc"}),
+                             content_type="application/json")
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.json()["error"], "pings is missing")
+
+    def test_it_limits_batch_size(self):
+        r = self.post([{"code": str(self.check.code)}] * 1001)
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.json()["error"], "pings has too many items")
+
+    def test_it_allows_posts_only(self):
+        r = self.client.get(self.URL, HTTP_X_API_KEY="abc")
+        self.assertEqual(r.status_code, 405)
@@ -0,0 +1,107 @@
+from datetime import timedelta as td
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from hc.api.cache import CachedCheck, CheckCache, check_cache
+from hc.api.models import Check
+from unittest.mock import patch
+
+
+class CheckCacheTestCase(TestCase):
+
+    def setUp(self):
+        super(CheckCacheTestCase, self).setUp()
+        self.entry = CachedCheck(1, None, "up", td(days=1), td(hours=1), None)
+        check_cache.clear()
+
+    def test_it_counts_hits_and_misses(self):
+        cache = CheckCache(size=10, ttl=60)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", self.entry)
+        self.assertEqual(cache.get("a"), self.entry)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "size": 1})
+
+    def test_it_evicts_least_recently_used(self):
+        cache = CheckCache(size=2, ttl=60)
+        cache.put("a", self.entry)
+        cache.put("b", self.entry)
+        cache.get("a")
+        cache.put("c", self.entry)
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    @patch("hc.api.cache.time.time")
+    def test_it_expires_entries(self, mock_time):
+        cache = CheckCache(size=10, ttl=60)
+        mock_time.return_value = 1000
+        cache.put("a", self.entry)
+        mock_time.return_value = 1061
+        self.assertIsNone(cache.get("a"))
+
+    def test_zero_size_disables_it(self):
+        cache = CheckCache(size=0, ttl=60)
+        cache.put("a", self.entry)
+        self.assertIsNone(cache.get("a"))
+
+    def test_ping_fills_cache(self):
+        check = Check.objects.create()
+        self.client.get("/ping/%s/" % check.code)
+
+        entry = check_cache.get(check.code)
+        self.assertEqual(entry.id, check.id)
+        self.assertEqual(entry.status, "up")
+        self.assertEqual(entry.timeout, check.timeout)
+        self.assertEqual(entry.grace, check.grace)
+        self.assertIsNotNone(entry.last_ping)
+
+    def test_cached_ping_matches_by_id(self):
+        check = Check.objects.create()
+        self.client.get("/ping/%s/" % check.code)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/ping/%s/" % check.code)
+
+        self.assertIn("WHERE id = ", ctx.captured_queries[0]["sql"])
+        self.assertEqual(check_cache.stats()["hits"], 1)
+
+        check.refresh_from_db()
+        self.assertEqual(check.n_pings, 2)
+
+    def test_it_handles_check_deleted_elsewhere(self):
+        check = Check.objects.create()
+        self.client.get("/ping/%s/" % check.code)
+
+        # Queryset delete, this process's cache doesn't hear about it
+        Check.objects.filter(id=check.id).delete()
+
+        r = self.client.get("/ping/%s/" % check.code)
+        self.assertEqual(r.status_code, 400)
+        self.assertIsNone(check_cache.get(check.code))
+
+    def test_save_and_delete_invalidate(self):
+        check = Check.objects.create()
+        self.client.get("/ping/%s/" % check.code)
+
+        check.status = "paused"
+        check.save()
+        self.assertIsNone(check_cache.get(check.code))
+
+        self.client.get("/ping/%s/" % check.code)
+        code = check.code
+        check.delete()
+        self.assertIsNone(check_cache.get(code))
+
+        r = self.client.get("/ping/%s/" % code)
+        self.assertEqual(r.status_code, 400)
+
+    def test_it_warms_up(self):
+        check = Check.objects.create(last_ping=timezone.now())
+        Check.objects.create()
+
+        check_cache.warm()
+        self.assertEqual(check_cache.stats()["size"], 1)
+        self.assertEqual(check_cache.get(check.code).id, check.id)
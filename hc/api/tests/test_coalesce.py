@@ -0,0 +1,127 @@
+from datetime import timedelta as td
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from hc.api.coalesce import COALESCED, RECORD, THROTTLED, PingCoalescer
+from hc.api.models import Check, Ping
+from unittest.mock import patch
+
+
+class CoalesceTestCase(TestCase):
+
+    def setUp(self):
+        super(CoalesceTestCase, self).setUp()
+        self.check = Check.objects.create(status="up")
+        self.code = str(self.check.code)
+
+    def hit(self, coalescer):
+        """ Count a ping like hc.api.pings.record does. """
+
+        verdict = coalescer.hit(self.code)
+        if verdict == RECORD:
+            coalescer.add(self.code)
+        return verdict
+
+    @patch("hc.api.coalesce.time.time")
+    def test_it_coalesces_within_window(self, mock_time):
+        coalescer = PingCoalescer(window=1, rate_limit=0)
+
+        mock_time.return_value = 1000
+        self.assertEqual(self.hit(coalescer), RECORD)
+        mock_time.return_value = 1000.5
+        self.assertEqual(self.hit(coalescer), COALESCED)
+        mock_time.return_value = 1001.5
+        self.assertEqual(self.hit(coalescer), RECORD)
+
+    @patch("hc.api.coalesce.time.time")
+    def test_it_throttles(self, mock_time):
+        coalescer = PingCoalescer(window=0, rate_limit=2)
+
+        mock_time.return_value = 1000
+        self.assertEqual(self.hit(coalescer), RECORD)
+        self.assertEqual(self.hit(coalescer), RECORD)
+        self.assertEqual(self.hit(coalescer), THROTTLED)
+
+        mock_time.return_value = 1001
+        self.assertEqual(self.hit(coalescer), RECORD)
+
+    def test_flush_writes_aggregate(self):
+        self.check.last_ping = timezone.now() - td(minutes=1)
+        self.check.n_pings = 1
+        self.check.save()
+
+        coalescer = PingCoalescer(window=60, rate_limit=5)
+        for i in range(10):
+            self.hit(coalescer)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(coalescer.flush(), 1)
+
+        self.check.refresh_from_db()
+        # One RECORD verdict is left to the caller, 4 coalesced, 5 throttled
+        self.assertEqual(self.check.n_pings, 5)
+        self.assertEqual(self.check.n_coalesced, 4)
+        self.assertEqual(self.check.n_throttled, 5)
+        self.assertTrue(self.check.last_ping > timezone.now() - td(minutes=1))
+
+        # Nothing left to write
+        self.assertEqual(coalescer.flush(), 0)
+
+    def test_flush_keeps_counts_on_error(self):
+        coalescer = PingCoalescer(window=60, rate_limit=0)
+        for i in range(3):
+            self.hit(coalescer)
+
+        with patch("django.db.models.query.QuerySet.update") as mock:
+            mock.side_effect = RuntimeError
+            with self.assertRaises(RuntimeError):
+                coalescer.flush()
+
+        self.hit(coalescer)
+        self.assertEqual(coalescer.flush(), 1)
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.n_coalesced, 3)
+
+    @override_settings(PING_COALESCE_WINDOW=60000, PING_RATE_LIMIT=3)
+    def test_ping_view_uses_it(self):
+        coalescer = PingCoalescer(window=60, rate_limit=3)
+        with patch("hc.api.pings.get_coalescer", return_value=coalescer):
+            codes = [self.client.get("/ping/%s/" % self.code).status_code
+                     for i in range(5)]
+
+        self.assertEqual(codes, [200, 200, 200, 429, 429])
+        self.assertEqual(Ping.objects.count(), 1)
+
+        coalescer.flush()
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.n_pings, 3)
+        self.assertEqual(self.check.n_throttled, 2)
+
+    @patch("hc.api.coalesce.time.time")
+    def test_it_skips_unknown_codes(self, mock_time):
+        coalescer = PingCoalescer(window=60, rate_limit=1)
+        code = "07c2f548-9850-4b27-af5d-6c9dc157ec02"
+
+        mock_time.return_value = 1000
+        self.assertEqual(coalescer.hit(code), RECORD)
+        self.assertEqual(coalescer.hit(code), RECORD)
+        self.assertEqual(coalescer.entries, {})
+
+    @override_settings(PING_RATE_LIMIT=1)
+    def test_ping_view_rejects_unknown_codes_unthrottled(self):
+        coalescer = PingCoalescer(window=0, rate_limit=1)
+        url = "/ping/07c2f548-9850-4b27-af5d-6c9dc157ec02/"
+        with patch("hc.api.pings.get_coalescer", return_value=coalescer):
+            codes = [self.client.get(url).status_code for i in range(3)]
+
+        self.assertEqual(codes, [400, 400, 400])
+
+    @override_settings(PING_COALESCE_WINDOW=60000)
+    def test_it_forgets_unknown_codes(self):
+        coalescer = PingCoalescer(window=60, rate_limit=0)
+        url = "/ping/07c2f548-9850-4b27-af5d-6c9dc157ec02/"
+        with patch("hc.api.pings.get_coalescer", return_value=coalescer):
+            self.assertEqual(self.client.get(url).status_code, 400)
+            self.assertEqual(self.client.get(url).status_code, 400)
@@ -0,0 +1,85 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test.utils import override_settings
+from hc.api import pings
+from hc.api.models import Check, Ping, UserAgent
+from hc.test import BaseTestCase
+
+
+class CompactPingsTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(CompactPingsTestCase, self).setUp()
+        self.check = Check.objects.create(user=self.alice)
+        # UserAgent rows from earlier tests have been rolled back
+        pings._user_agent_ids.clear()
+
+    @override_settings(PING_COMPACT=True)
+    def test_it_stores_compact_rows(self):
+        for i in range(2):
+            self.client.post("/ping/%s/" % self.check.code,
+                             HTTP_USER_AGENT="curl/7.55",
+                             HTTP_X_FORWARDED_PROTO="https")
+
+        ping = Ping.objects.latest("id")
+        self.assertEqual((ping.scheme, ping.method, ping.ua), ("", "", ""))
+        self.assertEqual(ping.get_scheme(), "https")
+        self.assertEqual(ping.get_method(), "POST")
+        self.assertEqual(ping.get_ua(), "curl/7.55")
+
+        # The user agent is stored once
+        self.assertEqual(UserAgent.objects.count(), 1)
+
+    @override_settings(PING_COMPACT=True)
+    def test_it_keeps_unknown_values(self):
+        self.client.generic("MOVE", "/ping/%s/" % self.check.code)
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.method, "MOVE")
+        self.assertIsNone(ping.method_code)
+        self.assertEqual(ping.get_method(), "MOVE")
+
+    @override_settings(PING_COMPACT=True)
+    def test_bulk_pings_are_compact(self):
+        payload = {"api_key": "abc", "pings": [
+            {"code": str(self.check.code), "method": "GET", "ua": "cron"}]}
+        self.client.post("/api/v1/pings/", json.dumps(payload),
+                         content_type="application/json")
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.user_agent.value, "cron")
+        self.assertEqual(ping.get_method(), "GET")
+
+    def test_it_can_skip_client_info(self):
+        self.check.store_client_info = False
+        self.check.save()
+
+        self.client.get("/ping/%s/" % self.check.code,
+                        HTTP_USER_AGENT="curl/7.55")
+
+        ping = Ping.objects.get()
+        self.assertIsNone(ping.remote_addr)
+        self.assertEqual(ping.get_ua(), "")
+        self.assertEqual(ping.get_scheme(), "http")
+
+    def test_compactpings_converts_old_rows(self):
+        Ping.objects.create(owner=self.check, scheme="https", method="GET",
+                            ua="curl/7.55")
+        Ping.objects.create(owner=self.check, scheme="http", method="GET",
+                            ua="curl/7.55")
+        Ping.objects.create(owner=self.check, scheme="email", method="email")
+
+        call_command("compactpings", chunk=2, stdout=StringIO())
+
+        for ping in Ping.objects.all():
+            self.assertEqual(ping.scheme, "")
+            self.assertEqual(ping.method, "")
+            self.assertEqual(ping.ua, "")
+
+        pings = list(Ping.objects.order_by("id"))
+        self.assertEqual(pings[0].get_scheme(), "https")
+        self.assertEqual(pings[1].get_ua(), "curl/7.55")
+        self.assertEqual(pings[2].get_method(), "email")
+        self.assertEqual(UserAgent.objects.count(), 1)
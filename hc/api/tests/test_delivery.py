@@ -0,0 +1,187 @@
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from datetime import timedelta as td
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from django.utils import timezone
+from hc.api.delivery import DeliveryEngine
+from hc.api.management.commands.sendalerts import Command
+from hc.api.models import Channel, Check, Notification
+from hc.test import BaseTestCase
+from unittest.mock import patch
+
+# Each request to the stand-in server takes this long
+LATENCY = 0.2
+
+
+class InlineExecutor(Executor):
+    """ Runs jobs in the calling thread, so they see the test's
+    database transaction. """
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.paths = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.paths.append(self.path)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight,
+                                       server.in_flight)
+
+        time.sleep(LATENCY)
+        with server.lock:
+            server.in_flight -= 1
+
+        if self.path.startswith("/moved"):
+            self.send_response(302)
+            self.send_header("Location", self.path.replace("/moved", "/down"))
+        else:
+            self.send_response(500 if self.path.startswith("/fail") else 200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class DeliveryEngineTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(DeliveryEngineTestCase, self).setUp()
+        self.server = StandInServer()
+        t = threading.Thread(target=self.server.serve_forever, args=(0.05, ))
+        t.daemon = True
+        t.start()
+
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.url = "http://127.0.0.1:%d" % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.executor.shutdown()
+        super(DeliveryEngineTestCase, self).tearDown()
+
+    def add_checks(self, n_checks, n_channels, path="/down"):
+        checks = []
+        for i in range(n_checks):
+            check = Check.objects.create(user=self.alice, status="down")
+            for j in range(n_channels):
+                value = "%s%s/%d/%d\n" % (self.url, path, i, j)
+                channel = Channel.objects.create(user=self.alice,
+                                                 kind="webhook", value=value)
+                channel.checks.add(check)
+            checks.append(check)
+
+        return checks
+
+    def test_it_delivers_concurrently(self):
+        checks = self.add_checks(10, 5)
+
+        engine = DeliveryEngine(self.executor, per_host=50)
+        start = time.time()
+        self.assertEqual(engine.send(checks), [])
+        elapsed = time.time() - start
+
+        # 50 requests one after another would take 10 seconds
+        self.assertEqual(len(self.server.paths), 50)
+        self.assertTrue(elapsed < 50 * LATENCY / 5, elapsed)
+        self.assertEqual(Notification.objects.filter(error="").count(), 50)
+
+    def test_it_limits_requests_per_host(self):
+        checks = self.add_checks(10, 1)
+
+        DeliveryEngine(self.executor, per_host=3).send(checks)
+        self.assertEqual(len(self.server.paths), 10)
+        self.assertEqual(self.server.max_in_flight, 3)
+
+    def test_it_retries_and_reports_errors(self):
+        checks = self.add_checks(1, 1, path="/fail")
+
+        errors = DeliveryEngine(self.executor).send(checks)
+        self.assertEqual(len(self.server.paths), 3)
+        self.assertEqual(errors[0][1], "Received status code 500")
+
+        n = Notification.objects.get()
+        self.assertEqual(n.error, "Received status code 500")
+        self.assertEqual(n.check_status, "down")
+
+    def test_it_follows_redirects(self):
+        checks = self.add_checks(1, 1, path="/moved")
+        failed = DeliveryEngine(self.executor).send(checks)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(self.server.paths, ["/moved/0/0", "/down/0/0"])
+
+    def test_it_enforces_deadline(self):
+        checks = self.add_checks(1, 1)
+
+        engine = DeliveryEngine(self.executor, deadline=LATENCY / 4)
+        errors = engine.send(checks)
+        self.assertEqual(errors[0][1], "Connection timed out")
+
+    def test_it_handles_connection_errors(self):
+        check = Check.objects.create(user=self.alice, status="down")
+        channel = Channel.objects.create(user=self.alice, kind="webhook",
+                                         value="http://127.0.0.1:1/\n")
+        channel.checks.add(check)
+
+        errors = DeliveryEngine(self.executor).send([check])
+        self.assertEqual(errors[0][1], "Connection failed")
+
+    def test_it_skips_no_op(self):
+        check = Check.objects.create(user=self.alice, status="up")
+        channel = Channel.objects.create(user=self.alice, kind="webhook",
+                                         value="%s/down\n" % self.url)
+        channel.checks.add(check)
+
+        self.assertEqual(DeliveryEngine(self.executor).send([check]), [])
+        self.assertEqual(self.server.paths, [])
+        self.assertFalse(Notification.objects.exists())
+
+    @patch("hc.api.delivery.connection")
+    def test_it_runs_other_transports_in_executor(self, mock_connection):
+        check = Check.objects.create(user=self.alice, status="down")
+        channel = Channel.objects.create(user=self.alice, kind="email",
+                                         value="alice@example.org",
+                                         email_verified=True)
+        channel.checks.add(check)
+
+        with patch("hc.api.transports.emails.alert") as mock_alert:
+            DeliveryEngine(InlineExecutor()).send([check])
+
+        self.assertTrue(mock_alert.called)
+        self.assertEqual(Notification.objects.get().error, "")
+
+    def test_sendalerts_uses_it(self):
+        check = self.add_checks(1, 2)[0]
+        Check.objects.filter(id=check.id).update(
+            status="up", alert_after=timezone.now() - td(minutes=1))
+        check.refresh_from_db()
+
+        command = Command()
+        command.engine = DeliveryEngine(self.executor)
+        command.process([check], [])
+
+        self.assertEqual(len(self.server.paths), 2)
+        check.refresh_from_db()
+        self.assertEqual(check.status, "down")
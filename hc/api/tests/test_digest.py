@@ -0,0 +1,163 @@
+import json
+from concurrent.futures import Executor, Future
+from datetime import timedelta as td
+from unittest.mock import patch
+
+from django.core import mail
+from django.utils import timezone
+from hc.api.digest import Digester, send_digest
+from hc.api.management.commands.sendalerts import Command
+from hc.api.models import Channel, Check, Notification
+from hc.test import BaseTestCase
+
+
+class InlineExecutor(Executor):
+    """ Runs jobs in the calling thread, so they see the test's
+    database transaction. """
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class DigestTestCase(BaseTestCase):
+
+    def _checks(self, n, user=None, status="down"):
+        return [Check.objects.create(user=user or self.alice, status=status,
+                                     name="Check %d" % i)
+                for i in range(n)]
+
+    def _channel(self, kind, value, checks):
+        channel = Channel.objects.create(user=self.alice, kind=kind,
+                                         value=value, email_verified=True)
+        channel.checks.add(*checks)
+        return channel
+
+    def test_split_digests_above_threshold(self):
+        alice_checks = self._checks(3)
+        bob_checks = self._checks(1, user=self.bob)
+        up_checks = self._checks(2, status="up")
+
+        digests, rest = Digester(2, 300).split(
+            alice_checks + bob_checks + up_checks, 1000)
+
+        self.assertEqual(digests, [alice_checks])
+        self.assertEqual(set(rest), set(bob_checks + up_checks))
+
+    def test_split_counts_within_window(self):
+        digester = Digester(2, 300)
+        first, second = self._checks(2), self._checks(2)
+
+        digests, rest = digester.split(first, 1000)
+        self.assertEqual(digests, [])
+
+        # Four down within the window
+        digests, rest = digester.split(second, 1100)
+        self.assertEqual(digests, [second])
+
+        # The window has passed
+        digests, rest = digester.split(self._checks(2), 1500)
+        self.assertEqual(digests, [])
+
+    @patch("hc.api.transports.requests.request")
+    def test_send_digest(self, mock_request):
+        mock_request.return_value.status_code = 200
+        checks = self._checks(3)
+        self._channel("email", "alice@example.org", checks)
+        # Same address, different letter case
+        self._channel("email", "Alice@example.org", checks[:1])
+        webhook = self._channel("webhook", "http://example.org/$CODE", checks)
+        self._channel("slack", "http://example.org/slack", checks)
+
+        errors, rest = send_digest(checks)
+        self.assertEqual(errors, [])
+        # Webhooks are per check, and left to the caller
+        self.assertEqual(rest, [(check, webhook) for check in checks])
+
+        # One email for both email channels
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "3 checks are down")
+        self.assertIn("Check 2", mail.outbox[0].body)
+
+        # Slack gets one message
+        urls = [args[1] for args, kwargs in mock_request.call_args_list]
+        self.assertEqual(urls, ["http://example.org/slack"])
+
+        payload = [kwargs["json"]
+                   for args, kwargs in mock_request.call_args_list
+                   if args[1] == "http://example.org/slack"][0]
+        self.assertIn("3 checks are DOWN", payload["attachments"][0]["text"])
+
+        # Notifications are still per check and channel
+        self.assertEqual(Notification.objects.count(), 3 + 1 + 3)
+
+    def test_send_digest_keeps_unverified_emails_apart(self):
+        checks = self._checks(2)
+        unverified = self._channel("email", "alice@example.org", checks)
+        unverified.email_verified = False
+        unverified.save()
+        self._channel("email", "alice@example.org", checks)
+
+        errors, rest = send_digest(checks)
+        self.assertEqual(errors, [(unverified, "Email not verified")])
+        self.assertEqual(len(mail.outbox), 1)
+
+        q = Notification.objects.filter(channel=unverified)
+        self.assertEqual(q.count(), 2)
+        q = Notification.objects.exclude(channel=unverified)
+        self.assertEqual(set(q.values_list("error", flat=True)), {""})
+
+    @patch("hc.api.transports.requests.request")
+    def test_send_digest_records_errors(self, mock_request):
+        mock_request.return_value.status_code = 500
+        checks = self._checks(2)
+        channel = self._channel("hipchat", "http://example.org", checks)
+
+        errors, rest = send_digest(checks)
+        self.assertEqual(errors, [(channel, "Received status code 500")])
+        # 3 attempts
+        self.assertEqual(mock_request.call_count, 3)
+        for n in Notification.objects.all():
+            self.assertEqual(n.error, "Received status code 500")
+
+    @patch("hc.api.management.commands.sendalerts.Command.send_one")
+    @patch("hc.api.management.commands.sendalerts.Command.send_digest")
+    def test_sendalerts_digests(self, mock_digest, mock_one):
+        mock_digest.return_value = []
+        checks = self._checks(3, status="up")
+        self._checks(1, user=self.bob, status="up")
+        Check.objects.update(alert_after=timezone.now() - td(minutes=1))
+
+        command = Command()
+        command.digester = Digester(2, 300)
+        self.assertTrue(command.handle_many())
+
+        self.assertEqual(mock_digest.call_count, 1)
+        group = mock_digest.call_args[0][0]
+        self.assertEqual(set(check.id for check in group),
+                         set(check.id for check in checks))
+
+        # Bob's check alone
+        self.assertEqual(mock_one.call_count, 1)
+        self.assertEqual(mock_one.call_args[0][0].user, self.bob)
+
+    @patch("hc.api.management.commands.sendalerts.executor",
+           InlineExecutor())
+    @patch("hc.api.transports.requests.request")
+    def test_sendalerts_sends_webhooks_per_check(self, mock_request):
+        mock_request.return_value.status_code = 200
+        checks = self._checks(3, status="up")
+        self._channel("webhook", "http://example.org/$NAME", checks)
+        self._channel("slack", "http://example.org/slack", checks)
+        Check.objects.update(alert_after=timezone.now() - td(minutes=1))
+
+        command = Command()
+        command.digester = Digester(2, 300)
+        self.assertTrue(command.handle_many())
+
+        urls = sorted(args[1] for args, kwargs in mock_request.call_args_list)
+        self.assertEqual(urls, ["http://example.org/Check%200",
+                                "http://example.org/Check%201",
+                                "http://example.org/Check%202",
+                                "http://example.org/slack"])
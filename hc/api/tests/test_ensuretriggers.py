@@ -1,7 +1,9 @@
 from datetime import timedelta
+from unittest.mock import Mock
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.utils import timezone
-from hc.api.management.commands.ensuretriggers import Command
+from hc.api.management.commands.ensuretriggers import Command, _pg
 from hc.api.models import Check
 
 class EnsureTriggersTestCase(TestCase):
@@ -22,3 +24,17 @@ class EnsureTriggersTestCase(TestCase):
         check.refresh_from_db()
         # Assert that alert_after is lesser than the check's alert_after
         self.assertGreater(check.alert_after, alert_after)
+
+    def test_postgres_notifications_are_opt_in(self):
+        cursor = Mock()
+        _pg(cursor)
+        sql = cursor.execute.call_args[0][0]
+        self.assertNotIn("pg_notify", sql)
+        self.assertIn("DROP TRIGGER IF EXISTS notify_flip", sql)
+
+        with override_settings(ALERT_SCHEDULER_NOTIFY=True):
+            _pg(cursor)
+
+        sql = cursor.execute.call_args[0][0]
+        self.assertIn("pg_notify('api_check'", sql)
+        self.assertIn("CREATE TRIGGER notify_flip", sql)
@@ -0,0 +1,67 @@
+from django.test import TestCase
+from hc.api import pings
+from hc.api.fastpath import PingFastPath
+from hc.api.models import Check, Ping
+from unittest.mock import Mock, patch
+
+
+@patch("hc.api.fastpath.close_old_connections", Mock())
+class PingFastPathTestCase(TestCase):
+
+    def setUp(self):
+        super(PingFastPathTestCase, self).setUp()
+        self.check = Check.objects.create()
+        self.fallback = Mock(return_value=[b"fallback"])
+        self.app = PingFastPath(self.fallback)
+        self.start_response = Mock()
+
+    def call(self, path, **extra):
+        environ = {
+            "PATH_INFO": path,
+            "REQUEST_METHOD": "GET",
+            "REMOTE_ADDR": "127.0.0.1"
+        }
+        environ.update(extra)
+        return self.app(environ, self.start_response)
+
+    def test_it_works(self):
+        body = self.call("/ping/%s/" % self.check.code,
+                         HTTP_USER_AGENT="curl")
+        self.assertEqual(body, [b"OK"])
+        status, headers = self.start_response.call_args[0]
+        self.assertEqual(status, "200 OK")
+        self.assertIn(("Access-Control-Allow-Origin", "*"), headers)
+        self.assertFalse(self.fallback.called)
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "up")
+        ping = Ping.objects.get()
+        self.assertEqual(ping.ua, "curl")
+        self.assertEqual(ping.n, 1)
+
+    def test_it_handles_path_without_slash(self):
+        self.call("/ping/%s" % self.check.code)
+        status, headers = self.start_response.call_args[0]
+        self.assertEqual(status, "200 OK")
+
+    def test_it_handles_missing_check(self):
+        self.call("/ping/07c2f548-9850-4b27-af5d-6c9dc157ec02/")
+        status, headers = self.start_response.call_args[0]
+        self.assertEqual(status, "400 Bad Request")
+
+    def test_it_passes_through_bad_uuid(self):
+        body = self.call("/ping/not-uuid/")
+        self.assertEqual(body, [b"fallback"])
+
+    def test_it_passes_through_other_paths(self):
+        body = self.call("/checks/")
+        self.assertEqual(body, [b"fallback"])
+        self.assertEqual(Ping.objects.count(), 0)
+
+    @patch("hc.api.fastpath.pings.record")
+    def test_it_handles_throttled_ping(self, mock_record):
+        mock_record.side_effect = pings.Throttled()
+        body = self.call("/ping/%s/" % self.check.code)
+        self.assertEqual(body, [b"Too Many Requests"])
+        status, headers = self.start_response.call_args[0]
+        self.assertEqual(status, "429 Too Many Requests")
@@ -0,0 +1,49 @@
+from django.test import TestCase
+from hc.api.leader import Leadership
+from unittest.mock import patch
+
+
+class LeadershipTestCase(TestCase):
+
+    def test_sqlite_process_is_leader(self):
+        self.assertTrue(Leadership("test").try_acquire())
+
+    @patch("hc.api.leader.connection")
+    def test_it_uses_advisory_lock(self, mock_connection):
+        mock_connection.vendor = "postgresql"
+        conn = mock_connection.get_new_connection.return_value
+        cursor = conn.cursor.return_value
+        cursor.fetchone.return_value = (True, )
+
+        leadership = Leadership("test")
+        self.assertTrue(leadership.try_acquire())
+        sql, params = cursor.execute.call_args[0]
+        self.assertIn("pg_try_advisory_lock", sql)
+        self.assertEqual(params, [leadership.key])
+        self.assertTrue(conn.autocommit)
+
+        # Already the leader, only checks the connection
+        self.assertTrue(leadership.try_acquire())
+        self.assertEqual(cursor.execute.call_args[0], ("SELECT 1", []))
+
+    @patch("hc.api.leader.connection")
+    def test_it_loses_lock_with_connection(self, mock_connection):
+        mock_connection.vendor = "postgresql"
+        conn = mock_connection.get_new_connection.return_value
+        conn.cursor.return_value.fetchone.return_value = (True, )
+
+        leadership = Leadership("test")
+        self.assertTrue(leadership.try_acquire())
+
+        conn.cursor.side_effect = Exception("connection lost")
+        self.assertFalse(leadership.try_acquire())
+        self.assertIsNone(leadership.conn)
+
+    @patch("hc.api.leader.connection")
+    def test_another_process_is_leader(self, mock_connection):
+        mock_connection.vendor = "mysql"
+        conn = mock_connection.get_new_connection.return_value
+        conn.cursor.return_value.fetchone.return_value = (0, )
+
+        self.assertFalse(Leadership("test").try_acquire())
+        conn.autocommit.assert_called_with(True)
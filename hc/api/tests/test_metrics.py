@@ -0,0 +1,81 @@
+from datetime import timedelta as td
+from unittest.mock import patch
+from urllib.request import urlopen
+
+from django.utils import timezone
+from hc.api import metrics
+from hc.api.management.commands.sendalerts import Command
+from hc.api.models import Channel, Check
+from hc.test import BaseTestCase
+
+
+class MetricsTestCase(BaseTestCase):
+
+    def test_histogram_renders_cumulative_buckets(self):
+        h = metrics.Histogram("hc_test_seconds", "Test", buckets=(1, 5))
+        h.observe(0.5, kind="a")
+        h.observe(3, kind="a")
+        h.observe(7, kind="a")
+
+        text = metrics.render()
+        self.assertIn('hc_test_seconds_bucket{kind="a",le="1"} 1', text)
+        self.assertIn('hc_test_seconds_bucket{kind="a",le="5"} 2', text)
+        self.assertIn('hc_test_seconds_bucket{kind="a",le="+Inf"} 3', text)
+        self.assertIn('hc_test_seconds_sum{kind="a"} 10.5', text)
+        self.assertIn('hc_test_seconds_count{kind="a"} 3', text)
+
+    def test_quantile(self):
+        self.assertEqual(metrics.quantile(0.5, (1, 5), [2, 1, 1]), 1)
+        self.assertEqual(metrics.quantile(0.99, (1, 5), [2, 1, 1]),
+                         float("inf"))
+        self.assertEqual(metrics.quantile(0.5, (1, 5), [0, 0, 0]), 0)
+
+    def test_summary_covers_the_interval(self):
+        metrics.summary()
+        metrics.ALERTS.inc(status="down")
+        metrics.ALERT_LAG.observe(0.3, status="down")
+
+        line = metrics.summary()
+        self.assertIn("alerts=1 ", line)
+        self.assertIn("lag_p50=0.5s", line)
+        self.assertIn("lag_max=0.3s", line)
+
+        self.assertIn("alerts=0 ", metrics.summary())
+
+    def test_serve(self):
+        server = metrics.serve(0)
+        try:
+            url = "http://127.0.0.1:%d/metrics" % server.server_port
+            body = urlopen(url).read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertIn("# TYPE hc_alert_lag_seconds histogram", body)
+
+    @patch("hc.api.management.commands.sendalerts.Command.send_one")
+    def test_sendalerts_records_lag(self, mock):
+        check = Check(user=self.alice, status="up")
+        check.alert_after = timezone.now() - td(minutes=9)
+        check.save()
+
+        metrics.summary()
+        Command().handle_many()
+
+        line = metrics.summary()
+        self.assertIn("alerts=1 ", line)
+        # Nine minutes late
+        self.assertIn("lag_p50=600s", line)
+
+    @patch("hc.api.transports.requests.request")
+    def test_notify_counts_errors(self, mock_request):
+        mock_request.return_value.status_code = 500
+        check = Check.objects.create(user=self.alice, status="down")
+        channel = Channel.objects.create(user=self.alice, kind="webhook",
+                                         value="http://example.org")
+
+        before = metrics.DELIVERY_ERRORS.total()
+        channel.notify(check)
+        self.assertEqual(metrics.DELIVERY_ERRORS.total(), before + 1)
+        self.assertIn('hc_delivery_seconds_count{transport="webhook"}',
+                      metrics.render())
@@ -0,0 +1,155 @@
+from concurrent.futures import Executor, Future
+from datetime import timedelta as td
+from unittest.mock import patch
+
+from django.test.utils import override_settings
+from django.utils import timezone
+from hc.api import outbox
+from hc.api.management.commands.sendalerts import Command
+from hc.api.models import Channel, Check, Notification, OutboxEntry
+from hc.test import BaseTestCase
+
+
+class InlineExecutor(Executor):
+    """ Runs jobs in the calling thread, so they see the test's
+    database transaction. """
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+@override_settings(OUTBOX_BACKOFF=10, OUTBOX_MAX_BACKOFF=600,
+                   OUTBOX_MAX_AGE=3600)
+class OutboxTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(OutboxTestCase, self).setUp()
+        self.check = Check.objects.create(user=self.alice, status="down")
+        self.channel = Channel.objects.create(user=self.alice,
+                                              kind="webhook",
+                                              value="http://example.org")
+        self.channel.checks.add(self.check)
+
+    def test_enqueue_is_idempotent(self):
+        outbox.enqueue(self.check, "a")
+        outbox.enqueue(self.check, "a")
+        self.assertEqual(OutboxEntry.objects.count(), 1)
+
+        outbox.enqueue(self.check, "b")
+        self.assertEqual(OutboxEntry.objects.count(), 2)
+
+        entry = OutboxEntry.objects.first()
+        self.assertEqual(entry.channel, self.channel)
+        self.assertEqual(entry.check_status, "down")
+
+    def test_claim_leases_entries(self):
+        outbox.enqueue(self.check, "a")
+        now = timezone.now()
+
+        self.assertEqual(len(outbox.claim(now)), 1)
+        # Another worker doesn't get it
+        self.assertEqual(outbox.claim(now), [])
+        # Unless the first one dies
+        self.assertEqual(len(outbox.claim(now + outbox.LEASE)), 1)
+
+    @patch("hc.api.transports.requests.request")
+    def test_send_marks_done(self, mock_request):
+        mock_request.return_value.status_code = 200
+        outbox.enqueue(self.check, "a")
+        entry = outbox.claim(timezone.now())[0]
+
+        self.assertEqual(outbox.send(entry), "")
+        # One attempt, not three
+        self.assertEqual(mock_request.call_count, 1)
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.attempts, 1)
+        self.assertIsNone(entry.next_attempt)
+        self.assertEqual(Notification.objects.get().error, "")
+
+    @patch("hc.api.transports.requests.request")
+    def test_send_backs_off(self, mock_request):
+        mock_request.return_value.status_code = 500
+        outbox.enqueue(self.check, "a")
+
+        for attempts, delay in ((1, 10), (2, 20), (3, 40)):
+            entry = outbox.claim(timezone.now() + td(days=1))[0]
+            before = timezone.now()
+            outbox.send(entry)
+
+            entry.refresh_from_db()
+            self.assertEqual(entry.attempts, attempts)
+            # Between half and all of the full delay
+            self.assertGreaterEqual(entry.next_attempt,
+                                    before + td(seconds=delay / 2))
+            self.assertLessEqual(entry.next_attempt,
+                                 timezone.now() + td(seconds=delay))
+
+        # One notification per attempt
+        self.assertEqual(Notification.objects.count(), 3)
+
+    @patch("hc.api.transports.requests.request")
+    def test_send_gives_up_at_max_age(self, mock_request):
+        mock_request.return_value.status_code = 500
+        outbox.enqueue(self.check, "a")
+        created = timezone.now() - td(minutes=59, seconds=58)
+        OutboxEntry.objects.update(created=created)
+
+        entry = outbox.claim(timezone.now())[0]
+        outbox.send(entry)
+
+        entry.refresh_from_db()
+        self.assertIsNone(entry.next_attempt)
+
+    def test_expire(self):
+        outbox.enqueue(self.check, "a")
+        outbox.enqueue(self.check, "b")
+        old = timezone.now() - td(hours=2)
+        OutboxEntry.objects.update(created=old, attempts=2)
+        OutboxEntry.objects.filter(key=outbox.make_key(
+            self.check, self.channel, "b")).update(next_attempt=None)
+
+        outbox.expire(timezone.now())
+
+        # The done entry is forgotten, the pending one given up on
+        entry = OutboxEntry.objects.get()
+        self.assertIsNone(entry.next_attempt)
+        n = Notification.objects.get()
+        self.assertEqual(n.error, "Gave up after 2 attempts")
+
+    @patch("hc.api.management.commands.sendalerts.executor",
+           InlineExecutor())
+    @patch("hc.api.transports.requests.request")
+    def test_sendalerts_uses_outbox(self, mock_request):
+        mock_request.return_value.status_code = 200
+        Check.objects.filter(id=self.check.id).update(
+            status="up", alert_after=timezone.now() - td(minutes=1))
+
+        command = Command()
+        command.outbox = True
+        self.assertTrue(command.handle_many())
+        self.assertFalse(mock_request.called)
+        self.assertEqual(OutboxEntry.objects.count(), 1)
+
+        self.assertTrue(command.drain())
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertFalse(command.drain())
+
+    def test_sendalerts_claims_and_queues_together(self):
+        Check.objects.filter(id=self.check.id).update(
+            status="up", alert_after=timezone.now() - td(minutes=1))
+
+        command = Command()
+        command.outbox = True
+        with patch("hc.api.outbox.enqueue", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                command.handle_many()
+
+        # Still due, so the next tick queues its alert
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "up")
+
+        self.assertTrue(command.handle_many())
+        self.assertEqual(OutboxEntry.objects.count(), 1)
@@ -0,0 +1,61 @@
+from datetime import datetime
+from importlib import import_module
+from unittest.mock import MagicMock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from hc.api.management.commands.partitionpings import (
+    partition_name, period_start, upper_bound)
+
+
+class PartitionPingsTestCase(TestCase):
+
+    def test_period_start(self):
+        # A Wednesday afternoon
+        dt = datetime(2026, 10, 21, 15, 30, tzinfo=timezone.utc)
+
+        daily = period_start(dt, "daily")
+        self.assertEqual(daily, datetime(2026, 10, 21, tzinfo=timezone.utc))
+
+        weekly = period_start(dt, "weekly")
+        self.assertEqual(weekly, datetime(2026, 10, 19, tzinfo=timezone.utc))
+        self.assertEqual(partition_name(weekly), "api_ping_p20261019")
+
+    def test_upper_bound(self):
+        expr = ("FOR VALUES FROM ('2026-10-19 00:00:00+00') "
+                "TO ('2026-10-26 00:00:00+00')")
+        bound = upper_bound(expr)
+        self.assertEqual(bound, datetime(2026, 10, 26, tzinfo=timezone.utc))
+
+        expr = "FOR VALUES FROM (MINVALUE) TO ('2026-10-19 02:00:00+02')"
+        bound = upper_bound(expr)
+        self.assertEqual(bound, datetime(2026, 10, 19, tzinfo=timezone.utc))
+
+        self.assertIsNone(upper_bound("DEFAULT"))
+
+    def test_it_requires_postgres(self):
+        with self.assertRaises(CommandError):
+            call_command("partitionpings")
+
+    @override_settings(PING_STORAGE="ring")
+    def test_it_refuses_ring_storage(self):
+        with self.assertRaises(CommandError):
+            call_command("partitionpings", convert=True)
+
+    def test_slot_migration_skips_partitioned_table(self):
+        migration = import_module("hc.api.migrations.0039_ping_slot")
+        schema_editor = MagicMock()
+        schema_editor.connection.vendor = "postgresql"
+        cursor = schema_editor.connection.cursor.return_value.__enter__
+        cursor.return_value.fetchone.return_value = ("p", )
+
+        migration.create_index(None, schema_editor)
+        self.assertFalse(schema_editor.execute.called)
+
+        cursor.return_value.fetchone.return_value = ("r", )
+        migration.create_index(None, schema_editor)
+        sql = schema_editor.execute.call_args[0][0]
+        self.assertIn("CONCURRENTLY", sql)
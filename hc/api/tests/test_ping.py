@@ -1,5 +1,9 @@
+from datetime import timedelta
+
 from django.test import Client, TestCase
-from hc.api.models import Check, Ping
+from django.utils import timezone
+from hc.api.models import Check, Flip, Ping
+from unittest.mock import patch
 
 class PingTestCase(TestCase):
     '''
@@ -88,3 +92,63 @@ class PingTestCase(TestCase):
     def test_csrf_client_head_works(self):
         r = self.csrf_client.get("/ping/%s/" % self.check.code)
         self.assertEqual(r.status_code, 200)
+
+    def test_it_uses_two_queries(self):
+        # One UPDATE ... RETURNING for the check and one INSERT for the ping
+        with self.assertNumQueries(2):
+            r = self.client.get("/ping/%s/" % self.check.code)
+        self.assertEqual(r.status_code, 200)
+
+    def test_it_handles_missing_check(self):
+        r = self.client.get("/ping/07c2f548-9850-4b27-af5d-6c9dc157ec02/")
+        self.assertEqual(r.status_code, 400)
+
+    def test_it_increments_n_pings(self):
+        self.client.get("/ping/%s/" % self.check.code)
+        self.client.get("/ping/%s/" % self.check.code)
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.n_pings, 2)
+        self.assertIsNotNone(self.check.last_ping)
+        ping = Ping.objects.latest("id")
+        self.assertEqual(ping.n, 2)
+        self.assertEqual(ping.owner_id, self.check.id)
+
+    def test_it_unpauses_check(self):
+        self.check.status = "paused"
+        self.check.save()
+        self.client.get("/ping/%s/" % self.check.code)
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "up")
+
+    @patch("hc.api.models.Check.send_alert")
+    def test_early_ping_marks_check_fast(self, mock_send_alert):
+        self.check.status = "up"
+        self.check.last_ping = timezone.now() - timedelta(minutes=5)
+        self.check.save()
+        self.client.get("/ping/%s/" % self.check.code)
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "fast")
+
+        # The alert is queued for sendalerts, not sent from the ping view
+        self.assertFalse(mock_send_alert.called)
+        flip = Flip.objects.get()
+        self.assertEqual(flip.owner, self.check)
+        self.assertEqual(flip.new_status, "fast")
+        self.assertIsNone(flip.processed)
+
+    def test_timely_ping_clears_fast(self):
+        self.check.status = "fast"
+        self.check.last_ping = timezone.now() - timedelta(days=1)
+        self.check.save()
+        self.client.get("/ping/%s/" % self.check.code)
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "up")
+        self.assertFalse(Flip.objects.exists())
+
+    def test_it_leaves_down_status_to_sendalerts(self):
+        self.check.status = "down"
+        self.check.last_ping = timezone.now() - timedelta(days=2)
+        self.check.save()
+        self.client.get("/ping/%s/" % self.check.code)
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "down")
@@ -0,0 +1,164 @@
+import json
+import os
+import shutil
+import signal
+import tempfile
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from hc.api.models import Check, Ping
+from hc.api.pings import PingBuffer, ping_to_dict
+from unittest.mock import Mock, patch
+
+
+class PingBufferTestCase(TestCase):
+
+    def setUp(self):
+        super(PingBufferTestCase, self).setUp()
+        self.check = Check.objects.create()
+        self.dir = tempfile.mkdtemp()
+        self.spool_path = os.path.join(self.dir, "spool.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        super(PingBufferTestCase, self).tearDown()
+
+    def test_it_flushes(self):
+        buf = PingBuffer(size=100, interval=1)
+        for n in range(3):
+            buf.add(Ping(owner=self.check, n=n))
+
+        self.assertEqual(Ping.objects.count(), 0)
+        self.assertEqual(buf.flush(), 3)
+        self.assertEqual(Ping.objects.count(), 3)
+        self.assertEqual(buf.flush(), 0)
+
+    def test_it_keeps_arrival_time(self):
+        created = timezone.now() - timedelta(minutes=1)
+        buf = PingBuffer(size=100, interval=1)
+        buf.add(Ping(owner=self.check, created=created))
+        buf.flush()
+
+        self.assertEqual(Ping.objects.get().created, created)
+
+    def test_it_wakes_up_when_full(self):
+        buf = PingBuffer(size=2, interval=1)
+        buf.add(Ping(owner=self.check))
+        self.assertFalse(buf.wakeup.is_set())
+        buf.add(Ping(owner=self.check))
+        self.assertTrue(buf.wakeup.is_set())
+
+    @patch("hc.api.pings.database_reachable", Mock(return_value=False))
+    def test_it_requeues_on_error(self):
+        buf = PingBuffer(size=100, interval=1)
+        buf.add(Ping(owner=self.check))
+        buf.add(Ping(owner=self.check))
+
+        with patch("hc.api.pings.Ping.objects.bulk_create") as mock:
+            mock.side_effect = RuntimeError
+            with self.assertRaises(RuntimeError):
+                buf.flush()
+
+        self.assertEqual(len(buf.pending), 2)
+        buf.flush()
+        self.assertEqual(Ping.objects.count(), 2)
+
+    def test_it_drops_bad_rows(self):
+        buf = PingBuffer(size=100, interval=1)
+        for ua in ("a", "bad", "c"):
+            buf.add(Ping(owner=self.check, ua=ua))
+
+        bulk_create = Ping.objects.bulk_create
+
+        def fail_on_bad(pings):
+            if any(ping.ua == "bad" for ping in pings):
+                raise RuntimeError
+            return bulk_create(pings)
+
+        with patch("hc.api.pings.Ping.objects.bulk_create") as mock:
+            mock.side_effect = fail_on_bad
+            self.assertEqual(buf.flush(), 2)
+
+        self.assertEqual(buf.pending, [])
+        uas = Ping.objects.order_by("id").values_list("ua", flat=True)
+        self.assertEqual(list(uas), ["a", "c"])
+
+    @patch("hc.api.pings.database_reachable", Mock(return_value=False))
+    def test_it_caps_the_queue(self):
+        buf = PingBuffer(size=100, interval=1, limit=2)
+        for n in range(3):
+            buf.add(Ping(owner=self.check, n=n))
+
+        with patch("hc.api.pings.Ping.objects.bulk_create") as mock:
+            mock.side_effect = RuntimeError
+            with self.assertRaises(RuntimeError):
+                buf.flush()
+
+        # The oldest one is gone
+        self.assertEqual([ping.n for ping in buf.pending], [1, 2])
+
+    def test_it_spools_and_cleans_up(self):
+        buf = PingBuffer(size=100, interval=1, spool_path=self.spool_path)
+        buf.add(Ping(owner=self.check, ua="foo"))
+
+        with open(self.spool_path) as f:
+            doc = json.loads(f.readline())
+        self.assertEqual(doc["ua"], "foo")
+
+        buf.flush()
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_it_replays_spool(self):
+        ping = Ping(owner=self.check, n=5, ua="foo")
+        with open(self.spool_path, "w") as f:
+            f.write(json.dumps(ping_to_dict(ping)) + "\n")
+            # A line cut short by a crash
+            f.write('{"owner_id": ')
+
+        buf = PingBuffer(size=100, interval=1, spool_path=self.spool_path)
+        buf.replay()
+
+        restored = Ping.objects.get()
+        self.assertEqual(restored.n, 5)
+        self.assertEqual(restored.ua, "foo")
+        self.assertEqual(restored.created, ping.created)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    @override_settings(PING_WRITE_MODE="buffered")
+    @patch("hc.api.pings.get_buffer")
+    def test_ping_view_uses_buffer(self, mock_get_buffer):
+        r = self.client.get("/ping/%s/" % self.check.code)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(Ping.objects.count(), 0)
+
+        ping = mock_get_buffer.return_value.add.call_args[0][0]
+        self.assertEqual(ping.owner_id, self.check.id)
+        self.assertEqual(ping.n, 1)
+
+    def test_it_flushes_large_batches(self):
+        # More rows than SQLite accepts in a single INSERT
+        buffer = PingBuffer(size=2000, interval=60)
+        for i in range(600):
+            buffer.add(Ping(owner=self.check, n=i))
+
+        self.assertEqual(buffer.flush(), 600)
+        self.assertEqual(Ping.objects.count(), 600)
+
+    @patch("hc.api.pings.atexit.register", Mock())
+    @patch("hc.api.pings.threading.Thread", Mock())
+    @patch("hc.api.pings.os.kill")
+    @patch("hc.api.pings.signal.signal")
+    def test_it_flushes_on_sigterm(self, mock_signal, mock_kill):
+        mock_signal.return_value = signal.SIG_DFL
+        buf = PingBuffer(size=100, interval=60)
+        buf.start()
+        handler = mock_signal.call_args[0][1]
+
+        buf.add(Ping(owner=self.check))
+        handler(signal.SIGTERM, None)
+        self.assertEqual(Ping.objects.count(), 1)
+
+        # Then it terminates as it would have without the handler
+        mock_signal.assert_called_with(signal.SIGTERM, signal.SIG_DFL)
+        self.assertTrue(mock_kill.called)
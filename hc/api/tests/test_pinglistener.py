@@ -0,0 +1,123 @@
+import asyncio
+import socket
+
+from django.test import TestCase
+from hc.api import pings
+from hc.api.listener import DatagramProtocol, LineProtocol, listen
+from hc.api.models import Check, Ping
+from hc.api.pings import PingBatcher
+from unittest.mock import Mock, patch
+
+
+class PingListenerTestCase(TestCase):
+
+    def setUp(self):
+        super(PingListenerTestCase, self).setUp()
+        self.check = Check.objects.create()
+        self.code = str(self.check.code).encode()
+        self.batcher = PingBatcher(size=100, interval=1)
+
+    def test_udp_works(self):
+        protocol = DatagramProtocol(self.batcher)
+        protocol.datagram_received(self.code, ("1.2.3.4", 1234))
+        self.batcher.flush()
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.n_pings, 1)
+        self.assertEqual(self.check.status, "up")
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.scheme, "udp")
+        self.assertEqual(ping.remote_addr, "1.2.3.4")
+
+    def test_udp_takes_several_codes(self):
+        protocol = DatagramProtocol(self.batcher)
+        data = b"\n".join([self.code, b"not-uuid", self.code + b"\r"])
+        protocol.datagram_received(data, ("1.2.3.4", 1234))
+
+        self.assertEqual(len(self.batcher.pending), 2)
+
+    def test_tcp_works(self):
+        transport = Mock()
+        transport.get_extra_info.return_value = ("1.2.3.4", 1234)
+
+        protocol = LineProtocol(self.batcher)
+        protocol.connection_made(transport)
+        protocol.data_received(self.code[:10])
+        protocol.data_received(self.code[10:] + b"\nfoo\n")
+
+        replies = [c[0][0] for c in transport.write.call_args_list]
+        self.assertEqual(replies, [b"OK\n", b"ERR\n"])
+
+        result = self.batcher.flush()
+        self.assertEqual(result[self.check.code][1], 1)
+        self.assertEqual(Ping.objects.get().scheme, "tcp")
+
+    def test_tcp_closes_on_long_lines(self):
+        transport = Mock()
+        protocol = LineProtocol(self.batcher)
+        protocol.connection_made(transport)
+        protocol.data_received(b"x" * 200)
+
+        transport.close.assert_called_once_with()
+
+    def test_it_batches_pings(self):
+        for i in range(10):
+            check = Check.objects.create()
+            self.batcher.add(check.code, Ping(scheme="udp"))
+
+        # Savepoint, SELECT ... FOR UPDATE, UPDATE, INSERT, release
+        with self.assertNumQueries(5):
+            self.batcher.flush()
+
+        self.assertEqual(Ping.objects.count(), 10)
+        self.assertEqual(Check.objects.filter(n_pings=1).count(), 10)
+
+    @patch("hc.api.pings.record_many")
+    def test_it_requeues_failed_batch(self, mock_record_many):
+        mock_record_many.side_effect = Exception("database is down")
+        self.batcher.add(self.check.code, Ping())
+
+        with self.assertRaises(Exception):
+            self.batcher.flush()
+
+        self.assertEqual(len(self.batcher.pending), 1)
+
+    def test_it_drops_bad_pings(self):
+        other = Check.objects.create()
+        self.batcher.add(self.check.code, Ping(scheme="bad"))
+        self.batcher.add(other.code, Ping(scheme="udp"))
+
+        record_many = pings.record_many
+
+        def fail_on_bad(items):
+            if any(ping.scheme == "bad" for code, ping in items):
+                raise Exception("value too long")
+            return record_many(items)
+
+        with patch("hc.api.pings.record_many", side_effect=fail_on_bad):
+            result = self.batcher.flush()
+
+        self.assertEqual(list(result), [other.code])
+        self.assertEqual(self.batcher.pending, [])
+        self.assertEqual(Ping.objects.get().owner, other)
+
+    def test_it_listens(self):
+        loop = asyncio.new_event_loop()
+        batcher = Mock()
+        udp, tcp = listen(loop, batcher, "127.0.0.1", udp_port=0, tcp_port=0)
+
+        udp_port = udp.get_extra_info("sockname")[1]
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.sendto(self.code, ("127.0.0.1", udp_port))
+        sock.close()
+
+        loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+        udp.close()
+        tcp.close()
+        loop.run_until_complete(tcp.wait_closed())
+        loop.close()
+
+        code, ping = batcher.add.call_args[0]
+        self.assertEqual(code, self.check.code)
+        self.assertEqual(ping.scheme, "udp")
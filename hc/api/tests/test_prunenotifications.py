@@ -0,0 +1,71 @@
+from datetime import timedelta as td
+
+from django.core.management import call_command
+from django.utils import timezone
+from hc.api.models import Channel, Check, Flip, Notification
+from hc.test import BaseTestCase
+
+
+class PruneNotificationsTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(PruneNotificationsTestCase, self).setUp()
+        self.check = Check.objects.create(user=self.alice)
+        self.channel = Channel.objects.create(user=self.alice, kind="email")
+
+    def add(self, days_ago, channel=None):
+        n = Notification.objects.create(owner=self.check,
+                                        channel=channel or self.channel,
+                                        check_status="down")
+        created = timezone.now() - td(days=days_ago)
+        Notification.objects.filter(id=n.id).update(created=created)
+
+    def ages(self):
+        now = timezone.now()
+        q = Notification.objects.filter(channel=self.channel)
+        return sorted((now - n.created).days for n in q)
+
+    def test_it_prunes_old_notifications(self):
+        for days_ago in (1, 10, 40, 50):
+            self.add(days_ago)
+
+        result = call_command("prunenotifications", days=30, keep=0)
+        self.assertEqual(result, "Done! Pruned 2 notifications")
+        self.assertEqual(self.ages(), [1, 10])
+
+    def test_it_keeps_newest_per_channel(self):
+        for days_ago in (40, 50, 60):
+            self.add(days_ago)
+
+        call_command("prunenotifications", days=30, keep=2)
+        self.assertEqual(self.ages(), [40, 50])
+
+    def test_channels_are_independent(self):
+        other = Channel.objects.create(user=self.alice, kind="email")
+        self.add(40, channel=other)
+        for days_ago in (1, 2, 40):
+            self.add(days_ago)
+
+        call_command("prunenotifications", days=30, keep=1)
+        self.assertEqual(self.ages(), [1, 2])
+        self.assertEqual(Notification.objects.filter(channel=other).count(), 1)
+
+    def test_it_deletes_in_batches(self):
+        for days_ago in range(40, 45):
+            self.add(days_ago)
+
+        result = call_command("prunenotifications", days=30, keep=0, batch=2)
+        self.assertEqual(result, "Done! Pruned 5 notifications")
+
+    def test_it_prunes_processed_flips(self):
+        old = timezone.now() - td(days=40)
+        Flip.objects.create(owner=self.check, new_status="fast",
+                            processed=old)
+        recent = Flip.objects.create(owner=self.check, new_status="fast",
+                                     processed=timezone.now())
+        pending = Flip.objects.create(owner=self.check, new_status="fast",
+                                      created=old)
+
+        call_command("prunenotifications", days=30, keep=0)
+        remaining = Flip.objects.order_by("id").values_list("id", flat=True)
+        self.assertEqual(list(remaining), [recent.id, pending.id])
@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from hc.api import prune
+from hc.api.models import Check, Ping
+from hc.api.prune import Pruner, split
+from hc.test import BaseTestCase
+from unittest.mock import patch
+
+
+class PrunePingsTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(PrunePingsTestCase, self).setUp()
+        self.profile.ping_log_limit = 3
+        self.profile.save()
+
+        self.check = Check.objects.create(user=self.alice, n_pings=10)
+        for n in range(1, 11):
+            Ping.objects.create(owner=self.check, n=n)
+
+        self.dir = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.dir, "prune.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        super(PrunePingsTestCase, self).tearDown()
+
+    def remaining(self):
+        q = Ping.objects.filter(owner=self.check).order_by("n")
+        return list(q.values_list("n", flat=True))
+
+    def test_it_prunes(self):
+        self.assertEqual(Pruner(chunk=1000).run(), 6)
+        self.assertEqual(self.remaining(), [7, 8, 9, 10])
+
+    def test_it_leaves_checks_without_owner_alone(self):
+        check = Check.objects.create(n_pings=500)
+        Ping.objects.create(owner=check, n=1)
+
+        Pruner(chunk=1000).run()
+        self.assertTrue(Ping.objects.filter(owner=check).exists())
+
+    def test_it_works_in_chunks(self):
+        lines = []
+        Pruner(chunk=2, log=lines.append).run()
+
+        self.assertEqual(self.remaining(), [7, 8, 9, 10])
+        self.assertTrue(len(lines) >= 5)
+        self.assertIn("rows/s", lines[0])
+
+    def test_it_resumes_from_checkpoint(self):
+        calls, prune_range = [], prune.prune_range
+
+        def fail_second(lo, hi, archived):
+            calls.append((lo, hi))
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+
+            return prune_range(lo, hi, archived)
+
+        max_id = Ping.objects.latest("id").id
+        pruner = Pruner(chunk=max_id - 2, checkpoint=self.checkpoint)
+        with patch("hc.api.prune.prune_range", fail_second):
+            with self.assertRaises(KeyboardInterrupt):
+                pruner.run()
+
+        with open(self.checkpoint) as f:
+            doc = json.load(f)
+        self.assertEqual(doc["ranges"], [[max_id - 2, max_id + 1]])
+
+        pruner = Pruner(chunk=max_id - 2, checkpoint=self.checkpoint)
+        self.assertEqual(pruner.run(), 6)
+        self.assertEqual(self.remaining(), [7, 8, 9, 10])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    @patch("hc.api.prune.time.sleep")
+    def test_it_throttles(self, mock_sleep):
+        Pruner(chunk=1000, max_rate=2).run()
+
+        # 6 rows at 2 rows per second
+        seconds = mock_sleep.call_args[0][0]
+        self.assertTrue(2 < seconds <= 3)
+
+    def test_split(self):
+        self.assertEqual(split(0, 10, 3), [[0, 4], [4, 8], [8, 10]])
+        self.assertEqual(split(0, 2, 4), [[0, 1], [1, 2]])
+
+    def test_command_works(self):
+        result = call_command("prunepings", chunk=4)
+        self.assertEqual(result, "Done! Pruned 6 pings")
+
+    def test_slow_command_works(self):
+        with patch("hc.api.prune.time.sleep"):
+            result = call_command("prunepingsslow")
+
+        self.assertEqual(result, "Done! Pruned 6 pings")
+        self.assertEqual(self.remaining(), [7, 8, 9, 10])
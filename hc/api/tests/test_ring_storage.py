@@ -0,0 +1,106 @@
+from unittest.mock import patch
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test.utils import override_settings
+from hc.api import pings
+from hc.api.models import Check, Ping
+from hc.api.pings import PingBuffer, record_many, upsert_pings
+from hc.api.prune import prune_range
+from hc.test import BaseTestCase
+
+
+@override_settings(PING_STORAGE="ring")
+class RingStorageTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(RingStorageTestCase, self).setUp()
+        # The partial index comes from a migration, a test database built
+        # straight from the models doesn't have it
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS "
+                           "api_ping_owner_slot ON api_ping (owner_id, slot) "
+                           "WHERE slot IS NOT NULL")
+        self.profile.ping_log_limit = 3
+        self.profile.save()
+
+        self.check = Check.objects.create(user=self.alice)
+
+    def test_it_wraps_around(self):
+        for i in range(5):
+            self.client.get("/ping/%s/" % self.check.code)
+
+        pings = Ping.objects.filter(owner=self.check).order_by("n")
+        self.assertEqual([p.n for p in pings], [3, 4, 5])
+        self.assertEqual(sorted(p.slot for p in pings), [0, 1, 2])
+
+    def test_it_writes_all_columns(self):
+        upsert_pings([Ping(owner=self.check, n=1, scheme="https",
+                           remote_addr="1.2.3.4", method="POST", ua="foo")])
+        upsert_pings([Ping(owner=self.check, n=4, scheme="http",
+                           remote_addr="5.6.7.8", method="GET", ua="bar")])
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.n, 4)
+        self.assertEqual(ping.slot, 1)
+        self.assertEqual(ping.scheme, "http")
+        self.assertEqual(ping.remote_addr, "5.6.7.8")
+        self.assertEqual(ping.ua, "bar")
+
+    def test_later_pings_win_within_batch(self):
+        buf = PingBuffer(size=100, interval=1)
+        for n in (5, 2):
+            buf.add(Ping(owner=self.check, n=n))
+
+        buf.flush()
+        self.assertEqual(Ping.objects.get().n, 5)
+
+    def test_checks_without_owner_use_default_limit(self):
+        check = Check.objects.create()
+        upsert_pings([Ping(owner=check, n=n) for n in range(1, 102)])
+
+        self.assertEqual(Ping.objects.filter(owner=check).count(), 100)
+
+    def test_record_many_uses_it(self):
+        items = [(self.check.code, Ping()) for i in range(5)]
+        record_many(items)
+
+        self.assertEqual(Ping.objects.filter(owner=self.check).count(), 3)
+
+    def test_log_reads_ring_in_order(self):
+        for i in range(5):
+            self.client.get("/ping/%s/" % self.check.code)
+
+        self.client.login(username="alice@example.org", password="password")
+        r = self.client.get("/checks/%s/log/" % self.check.code)
+        self.assertEqual(r.status_code, 200)
+
+        pings = [item["ping"].n for item in r.context["pings"]
+                 if "ping" in item]
+        self.assertEqual(pings, [5, 4, 3])
+
+    @patch("hc.api.pings.is_partitioned", return_value=True)
+    def test_it_refuses_partitioned_table(self, mock):
+        pings._ring_supported = None
+        try:
+            with self.assertRaises(ImproperlyConfigured):
+                pings.save_ping(Ping(owner=self.check, n=1))
+            with self.assertRaises(ImproperlyConfigured):
+                record_many([(self.check.code, Ping())])
+        finally:
+            pings._ring_supported = None
+
+        self.assertFalse(Ping.objects.exists())
+
+    def test_pruner_deletes_slots_beyond_lowered_limit(self):
+        self.profile.ping_log_limit = 5
+        self.profile.save()
+        upsert_pings([Ping(owner=self.check, n=n) for n in range(1, 6)])
+        Check.objects.filter(id=self.check.id).update(n_pings=5)
+
+        self.profile.ping_log_limit = 3
+        self.profile.save()
+        prune_range(0, 2 ** 31)
+
+        pings = Ping.objects.filter(owner=self.check)
+        self.assertEqual(sorted(p.slot for p in pings), [0, 2])
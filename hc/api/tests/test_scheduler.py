@@ -0,0 +1,149 @@
+from concurrent.futures import Executor, Future
+from datetime import timedelta as td
+
+from django.utils import timezone
+from hc.api.management.commands.sendalerts import Command
+from hc.api.models import Check, Flip
+from hc.api.scheduler import AlertScheduler, next_deadline
+from hc.test import BaseTestCase
+from unittest.mock import patch
+
+
+class InlineExecutor(Executor):
+    """ Runs jobs in the calling thread, so they see the test's
+    database transaction. """
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class AlertSchedulerTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(AlertSchedulerTestCase, self).setUp()
+        self.now = timezone.now()
+        self.check = Check.objects.create(user=self.alice, status="up",
+                                          last_ping=self.now)
+        self.check.alert_after = self.now + td(hours=1)
+        self.check.save()
+
+    def test_next_deadline(self):
+        check = Check(user=self.alice, status="up", alert_after=self.now)
+        self.assertEqual(next_deadline(check, self.now), self.now)
+
+        check.status = "down"
+        check.nag_after = self.now + td(minutes=5)
+        self.assertEqual(next_deadline(check, self.now + td(minutes=1)),
+                         check.nag_after)
+
+        check.nag_status = False
+        self.assertIsNone(next_deadline(check, self.now + td(minutes=1)))
+
+        # Pinged while down: due right away
+        check.alert_after = self.now + td(hours=1)
+        self.assertEqual(next_deadline(check, self.now), self.now)
+
+        check.status = "paused"
+        self.assertIsNone(next_deadline(check, self.now))
+
+    def test_it_returns_due_checks(self):
+        Check.objects.filter(id=self.check.id).update(
+            alert_after=self.now - td(minutes=1))
+
+        scheduler = AlertScheduler()
+        checks, flips = scheduler.wait(0)
+        self.assertEqual(checks, [self.check])
+        self.assertEqual(flips, [])
+
+    def test_it_sleeps_until_deadline(self):
+        scheduler = AlertScheduler(poll=3600)
+        scheduler.resync()
+        self.assertEqual(scheduler.deadlines[self.check.id],
+                         self.check.alert_after)
+
+        # Nothing due, nothing changed: no queries while waiting
+        scheduler.flips_pending = False
+        with self.assertNumQueries(0):
+            self.assertEqual(scheduler.due_checks(), [])
+            self.assertEqual(scheduler.due_flips(), [])
+
+    def test_it_verifies_moved_deadlines(self):
+        scheduler = AlertScheduler()
+        scheduler.resync()
+        scheduler.heap = [(self.now - td(minutes=1), self.check.id)]
+        scheduler.deadlines[self.check.id] = self.now - td(minutes=1)
+
+        # The check got pinged, the deadline in the database is later
+        self.assertEqual(scheduler.due_checks(), [])
+        self.assertEqual(scheduler.deadlines[self.check.id],
+                         self.check.alert_after)
+
+    @patch("hc.api.scheduler.time.sleep")
+    def test_it_polls_for_changes(self, mock_sleep):
+        scheduler = AlertScheduler()
+        scheduler.resync()
+
+        down = Check.objects.create(user=self.alice, status="down")
+        Check.objects.filter(id=down.id).update(
+            last_ping=timezone.now(),
+            alert_after=timezone.now() + td(hours=1))
+
+        checks, flips = scheduler.wait(5)
+        self.assertEqual(checks, [down])
+        self.assertTrue(mock_sleep.called)
+
+    @patch("hc.api.scheduler.time.sleep")
+    def test_it_backs_off_while_idle(self, mock_sleep):
+        scheduler = AlertScheduler(poll=1, max_poll=3)
+        scheduler.resync()
+
+        scheduler.changes(1)
+        self.assertEqual(scheduler.interval, 2)
+        scheduler.changes(2)
+        self.assertEqual(scheduler.interval, 3)
+
+        down = Check.objects.create(user=self.alice, status="down")
+        Check.objects.filter(id=down.id).update(
+            alert_after=timezone.now() + td(hours=1))
+
+        self.assertEqual(scheduler.changes(3), {down.id})
+        self.assertEqual(scheduler.interval, 1)
+
+    def test_it_returns_flips(self):
+        flip = Flip.objects.create(owner=self.check, new_status="fast")
+
+        scheduler = AlertScheduler()
+        checks, flips = scheduler.wait(0)
+        self.assertEqual(flips, [flip])
+
+        # Not queried again until something may have changed
+        self.assertFalse(scheduler.flips_pending)
+
+    @patch("hc.api.management.commands.sendalerts.executor",
+           InlineExecutor())
+    @patch("hc.api.models.Check.send_alert")
+    def test_command_sends_going_up(self, mock_send_alert):
+        mock_send_alert.return_value = []
+        # Pinged on time while down
+        Check.objects.filter(id=self.check.id).update(status="down")
+
+        scheduler = AlertScheduler()
+        self.assertTrue(Command().handle_scheduled(scheduler, 0))
+        self.assertEqual(mock_send_alert.call_count, 1)
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "up")
+        # Back on the heap, to go down again
+        self.assertEqual(scheduler.deadlines[self.check.id],
+                         self.check.alert_after)
+
+    @patch("hc.api.management.commands.sendalerts.Command.handle_one")
+    def test_command_handles_scheduled(self, mock_handle_one):
+        Check.objects.filter(id=self.check.id).update(
+            alert_after=self.now - td(minutes=1))
+
+        scheduler = AlertScheduler()
+        self.assertTrue(Command().handle_scheduled(scheduler, 0))
+        self.assertEqual(mock_handle_one.call_args[0][0], self.check)
@@ -1,7 +1,7 @@
 from datetime import timedelta
 from django.utils import timezone
 from hc.api.management.commands.sendalerts import Command
-from hc.api.models import Check
+from hc.api.models import Check, Flip
 from hc.test import BaseTestCase
 from unittest.mock import patch
 
@@ -10,7 +10,7 @@ class SendAlertsTestCase(BaseTestCase):
     This basically handles alerts to be send to users, checked if it's possible
     to send to single user, or many user's at the same time.
     '''
-    @patch("hc.api.management.commands.sendalerts.Command.handle_one")
+    @patch("hc.api.management.commands.sendalerts.Command.send_one")
     def test_it_handles_few(self, mock):
         yesterday = timezone.now() - timedelta(days=1)
         names = ["Check %d" % d for d in range(0, 10)]
@@ -37,3 +37,115 @@ class SendAlertsTestCase(BaseTestCase):
         check.save()
         # Expect no exceptions--
         Command().handle_one(check)
+
+    @patch("hc.api.management.commands.sendalerts.Command.handle_flip")
+    def test_it_handles_flips(self, mock):
+        check = Check.objects.create(user=self.alice, status="up")
+        flip = Flip.objects.create(owner=check, new_status="fast")
+        Flip.objects.create(owner=check, new_status="fast",
+                            processed=timezone.now())
+
+        self.assertTrue(Command().handle_many())
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(mock.call_args[0][0], flip)
+
+    @patch("hc.api.models.Check.send_alert")
+    def test_handle_flip_sends_alert_once(self, mock_send_alert):
+        mock_send_alert.return_value = []
+        check = Check.objects.create(user=self.alice, status="up")
+        flip = Flip.objects.create(owner=check, new_status="fast")
+
+        self.assertTrue(Command().handle_flip(flip))
+        self.assertFalse(Command().handle_flip(flip))
+        self.assertEqual(mock_send_alert.call_count, 1)
+
+        flip.refresh_from_db()
+        self.assertIsNotNone(flip.processed)
+
+    @patch("hc.api.models.Check.send_alert")
+    def test_handle_one_claims_check(self, mock_send_alert):
+        mock_send_alert.return_value = []
+        check = Check(user=self.alice, status="up")
+        check.last_ping = timezone.now() - timedelta(days=2)
+        check.alert_after = check.last_ping + timedelta(days=1)
+        check.save()
+
+        # Two workers selected the same check
+        first = Check.objects.get(id=check.id)
+        second = Check.objects.get(id=check.id)
+
+        self.assertTrue(Command().handle_one(first))
+        self.assertFalse(Command().handle_one(second))
+        self.assertEqual(mock_send_alert.call_count, 1)
+
+        check.refresh_from_db()
+        self.assertEqual(check.status, "down")
+        self.assertIsNotNone(check.nag_after)
+
+    @patch("hc.api.models.Check.send_alert")
+    def test_claim_handles_recovering_check(self, mock_send_alert):
+        mock_send_alert.return_value = []
+        # Pinged on time while down: get_status() would say "fast"
+        check = Check(user=self.alice, status="down")
+        check.last_ping = timezone.now()
+        check.alert_after = check.last_ping + timedelta(days=1)
+        check.save()
+
+        self.assertTrue(Command().handle_one(check))
+        check.refresh_from_db()
+        self.assertEqual(check.status, "up")
+
+        # Not due any more
+        self.assertFalse(Command().claim(check))
+
+    @patch("hc.api.models.Check.send_alert")
+    def test_handle_one_skips_check_pinged_since(self, mock_send_alert):
+        check = Check(user=self.alice, status="up")
+        check.last_ping = timezone.now() - timedelta(days=2)
+        check.alert_after = check.last_ping + timedelta(days=1)
+        check.save()
+
+        Check.objects.filter(id=check.id).update(last_ping=timezone.now())
+
+        self.assertFalse(Command().handle_one(check))
+        self.assertFalse(mock_send_alert.called)
+
+    @patch("hc.api.management.commands.sendalerts.Command.send_one")
+    def test_handle_many_applies_transitions(self, mock_send_one):
+        now = timezone.now()
+        going_down = Check.objects.create(
+            user=self.alice, status="up",
+            alert_after=now - timedelta(minutes=1))
+        going_up = Check.objects.create(user=self.alice, status="down",
+                                        alert_after=now + timedelta(hours=1))
+        nagging = Check.objects.create(user=self.alice, status="down",
+                                       alert_after=now - timedelta(days=1),
+                                       nag_after=now - timedelta(minutes=1))
+        quiet = Check.objects.create(user=self.alice, status="down",
+                                     alert_after=now - timedelta(days=1),
+                                     nag_after=now - timedelta(minutes=1),
+                                     nag_status=False)
+        # Checks without an owner are left alone
+        Check.objects.create(status="up", alert_after=now - timedelta(days=1))
+
+        with self.assertNumQueries(5):
+            self.assertTrue(Command().handle_many())
+
+        sent = set(args[0].id for args, kwargs in mock_send_one.call_args_list)
+        self.assertEqual(sent, set([going_down.id, going_up.id, nagging.id]))
+
+        going_down.refresh_from_db()
+        self.assertEqual(going_down.status, "down")
+        self.assertTrue(going_down.nag_after > now + timedelta(minutes=59))
+
+        going_up.refresh_from_db()
+        self.assertEqual(going_up.status, "up")
+
+        nagging.refresh_from_db()
+        self.assertTrue(nagging.nag_after > now + timedelta(minutes=59))
+
+        quiet.refresh_from_db()
+        self.assertTrue(quiet.nag_after < now)
+
+        # Nothing is due any more
+        self.assertFalse(Command().handle_many())
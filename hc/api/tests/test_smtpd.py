@@ -0,0 +1,97 @@
+import asyncio
+from concurrent.futures import Executor, Future
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from hc.api.models import Check, Ping
+from hc.api.pings import PingBatcher
+from hc.api.smtpd import SMTPServer, parse_recipient
+from unittest.mock import Mock, patch
+
+
+class InlineExecutor(Executor):
+    """ Runs jobs in the calling thread, so they see the test's
+    database transaction. """
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+@override_settings(PING_EMAIL_DOMAIN="hc.example.org")
+@patch("hc.api.smtpd.close_old_connections", Mock())
+class SmtpdTestCase(TestCase):
+
+    def setUp(self):
+        super(SmtpdTestCase, self).setUp()
+        self.check = Check.objects.create()
+        self.batcher = PingBatcher(size=100, interval=1)
+        self.smtp = SMTPServer(self.batcher, InlineExecutor())
+
+    def talk(self, *lines):
+        """ Send `lines` to the server, return the replies' status codes. """
+
+        async def client(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            replies = [await reader.readline()]
+            for line in lines:
+                writer.write(line.encode() + b"\r\n")
+                # Message lines get no reply until the final "."
+                if not line.startswith("Subject"):
+                    replies.append(await reader.readline())
+            writer.close()
+            return [int(reply[:3]) for reply in replies]
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            coro = asyncio.start_server(self.smtp.handle, "127.0.0.1", 0)
+            server = loop.run_until_complete(coro)
+            port = server.sockets[0].getsockname()[1]
+            codes = loop.run_until_complete(client(port))
+            # Let the server side of the connection wind down
+            loop.run_until_complete(asyncio.sleep(0.05))
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+        finally:
+            loop.close()
+            asyncio.set_event_loop(None)
+
+        return codes
+
+    def test_it_works(self):
+        to = "RCPT TO:<%s@hc.example.org>" % self.check.code
+        codes = self.talk("EHLO client", "MAIL FROM:<alice@example.org>", to,
+                          "DATA", "Subject: hello", ".", "QUIT")
+        self.assertEqual(codes, [220, 250, 250, 250, 354, 250, 221])
+
+        self.batcher.flush()
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.n_pings, 1)
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.scheme, "email")
+        self.assertEqual(ping.ua, "Email from <alice@example.org>")
+        self.assertEqual(ping.remote_addr, "127.0.0.1")
+
+    def test_it_rejects_unknown_code(self):
+        to = "RCPT TO:<%s@hc.example.org>" % Check().code
+        codes = self.talk("HELO client", "MAIL FROM:<>", to, "DATA", "QUIT")
+        self.assertEqual(codes, [220, 250, 250, 550, 503, 221])
+        self.assertEqual(self.batcher.pending, [])
+
+    def test_it_requires_mail_from(self):
+        to = "RCPT TO:<%s@hc.example.org>" % self.check.code
+        codes = self.talk("HELO client", to)
+        self.assertEqual(codes, [220, 250, 503])
+
+    def test_it_parses_recipients(self):
+        code = str(self.check.code)
+        self.assertEqual(parse_recipient("<%s@hc.example.org>" % code),
+                         self.check.code)
+        self.assertEqual(parse_recipient("%s@HC.example.org" % code),
+                         self.check.code)
+        self.assertIsNone(parse_recipient("<%s@example.org>" % code))
+        self.assertIsNone(parse_recipient("<foo@hc.example.org>"))
+        self.assertIsNone(parse_recipient("<>"))
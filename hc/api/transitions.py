@@ -0,0 +1,72 @@
+""" Set-based status transitions for sendalerts.
+
+`apply_transitions` moves all due checks to their new status with three
+UPDATE statements, one each for checks going down, checks going up and
+checks due for a nag, and returns the ids each statement changed. The
+statements are also the claim: when several sendalerts processes run them
+at the same time, every row is changed, and so alerted about, only once.
+
+PostgreSQL and SQLite report the changed ids with UPDATE ... RETURNING.
+MySQL has no RETURNING, so there the rows are locked and read first inside
+the same transaction.
+
+"""
+
+from django.db import connection, transaction
+
+# now + the check's nag interval
+NAG_AFTER_SQL = {
+    "postgresql": "%s + {interval}",
+    "mysql": "%s + INTERVAL {interval} MICROSECOND",
+    "sqlite": "strftime('%%Y-%%m-%%d %%H:%%M:%%f',"
+              " julianday(%s) + {interval} / 86400000000.0)"
+}
+
+GOING_DOWN = ("status = 'down', nag_after = {nag_after}",
+              "status = 'up' AND alert_after < %s")
+
+GOING_UP = ("status = 'up'",
+            "status = 'down' AND alert_after > %s")
+
+NAGGING = ("nag_after = {nag_after}",
+           "status = 'down' AND nag_status AND nag_after < %s")
+
+
+def transition(assignments, condition, now):
+    """ Apply one transition to all matching checks with an owner,
+    return the ids of the changed checks. """
+
+    nag_after = NAG_AFTER_SQL[connection.vendor].format(
+        interval=connection.ops.quote_name("interval"))
+    assignments = assignments.format(nag_after=nag_after)
+    where = "user_id IS NOT NULL AND " + condition
+
+    # One parameter for each %s in the assignments, then the condition's
+    value = connection.ops.adapt_datetimefield_value(now)
+    set_params = [value] * assignments.count("%s")
+
+    if connection.vendor == "mysql":
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM api_check WHERE %s FOR UPDATE"
+                           % where, [value])
+            ids = [row[0] for row in cursor.fetchall()]
+            if ids:
+                placeholders = ", ".join(["%s"] * len(ids))
+                cursor.execute("UPDATE api_check SET %s WHERE id IN (%s)"
+                               % (assignments, placeholders),
+                               set_params + ids)
+            return ids
+
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE api_check SET %s WHERE %s RETURNING id"
+                       % (assignments, where), set_params + [value])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def apply_transitions(now):
+    """ Move due checks to their new status. Return the ids of checks
+    which went down, went up, and need a nag, as three lists. """
+
+    return (transition(*GOING_DOWN, now=now),
+            transition(*GOING_UP, now=now),
+            transition(*NAGGING, now=now))
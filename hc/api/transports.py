@@ -3,8 +3,9 @@ from django.template.loader import render_to_string
 from django.utils import timezone
 import json
 import requests
-from six.moves.urllib.parse import quote
+from six.moves.urllib.parse import quote, urlsplit
 
+from hc.api.breaker import CIRCUIT_OPEN, circuits
 from hc.lib import emails, sms
 
 
@@ -14,6 +15,9 @@ def tmpl(template_name, **ctx):
 
 
 class Transport(object):
+    # Can send one message about several checks, see notify_digest
+    digests = False
+
     def __init__(self, channel):
         self.channel = channel
 
@@ -27,6 +31,16 @@ class Transport(object):
 
         raise NotImplementedError()
 
+    def notify_digest(self, checks):
+        """ Send one notification about several checks going down.
+
+        Only transports with `digests` set implement this. It returns
+        the same as notify().
+
+        """
+
+        raise NotImplementedError()
+
     def test(self):
         """ Send test message.
 
@@ -42,6 +56,8 @@ class Transport(object):
 
 
 class AfricasTalking(Transport):
+    digests = True
+
     def notify(self, check):
         if self.channel.api_key is "":
             return "API Key missing"
@@ -53,8 +69,19 @@ class AfricasTalking(Transport):
 
         return sms.send_sms(ctx)
 
+    def notify_digest(self, checks):
+        if self.channel.api_key is "":
+            return "API Key missing"
+
+        message = tmpl("digest_message.html", down_checks=checks)
+        instance = sms.AfricasTalkingSMS(self.channel.username,
+                                         self.channel.api_key)
+        return instance.send(self.channel.value, message)
+
 
 class Email(Transport):
+    digests = True
+
     def notify(self, check):
         if not self.channel.email_verified:
             return "Email not verified"
@@ -72,17 +99,75 @@ class Email(Transport):
         }
         emails.alert(self.channel.value, ctx)
 
+    def notify_digest(self, checks):
+        if not self.channel.email_verified:
+            return "Email not verified"
+
+        ctx = {
+            "down_checks": checks,
+            "checks": self.checks(),
+            "now": timezone.now()
+        }
+        emails.digest(self.channel.value, ctx)
+
 
 class HttpTransport(Transport):
+    # Set while prepare() collects requests instead of sending them
+    prepared = None
+
+    def prepare(self, check):
+        """ Build the request notify() would send, without sending it.
+
+        Returns a requests.PreparedRequest, or whatever notify() returned
+        if it didn't get as far as making a request.
+
+        """
+
+        self.prepared = []
+        try:
+            result = self.notify(check)
+        finally:
+            prepared, self.prepared = self.prepared, None
+
+        return prepared[0] if prepared else result
+
+    def breaker_key(self, url):
+        """ Return the circuit breaker key for requests to `url`.
+
+        The notification providers serve all of their accounts from the
+        same hosts, and one account's failures say nothing about the
+        others, so the breakers of their channels are per channel.
+
+        """
+
+        return "channel-%d" % self.channel.id
 
     def request(self, method, url, **kwargs):
+        if self.prepared is not None:
+            # The delivery engine checks the breaker itself
+            return self.send(method, url, **kwargs)
+
+        key = self.breaker_key(url)
+        if not circuits.allow(key):
+            return CIRCUIT_OPEN
+
+        error = self.send(method, url, **kwargs)
+        circuits.record(key, error)
+        return error
+
+    def send(self, method, url, **kwargs):
         try:
             options = dict(kwargs)
             if "headers" not in options:
                 options["headers"] = {}
 
-            options["timeout"] = 5
             options["headers"]["User-Agent"] = "healthchecks.io"
+            if self.prepared is not None:
+                r = requests.Request(method.upper(), url, **options)
+                self.prepared.append(r.prepare())
+                return
+
+            options["timeout"] = 5
 
             r = requests.request(method, url, **options)
             if r.status_code not in (200, 201, 204):
@@ -104,6 +189,10 @@ class HttpTransport(Transport):
 
 
 class Webhook(HttpTransport):
+    def breaker_key(self, url):
+        # A dead webhook host takes all of its webhooks with it
+        return urlsplit(url).netloc.lower()
+
     def notify(self, check):
         url = self.channel.value_down
         if check.status == "up":
@@ -138,13 +227,22 @@ class Webhook(HttpTransport):
 
 
 class Slack(HttpTransport):
+    digests = True
+
     def notify(self, check):
         text = tmpl("slack_message.json", check=check)
         payload = json.loads(text)
         return self.post(self.channel.slack_webhook_url, payload)
 
+    def notify_digest(self, checks):
+        text = tmpl("slack_digest.json", down_checks=checks)
+        payload = json.loads(text)
+        return self.post(self.channel.slack_webhook_url, payload)
+
 
 class HipChat(HttpTransport):
+    digests = True
+
     def notify(self, check):
         text = tmpl("hipchat_message.html", check=check)
         payload = {
@@ -153,6 +251,11 @@ class HipChat(HttpTransport):
         }
         return self.post(self.channel.value, payload)
 
+    def notify_digest(self, checks):
+        text = tmpl("digest_message.html", down_checks=checks)
+        return self.post(self.channel.value, {"message": text,
+                                              "color": "red"})
+
 
 class PagerDuty(HttpTransport):
     URL = "https://events.pagerduty.com/generic/2010-04-15/create_event.json"
@@ -172,8 +275,17 @@ class PagerDuty(HttpTransport):
 
 
 class Pushbullet(HttpTransport):
+    digests = True
+
     def notify(self, check):
         text = tmpl("pushbullet_message.html", check=check)
+        return self.push(text)
+
+    def notify_digest(self, checks):
+        text = tmpl("digest_message.html", down_checks=checks)
+        return self.push(text)
+
+    def push(self, text):
         url = "https://api.pushbullet.com/v2/pushes"
         headers = {
             "Access-Token": self.channel.value,
@@ -190,6 +302,7 @@ class Pushbullet(HttpTransport):
 
 class Pushover(HttpTransport):
     URL = "https://api.pushover.net/1/messages.json"
+    digests = True
 
     def notify(self, check):
         others = self.checks().filter(status="down").exclude(code=check.code)
@@ -199,6 +312,13 @@ class Pushover(HttpTransport):
         }
         text = tmpl("pushover_message.html", **ctx)
         title = tmpl("pushover_title.html", **ctx)
+        return self.push(title, text)
+
+    def notify_digest(self, checks):
+        text = tmpl("pushover_digest.html", down_checks=checks)
+        return self.push("%d checks are DOWN" % len(checks), text)
+
+    def push(self, title, text):
         user_key, prio = self.channel.value.split("|")
         payload = {
             "token": settings.PUSHOVER_API_TOKEN,
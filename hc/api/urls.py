@@ -7,5 +7,6 @@ urlpatterns = [
     url(r'^ping/([\w-]+)$', views.ping, name="hc-ping"),
     url(r'^api/v1/checks/$', views.checks),
     url(r'^api/v1/checks/([\w-]+)/pause$', views.pause, name="hc-api-pause"),
+    url(r'^api/v1/pings/$', views.bulk_ping, name="hc-api-pings"),
     url(r'^badge/([\w-]+)/([\w-]{8})/([\w-]+).svg$', views.badge, name="hc-badge"),
 ]
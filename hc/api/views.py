@@ -1,14 +1,16 @@
-from datetime import timedelta as td
+import uuid
+from datetime import datetime, timedelta as td
 
-from django.db.models import F
 from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
 
-from hc.api import schemas
-from hc.api.decorators import check_api_key, uuid_or_400, validate_json
-from hc.api.models import Check, Ping
+from hc.api import pings, schemas
+from hc.api.decorators import (check_api_key, make_error, uuid_or_400,
+                               validate_json)
+from hc.api.models import Check
 from hc.lib.badges import check_signature, get_badge_svg
 
 
@@ -17,33 +19,10 @@ from hc.lib.badges import check_signature, get_badge_svg
 @never_cache
 def ping(request, code):
     try:
-        check = Check.objects.get(code=code)
-    except Check.DoesNotExist:
-        return HttpResponseBadRequest()
-
-    check.n_pings = F("n_pings") + 1
-    check.last_ping = timezone.now()
-    if check.get_status() in ("new", "paused"):
-        check.status = "up"
-    # save fast status
-    if check.get_status() == "fast":
-        check.status = check.get_status()
-    check.save()
-    check.refresh_from_db()
-    # send alert for fast
-    if check.status == "fast":
-        check.send_alert()
-
-    ping = Ping(owner=check)
-    headers = request.META
-    ping.n = check.n_pings
-    remote_addr = headers.get("HTTP_X_FORWARDED_FOR", headers["REMOTE_ADDR"])
-    ping.remote_addr = remote_addr.split(",")[0]
-    ping.scheme = headers.get("HTTP_X_FORWARDED_PROTO", "http")
-    ping.method = headers["REQUEST_METHOD"]
-    # If User-Agent is longer than 200 characters, truncate it:
-    ping.ua = headers.get("HTTP_USER_AGENT", "")[:200]
-    ping.save()
+        if not pings.record(code, request.META):
+            return HttpResponseBadRequest()
+    except pings.Throttled:
+        return HttpResponse("Too Many Requests", status=429)
 
     response = HttpResponse("OK")
     response["Access-Control-Allow-Origin"] = "*"
@@ -80,6 +59,74 @@ def checks(request):
     return HttpResponse(status=405)
 
 
+@csrf_exempt
+@check_api_key
+@validate_json(schemas.pings)
+def bulk_ping(request):
+    if request.method != "POST":
+        # Method not allowed
+        return HttpResponse(status=405)
+
+    if "pings" not in request.json:
+        return make_error("pings is missing")
+
+    # One result per submitted ping, in the same order
+    now = timezone.now()
+    results, items, pending = [], [], []
+    for record in request.json["pings"]:
+        if not isinstance(record, dict) or "code" not in record:
+            return make_error("ping has no code")
+
+        result = {"code": str(record["code"])}
+        results.append(result)
+        try:
+            code = uuid.UUID(result["code"])
+        except ValueError:
+            result["error"] = "invalid code"
+            continue
+
+        ping = pings.ping_from_meta(request.META)
+        ping.method = str(record.get("method", ""))[:10]
+        ping.ua = str(record.get("ua", ""))[:200]
+        try:
+            ping.created = parse_timestamp(record.get("timestamp"), now)
+        except (TypeError, ValueError, OverflowError):
+            result["error"] = "invalid timestamp"
+            continue
+
+        items.append((code, ping))
+        pending.append(result)
+
+    recorded = pings.record_many(items, user=request.user)
+    for result, found in zip(pending, recorded):
+        if found is None:
+            result["error"] = "not found"
+        else:
+            check_id, n_pings, status = found
+            result.update(n_pings=n_pings, status=status)
+
+    return JsonResponse({"results": results})
+
+
+def parse_timestamp(value, now):
+    """ Parse a Unix timestamp or an ISO 8601 string. Missing values and
+    values from the future are replaced with `now`. """
+
+    if value is None:
+        return now
+
+    if isinstance(value, (int, float)):
+        dt = datetime.fromtimestamp(value, tz=timezone.utc)
+    else:
+        dt = parse_datetime(str(value))
+        if dt is None:
+            raise ValueError("Unknown timestamp format")
+        if timezone.is_naive(dt):
+            dt = timezone.make_aware(dt, timezone.utc)
+
+    return min(dt, now)
+
+
 @csrf_exempt
 @check_api_key
 def pause(request, code):
@@ -0,0 +1,28 @@
+"""
+ASGI config for hc project.
+It serves pings and the read-only API on an asyncio event loop, and passes
+any other request to the WSGI application. Run it with an ASGI server, e.g.:
+
+    uvicorn hc.asgi:application
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from whitenoise.django import DjangoWhiteNoise
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hc.settings")
+
+wsgi_application = get_wsgi_application()
+wsgi_application = DjangoWhiteNoise(wsgi_application)
+
+if settings.CHECK_CACHE_WARMUP:
+    from hc.api.cache import check_cache
+    check_cache.warm()
+
+from hc.api.asgi import AsgiApplication  # noqa: E402 (needs django.setup)
+
+executor = ThreadPoolExecutor(max_workers=settings.ASGI_THREADS)
+application = AsgiApplication(wsgi_application, executor)
@@ -42,3 +42,5 @@ class Command(BaseCommand):
         _process("create_check_response", lexers.JsonLexer())
         _process("pause_check_request", lexers.BashLexer())
         _process("pause_check_response", lexers.JsonLexer())
+        _process("bulk_pings_request", lexers.BashLexer())
+        _process("bulk_pings_response", lexers.JsonLexer())
@@ -1,4 +1,10 @@
-from hc.api.models import Check, Ping
+import shutil
+import tempfile
+
+from django.test.utils import override_settings
+from django.utils import timezone
+from hc.api import archive
+from hc.api.models import Check, Ping, UserAgent
 from hc.test import BaseTestCase
 
 
@@ -48,3 +54,76 @@ class LogTestCase(BaseTestCase):
         self.client.login(username="charlie@example.org", password="password")
         r = self.client.get(url)
         assert r.status_code == 403
+
+    def test_it_shows_compact_pings(self):
+        ua = UserAgent.objects.create(value="compact-agent/1.0")
+        Ping.objects.create(owner=self.check, scheme="", scheme_code=2,
+                            user_agent=ua)
+
+        self.client.login(username="alice@example.org", password="password")
+        r = self.client.get("/checks/%s/log/" % self.check.code)
+        self.assertContains(r, "compact-agent/1.0")
+        self.assertContains(r, "https")
+
+    def archive(self, numbers):
+        archive.archive_pings([{
+            "id": n, "owner__code": self.check.code, "n": n,
+            "created": timezone.now(), "scheme": "http", "scheme_code": None,
+            "method": "GET", "method_code": None, "remote_addr": None,
+            "ua": "archived-agent/%d" % n, "user_agent__value": None
+        } for n in numbers])
+
+    def test_it_pages_into_archive(self):
+        self.profile.ping_log_limit = 2
+        self.profile.save()
+
+        self.check.n_pings = 5
+        self.check.save()
+        Ping.objects.all().delete()
+        Ping.objects.create(owner=self.check, n=5, ua="live-agent")
+
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        with override_settings(PING_ARCHIVE_DIR=path):
+            self.archive(range(1, 5))
+
+            self.client.login(username="alice@example.org",
+                              password="password")
+            r = self.client.get("/checks/%s/log/" % self.check.code)
+            self.assertContains(r, "live-agent")
+            self.assertContains(r, "archived-agent/4")
+            self.assertNotContains(r, "archived-agent/3")
+            self.assertContains(r, "?before=4")
+
+            r = self.client.get("/checks/%s/log/?before=4" % self.check.code)
+            self.assertContains(r, "archived-agent/3")
+            self.assertContains(r, "archived-agent/2")
+            self.assertNotContains(r, "live-agent")
+
+    def test_it_rejects_bad_before(self):
+        self.client.login(username="alice@example.org", password="password")
+        r = self.client.get("/checks/%s/log/?before=x" % self.check.code)
+        self.assertEqual(r.status_code, 400)
+
+    def test_csv_export_works(self):
+        Ping.objects.create(owner=self.check, n=3, ua="live-agent")
+
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        with override_settings(PING_ARCHIVE_DIR=path):
+            self.archive([1, 2])
+
+            self.client.login(username="alice@example.org",
+                              password="password")
+            r = self.client.get("/checks/%s/log.csv" % self.check.code)
+            lines = b"".join(r.streaming_content).decode().splitlines()
+
+        self.assertEqual(lines[0], "n,created,scheme,method,remote_addr,ua")
+        self.assertTrue(lines[1].startswith("1,"))
+        self.assertTrue(lines[2].endswith("archived-agent/2"))
+        self.assertTrue(lines[-1].endswith("live-agent"))
+
+    def test_csv_export_checks_ownership(self):
+        self.client.login(username="charlie@example.org", password="password")
+        r = self.client.get("/checks/%s/log.csv" % self.check.code)
+        self.assertEqual(r.status_code, 403)
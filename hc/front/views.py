@@ -1,3 +1,5 @@
+import csv
+import io
 from collections import Counter
 from datetime import timedelta as td
 from itertools import tee
@@ -7,12 +9,14 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db.models import Count
-from django.http import Http404, HttpResponseBadRequest, HttpResponseForbidden
+from django.http import (Http404, HttpResponseBadRequest,
+                         HttpResponseForbidden, StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.utils.six.moves.urllib.parse import urlencode
+from hc.api import archive
 from hc.api.decorators import uuid_or_400
 from hc.api.models import DEFAULT_GRACE, DEFAULT_TIMEOUT, Channel, Check, Ping
 from hc.front.forms import (AddAfricasTalkingForm, AddChannelForm, AddWebhookForm,
@@ -207,9 +211,30 @@ def log(request, code):
         return HttpResponseForbidden()
 
     limit = request.team.ping_log_limit
-    pings = Ping.objects.filter(owner=check).order_by("-id")[:limit]
+    pings = Ping.objects.filter(owner=check).select_related("user_agent")
+
+    before = request.GET.get("before")
+    if before is not None:
+        if not before.isdigit():
+            return HttpResponseBadRequest()
+        before = int(before)
+        pings = pings.filter(n__lt=before)
+
+    # Ring storage reuses rows, so their ids aren't in ping order
+    order = "-n" if settings.PING_STORAGE == "ring" else "-id"
+    pings = pings.order_by(order)[:limit]
 
     pings = list(pings.iterator())
+    # Pruned pings may be in the archive
+    oldest = pings[-1].n if pings else (before or check.n_pings + 1)
+    if oldest and len(pings) < limit:
+        pings += archive.load_pings(check.code, oldest, limit - len(pings))
+        oldest = pings[-1].n if pings else None
+
+    next_before = None
+    if oldest and archive.has_pings(check.code, oldest):
+        next_before = oldest
+
     # oldest-to-newest order will be more convenient for adding
     # "not received" placeholders:
     pings.reverse()
@@ -245,12 +270,48 @@ def log(request, code):
         "pings": wrapped,
         "num_pings": len(pings),
         "limit": limit,
+        "next_before": next_before,
         "show_limit_notice": reached_limit and settings.USE_PAYMENTS
     }
 
     return render(request, "front/log.html", ctx)
 
 
+def csv_line(values):
+    out = io.StringIO()
+    csv.writer(out).writerow(values)
+    return out.getvalue()
+
+
+@login_required
+@uuid_or_400
+def log_csv(request, code):
+    check = get_object_or_404(Check, code=code)
+    if check.user != request.team.user:
+        return HttpResponseForbidden()
+
+    def rows():
+        yield ["n", "created", "scheme", "method", "remote_addr", "ua"]
+
+        columns = archive.read(check.code)
+        for i in range(len(columns["n"])):
+            created = archive.from_micros(columns["created"][i])
+            yield [columns["n"][i], created.isoformat(), columns["scheme"][i],
+                   columns["method"][i], columns["remote_addr"][i] or "",
+                   columns["ua"][i]]
+
+        q = Ping.objects.filter(owner=check).select_related("user_agent")
+        for ping in q.order_by("n").iterator():
+            yield [ping.n, ping.created.isoformat(), ping.get_scheme(),
+                   ping.get_method(), ping.remote_addr or "", ping.get_ua()]
+
+    response = StreamingHttpResponse((csv_line(row) for row in rows()),
+                                     content_type="text/csv")
+    response["Content-Disposition"] = \
+        'attachment; filename="%s.csv"' % check.code
+    return response
+
+
 @login_required
 def channels(request):
     if request.method == "POST":
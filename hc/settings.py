@@ -128,6 +128,95 @@ SITE_ROOT = "https://dev-gnext.herokuapp.com"
 
 PING_ENDPOINT = SITE_ROOT + "/ping/"
 PING_EMAIL_DOMAIN = HOST
+
+# How incoming pings get written to api_ping:
+# "sync"     -- each request inserts its own row
+# "buffered" -- rows are queued in process and inserted in batches of up to
+#               PING_BUFFER_SIZE rows, at least every PING_BUFFER_INTERVAL
+#               milliseconds and on shutdown, including SIGTERM when
+#               hc.wsgi is loaded in the main thread. A crash loses the
+#               queue.
+#               While the database is down, up to PING_BUFFER_LIMIT rows
+#               are kept, and the oldest ones dropped beyond that.
+# "spool"    -- like "buffered", but queued rows are also appended to the
+#               local PING_SPOOL_PATH file and replayed on next start.
+#               Each process needs its own spool path.
+PING_WRITE_MODE = "sync"
+PING_BUFFER_SIZE = 500
+PING_BUFFER_INTERVAL = 200
+PING_BUFFER_LIMIT = 100000
+PING_SPOOL_PATH = os.path.join(BASE_DIR, "ping-spool.jsonl")
+
+# Answer /ping/<uuid> requests in hc.wsgi, before Django's middleware and
+# URL resolver get involved
+PING_FAST_PATH = False
+
+# Cache of check lookups by ping code, per process. Entries expire after
+# CHECK_CACHE_TTL seconds. Set CHECK_CACHE_SIZE to 0 to disable. With
+# CHECK_CACHE_WARMUP, hc.wsgi and hc.asgi preload the most recently pinged
+# checks at startup.
+CHECK_CACHE_SIZE = 10000
+CHECK_CACHE_TTL = 60
+CHECK_CACHE_WARMUP = False
+
+# Pings for a check which arrive within PING_COALESCE_WINDOW milliseconds
+# of its last recorded ping are only counted, and added to the check in
+# one write per window. PING_RATE_LIMIT caps pings per check and second,
+# pings over it get a 429 response. 0 disables either.
+PING_COALESCE_WINDOW = 0
+PING_RATE_LIMIT = 0
+
+# Store new pings in compact form: the scheme and method as small integers
+# and the user agent as a reference to a shared UserAgent row. Run the
+# compactpings command to convert existing rows.
+PING_COMPACT = False
+
+# "log" keeps every ping until prunepings removes it. "ring" gives each
+# check as many rows as its owner's ping_log_limit, and each new ping
+# overwrites the oldest one, so api_ping stops growing.
+PING_STORAGE = "log"
+
+# Directory to copy pings to before prunepings deletes them, None to
+# not keep pruned pings. See hc.api.archive.
+PING_ARCHIVE_DIR = None
+
+# prunenotifications deletes notifications older than this many days,
+# but always keeps the newest NOTIFICATION_KEEP for each channel
+NOTIFICATION_RETENTION_DAYS = 30
+NOTIFICATION_KEEP = 100
+
+# Have the ensuretriggers command install triggers which NOTIFY
+# sendalerts --scheduler about changed checks. PostgreSQL only. Off by
+# default, as the notifications add to the cost of committing pings.
+ALERT_SCHEDULER_NOTIFY = False
+
+# When more than ALERT_DIGEST_THRESHOLD checks of one user go down within
+# ALERT_DIGEST_WINDOW seconds, sendalerts notifies each of their channels
+# once about all of them. None turns digests off. See hc.api.digest.
+ALERT_DIGEST_THRESHOLD = None
+ALERT_DIGEST_WINDOW = 300
+
+# sendalerts --outbox retries failed notifications after OUTBOX_BACKOFF
+# seconds, doubling the delay after each failure up to OUTBOX_MAX_BACKOFF,
+# and gives up on notifications older than OUTBOX_MAX_AGE seconds
+OUTBOX_BACKOFF = 10
+OUTBOX_MAX_BACKOFF = 600
+OUTBOX_MAX_AGE = 3600
+
+# After this many consecutive failed requests to a webhook host or to a
+# provider channel, notifications to it fail fast for
+# CIRCUIT_BREAKER_COOLDOWN seconds, then a single request probes it again.
+# None turns circuit breakers off. See hc.api.breaker.
+CIRCUIT_BREAKER_THRESHOLD = None
+CIRCUIT_BREAKER_COOLDOWN = 60
+
+# Length of api_ping partitions, "daily" or "weekly". Only used on
+# PostgreSQL, after converting the table with the partitionpings command.
+PING_PARTITION_INTERVAL = "weekly"
+
+# hc.asgi runs database work for pings and API requests in a thread pool
+# of this size
+ASGI_THREADS = 10
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 STATIC_ROOT = os.path.join(BASE_DIR, 'static-collected')
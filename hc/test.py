@@ -2,6 +2,7 @@ from django.contrib.auth.models import User
 from django.test import TestCase
 
 from hc.accounts.models import Member, Profile
+from hc.api.breaker import circuits
 
 
 class BaseTestCase(TestCase):
@@ -9,6 +10,9 @@ class BaseTestCase(TestCase):
     def setUp(self):
         super(BaseTestCase, self).setUp()
 
+        # Circuit breakers are per process, don't carry failures over
+        circuits.clear()
+
         # Alice is a normal user for tests. Alice has team access enabled.
         self.alice = User(username="alice", email="alice@example.org")
         self.alice.set_password("password")
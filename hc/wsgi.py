@@ -7,6 +7,7 @@ https://docs.djangoproject.com/en/1.8/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 from whitenoise.django import DjangoWhiteNoise
 
@@ -14,3 +15,17 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hc.settings")
 
 application = get_wsgi_application()
 application = DjangoWhiteNoise(application)
+
+if settings.CHECK_CACHE_WARMUP:
+    from hc.api.cache import check_cache
+    check_cache.warm()
+
+if settings.PING_WRITE_MODE != "sync":
+    # Start the ping buffer from the main thread, where it can install
+    # its SIGTERM handler
+    from hc.api.pings import get_buffer
+    get_buffer()
+
+if settings.PING_FAST_PATH:
+    from hc.api.fastpath import PingFastPath
+    application = PingFastPath(application)